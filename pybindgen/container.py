@@ -9,7 +9,7 @@ from .typehandlers.base import ForwardWrapperBase, ReverseWrapperBase, \
     TypeConfigurationError, NotSupportedError
 
 from pybindgen.typehandlers import codesink
-from pybindgen.pytypeobject import PyTypeObject
+from pybindgen.pytypeobject import PyTypeObject, PySequenceMethods, PyMappingMethods
 from .typehandlers.ctypeparser import TypeTraits
 from . import settings
 from . import utils
@@ -75,22 +75,29 @@ class IterNextWrapper(ForwardWrapperBase):
 
 
 class ContainerTraits(object):
-    def __init__(self, add_value_method, is_mapping=False):
+    def __init__(self, add_value_method, is_mapping=False, is_contiguous=False, has_swap=True,
+                 is_random_access=False, is_associative=False, has_reserve=False):
         self.add_value_method = add_value_method
         self.is_mapping = is_mapping
+        self.is_contiguous = is_contiguous # elements are stored in a single array
+        self.has_reserve = has_reserve # has a reserve() method to preallocate storage
+        self.has_swap = has_swap # has a swap() method (not in C++98 container adaptors)
+        self.is_random_access = is_random_access # has operator[], erase() and insert() with random access iterators
+        self.is_associative = is_associative # has find(), count() and erase() by key
 
 container_traits_list = {
     'list': 		ContainerTraits(add_value_method='push_back'),
-    'deque': 		ContainerTraits(add_value_method='push_back'),
-    'queue': 		ContainerTraits(add_value_method='push'),
-    'priority_queue':	ContainerTraits(add_value_method='push'),
-    'vector': 		ContainerTraits(add_value_method='push_back'),
-    'stack': 		ContainerTraits(add_value_method='push'),
-    'set': 		ContainerTraits(add_value_method='insert'),
-    'multiset': 	ContainerTraits(add_value_method='insert'),
-    'hash_set':		ContainerTraits(add_value_method='insert'),
-    'hash_multiset':	ContainerTraits(add_value_method='insert'),
-    'map':		ContainerTraits(add_value_method='insert', is_mapping=True),
+    'deque': 		ContainerTraits(add_value_method='push_back', is_random_access=True),
+    'queue': 		ContainerTraits(add_value_method='push', has_swap=False),
+    'priority_queue':	ContainerTraits(add_value_method='push', has_swap=False),
+    'vector': 		ContainerTraits(add_value_method='push_back', is_contiguous=True, is_random_access=True,
+                                        has_reserve=True),
+    'stack': 		ContainerTraits(add_value_method='push', has_swap=False),
+    'set': 		ContainerTraits(add_value_method='insert', is_associative=True),
+    'multiset': 	ContainerTraits(add_value_method='insert', is_associative=True),
+    'hash_set':		ContainerTraits(add_value_method='insert', is_associative=True),
+    'hash_multiset':	ContainerTraits(add_value_method='insert', is_associative=True),
+    'map':		ContainerTraits(add_value_method='insert', is_mapping=True, is_associative=True),
 }
 
 # from wikipedia: """Deque is sometimes written dequeue, but this use
@@ -98,6 +105,21 @@ container_traits_list = {
 # because dequeue is also a verb meaning "to remove from a queue" """.
 container_traits_list['dequeue'] = container_traits_list['deque']
 
+## element C type => (PEP 3118 format character, format characters of
+## the same kind accepted when converting from a buffer)
+buffer_formats = {
+    'double':             ('d', 'fd'),
+    'float':              ('f', 'fd'),
+    'short':              ('h', 'bhilqn'),
+    'unsigned short':     ('H', 'BHILQN'),
+    'int':                ('i', 'bhilqn'),
+    'unsigned int':       ('I', 'BHILQN'),
+    'long':               ('l', 'bhilqn'),
+    'unsigned long':      ('L', 'BHILQN'),
+    'long long':          ('q', 'bhilqn'),
+    'unsigned long long': ('Q', 'BHILQN'),
+}
+
 class Container(object):
     def __init__(self, name, value_type, container_type, outer_class=None, custom_name=None):
         """
@@ -291,12 +313,21 @@ class Container(object):
         """
 
         # container pystruct
-        code_sink.writeln('''
+        if self._get_buffer_format() is None:
+            code_sink.writeln('''
 typedef struct {
     PyObject_HEAD
     %s *obj;
 } %s;
     ''' % (self.full_name, self.pystruct))
+        else:
+            code_sink.writeln('''
+typedef struct {
+    PyObject_HEAD
+    %s *obj;
+    Py_ssize_t exports;
+} %s;
+    ''' % (self.full_name, self.pystruct))
 
         # container iterator pystruct
         code_sink.writeln('''
@@ -340,6 +371,30 @@ typedef struct {
 
     python_full_name = property(_get_python_full_name)
 
+    def write_allocate_pystruct(self, code_block, lvalue):
+        """
+        Generates code to allocate a python wrapper structure, using
+        PyObject_New, plus some additional structure initialization
+        that may be needed.
+        """
+        for line in self._get_allocate_pystruct_code(lvalue):
+            code_block.write_code(line)
+
+    def _get_allocate_pystruct_code(self, lvalue):
+        code = ["%s = PyObject_New(%s, %s);" % (lvalue, self.pystruct, '&'+self.pytypestruct)]
+        if self._get_buffer_format() is not None:
+            code.append("%s->exports = 0;" % (lvalue,))
+        return code
+
+    def _get_buffer_format(self):
+        """
+        Returns a (format, accepted_formats) tuple (see buffer_formats)
+        if the container supports the buffer protocol, else None.
+        """
+        if not self.container_traits.is_contiguous or self.key_type is not None:
+            return None
+        return buffer_formats.get(str(TypeTraits(self.value_type.ctype).ctype_no_const))
+
 
     def generate(self, code_sink, module, docstring=None):
         """Generates the class to a code sink"""
@@ -371,8 +426,311 @@ typedef struct {
         self._generate_destructor(code_sink)
         self._generate_iter_methods(code_sink)
         self._generate_container_constructor(code_sink)
+        if self._get_buffer_format() is not None:
+            self._generate_buffer_methods(code_sink)
+        self._generate_sequence_and_mapping_methods(code_sink)
         self._generate_type_structure(code_sink, docstring)
 
+    def _generate_sequence_and_mapping_methods(self, code_sink):
+        """
+        Generate the sequence and mapping protocol slots supported by
+        the container type: len() for all containers, indexing,
+        slicing and item assignment for random access containers, 'in'
+        for associative containers, and key lookup and assignment for
+        mapping containers.
+        """
+        traits = self.container_traits
+        root_module = self.module.get_root()
+        pysequencemethods = PySequenceMethods()
+        pysequencemethods.slots['variable'] = "%s__py_sequence_methods" % (self.pystruct,)
+        pymappingmethods = PyMappingMethods()
+        pymappingmethods.slots['variable'] = "%s__py_mapping_methods" % (self.pystruct,)
+
+        subst_vars = {
+            'SQ_LENGTH': "_wrap_%s__sq_length" % (self.pystruct,),
+            'SQ_ITEM': "_wrap_%s__sq_item" % (self.pystruct,),
+            'SQ_ASS_ITEM': "_wrap_%s__sq_ass_item" % (self.pystruct,),
+            'SQ_CONTAINS': "_wrap_%s__sq_contains" % (self.pystruct,),
+            'MP_SUBSCRIPT': "_wrap_%s__mp_subscript" % (self.pystruct,),
+            'MP_ASS_SUBSCRIPT': "_wrap_%s__mp_ass_subscript" % (self.pystruct,),
+            'PYSTRUCT': self.pystruct,
+            'CTYPE': self.full_name,
+            'ITEM_CTYPE': self.value_type.ctype,
+            'ADD_VALUE': traits.add_value_method,
+            'CONTAINER_CONVERTER_FUNC_NAME': self.python_to_c_converter,
+            }
+        if self._get_buffer_format() is None:
+            subst_vars['CHECK_RESIZE'] = ''
+        else:
+            subst_vars['CHECK_RESIZE'] = r'''
+        if (self->exports > 0) {
+            PyErr_SetString(PyExc_BufferError, "Existing exports of data: object cannot be re-sized");
+            return -1;
+        }'''
+
+        code_sink.writeln(r'''
+static Py_ssize_t
+%(SQ_LENGTH)s(%(PYSTRUCT)s *self)
+{
+    return (Py_ssize_t) self->obj->size();
+}
+''' % subst_vars)
+        pysequencemethods.slots['sq_length'] = subst_vars['SQ_LENGTH']
+
+        ## std::vector<bool> elements are not addressable
+        if (traits.is_random_access and self.key_type is None
+            and str(TypeTraits(self.value_type.ctype).ctype_no_const) != 'bool'):
+            subst_vars['ITEM_C2PY'] = root_module.generate_c_to_python_type_converter(self.value_type, code_sink)
+            subst_vars['ITEM_CONVERTER'] = root_module.generate_python_to_c_type_converter(self.value_type, code_sink)
+            subst_vars['ALLOCATE_RESULT'] = '\n        '.join(self._get_allocate_pystruct_code('result'))
+            subst_vars['RESERVE'] = (traits.has_reserve and
+                                     "\n        result->obj->reserve(slicelength);" or "")
+
+            code_sink.writeln(r'''
+static PyObject*
+%(SQ_ITEM)s(%(PYSTRUCT)s *self, Py_ssize_t index)
+{
+    if (index < 0 || index >= (Py_ssize_t) self->obj->size()) {
+        PyErr_SetString(PyExc_IndexError, "index out of range");
+        return NULL;
+    }
+    return %(ITEM_C2PY)s(&(*self->obj)[index]);
+}
+
+static int
+%(SQ_ASS_ITEM)s(%(PYSTRUCT)s *self, Py_ssize_t index, PyObject *value)
+{
+    if (index < 0 || index >= (Py_ssize_t) self->obj->size()) {
+        PyErr_SetString(PyExc_IndexError, "index out of range");
+        return -1;
+    }
+    if (value == NULL) {%(CHECK_RESIZE)s
+        self->obj->erase(self->obj->begin() + index);
+        return 0;
+    }
+    if (!%(ITEM_CONVERTER)s(value, &(*self->obj)[index])) {
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject*
+%(MP_SUBSCRIPT)s(%(PYSTRUCT)s *self, PyObject *key)
+{
+    if (PyIndex_Check(key)) {
+        Py_ssize_t index = PyNumber_AsSsize_t(key, PyExc_IndexError);
+        if (index == -1 && PyErr_Occurred()) {
+            return NULL;
+        }
+        if (index < 0) {
+            index += (Py_ssize_t) self->obj->size();
+        }
+        return %(SQ_ITEM)s(self, index);
+    }
+    if (PySlice_Check(key)) {
+        Py_ssize_t start, stop, step, slicelength, i;
+        %(PYSTRUCT)s *result;
+#if PY_VERSION_HEX >= 0x03020000
+        if (PySlice_GetIndicesEx(key, (Py_ssize_t) self->obj->size(), &start, &stop, &step, &slicelength) == -1) {
+#else
+        if (PySlice_GetIndicesEx((PySliceObject *) key, (Py_ssize_t) self->obj->size(), &start, &stop, &step, &slicelength) == -1) {
+#endif
+            return NULL;
+        }
+        %(ALLOCATE_RESULT)s
+        result->obj = new %(CTYPE)s;%(RESERVE)s
+        for (i = 0; i < slicelength; i++) {
+            result->obj->%(ADD_VALUE)s((*self->obj)[start + i*step]);
+        }
+        return (PyObject *) result;
+    }
+    PyErr_Format(PyExc_TypeError, "indices must be integers or slices, not %%s", Py_TYPE(key)->tp_name);
+    return NULL;
+}
+
+static int
+%(MP_ASS_SUBSCRIPT)s(%(PYSTRUCT)s *self, PyObject *key, PyObject *value)
+{
+    if (PyIndex_Check(key)) {
+        Py_ssize_t index = PyNumber_AsSsize_t(key, PyExc_IndexError);
+        if (index == -1 && PyErr_Occurred()) {
+            return -1;
+        }
+        if (index < 0) {
+            index += (Py_ssize_t) self->obj->size();
+        }
+        return %(SQ_ASS_ITEM)s(self, index, value);
+    }
+    if (PySlice_Check(key)) {
+        Py_ssize_t start, stop, step, slicelength;
+        %(CTYPE)s values;
+#if PY_VERSION_HEX >= 0x03020000
+        if (PySlice_GetIndicesEx(key, (Py_ssize_t) self->obj->size(), &start, &stop, &step, &slicelength) == -1) {
+#else
+        if (PySlice_GetIndicesEx((PySliceObject *) key, (Py_ssize_t) self->obj->size(), &start, &stop, &step, &slicelength) == -1) {
+#endif
+            return -1;
+        }
+        if (step != 1) {
+            PyErr_SetString(PyExc_ValueError, "extended slices are not supported");
+            return -1;
+        }
+        if (value != NULL && !%(CONTAINER_CONVERTER_FUNC_NAME)s(value, &values)) {
+            return -1;
+        }
+        if ((Py_ssize_t) values.size() != slicelength) {%(CHECK_RESIZE)s
+        }
+        self->obj->erase(self->obj->begin() + start, self->obj->begin() + start + slicelength);
+        self->obj->insert(self->obj->begin() + start, values.begin(), values.end());
+        return 0;
+    }
+    PyErr_Format(PyExc_TypeError, "indices must be integers or slices, not %%s", Py_TYPE(key)->tp_name);
+    return -1;
+}
+''' % subst_vars)
+            pysequencemethods.slots['sq_item'] = subst_vars['SQ_ITEM']
+            pysequencemethods.slots['sq_ass_item'] = subst_vars['SQ_ASS_ITEM']
+            pymappingmethods.slots['mp_length'] = subst_vars['SQ_LENGTH']
+            pymappingmethods.slots['mp_subscript'] = subst_vars['MP_SUBSCRIPT']
+            pymappingmethods.slots['mp_ass_subscript'] = subst_vars['MP_ASS_SUBSCRIPT']
+
+        if traits.is_associative:
+            if self.key_type is None:
+                key_type = self.value_type
+            else:
+                key_type = self.key_type
+            subst_vars['KEY_CTYPE'] = key_type.ctype
+            subst_vars['KEY_CONVERTER'] = root_module.generate_python_to_c_type_converter(key_type, code_sink)
+
+            code_sink.writeln(r'''
+static int
+%(SQ_CONTAINS)s(%(PYSTRUCT)s *self, PyObject *key)
+{
+    %(KEY_CTYPE)s item_key;
+    if (!%(KEY_CONVERTER)s(key, &item_key)) {
+        PyErr_Clear();
+        return 0;
+    }
+    return (self->obj->count(item_key) > 0);
+}
+''' % subst_vars)
+            pysequencemethods.slots['sq_contains'] = subst_vars['SQ_CONTAINS']
+
+        if traits.is_mapping:
+            subst_vars['ITEM_C2PY'] = root_module.generate_c_to_python_type_converter(self.value_type, code_sink)
+            subst_vars['ITEM_CONVERTER'] = root_module.generate_python_to_c_type_converter(self.value_type, code_sink)
+
+            code_sink.writeln(r'''
+static PyObject*
+%(MP_SUBSCRIPT)s(%(PYSTRUCT)s *self, PyObject *key)
+{
+    %(KEY_CTYPE)s item_key;
+    %(CTYPE)s::iterator iter;
+    if (!%(KEY_CONVERTER)s(key, &item_key)) {
+        return NULL;
+    }
+    iter = self->obj->find(item_key);
+    if (iter == self->obj->end()) {
+        PyErr_SetObject(PyExc_KeyError, key);
+        return NULL;
+    }
+    return %(ITEM_C2PY)s(&iter->second);
+}
+
+static int
+%(MP_ASS_SUBSCRIPT)s(%(PYSTRUCT)s *self, PyObject *key, PyObject *value)
+{
+    %(KEY_CTYPE)s item_key;
+    %(ITEM_CTYPE)s item;
+    if (!%(KEY_CONVERTER)s(key, &item_key)) {
+        return -1;
+    }
+    if (value == NULL) {
+        if (self->obj->erase(item_key) == 0) {
+            PyErr_SetObject(PyExc_KeyError, key);
+            return -1;
+        }
+        return 0;
+    }
+    if (!%(ITEM_CONVERTER)s(value, &item)) {
+        return -1;
+    }
+    (*self->obj)[item_key] = item;
+    return 0;
+}
+''' % subst_vars)
+            pymappingmethods.slots['mp_length'] = subst_vars['SQ_LENGTH']
+            pymappingmethods.slots['mp_subscript'] = subst_vars['MP_SUBSCRIPT']
+            pymappingmethods.slots['mp_ass_subscript'] = subst_vars['MP_ASS_SUBSCRIPT']
+
+        pysequencemethods.generate(code_sink)
+        self.pytype.slots.setdefault("tp_as_sequence", "&" + pysequencemethods.slots['variable'])
+        if 'mp_subscript' in pymappingmethods.slots:
+            pymappingmethods.generate(code_sink)
+            self.pytype.slots.setdefault("tp_as_mapping", "&" + pymappingmethods.slots['variable'])
+
+    def _generate_buffer_methods(self, code_sink):
+        """Generate PEP 3118 buffer procs exposing the container storage"""
+        buffer_procs = "%s__tp_as_buffer" % (self.pystruct,)
+        subst_vars = {
+            'GETBUFFER_FUNC': "_wrap_%s__bf_getbuffer" % (self.pystruct,),
+            'RELEASEBUFFER_FUNC': "_wrap_%s__bf_releasebuffer" % (self.pystruct,),
+            'BUFFER_PROCS': buffer_procs,
+            'PYSTRUCT': self.pystruct,
+            'ITEM_CTYPE': self.value_type.ctype,
+            'FORMAT': self._get_buffer_format()[0],
+            }
+        code_sink.writeln(r'''
+static int
+%(GETBUFFER_FUNC)s(%(PYSTRUCT)s *self, Py_buffer *view, int flags)
+{
+    Py_ssize_t *shape_and_strides;
+
+    if (self->obj == NULL) {
+        PyErr_SetString(PyExc_BufferError, "container is not initialized");
+        view->obj = NULL;
+        return -1;
+    }
+    shape_and_strides = new Py_ssize_t[2];
+    shape_and_strides[0] = (Py_ssize_t) self->obj->size();
+    shape_and_strides[1] = sizeof(%(ITEM_CTYPE)s);
+    Py_INCREF(self);
+    self->exports++;
+    view->obj = (PyObject *) self;
+    /* some buffer consumers reject a NULL pointer, even with zero length */
+    view->buf = (self->obj->empty() ? (void *) self->obj : (void *) &(*self->obj)[0]);
+    view->len = shape_and_strides[0] * shape_and_strides[1];
+    view->readonly = 0;
+    view->itemsize = sizeof(%(ITEM_CTYPE)s);
+    view->format = ((flags & PyBUF_FORMAT) ? (char *) "%(FORMAT)s" : NULL);
+    view->ndim = 1;
+    view->shape = ((flags & PyBUF_ND) ? shape_and_strides : NULL);
+    view->strides = (((flags & PyBUF_STRIDES) == PyBUF_STRIDES) ? shape_and_strides + 1 : NULL);
+    view->suboffsets = NULL;
+    view->internal = shape_and_strides;
+    return 0;
+}
+
+static void
+%(RELEASEBUFFER_FUNC)s(%(PYSTRUCT)s *self, Py_buffer *view)
+{
+    self->exports--;
+    delete[] (Py_ssize_t *) view->internal;
+}
+
+static PyBufferProcs %(BUFFER_PROCS)s = {
+#if PY_VERSION_HEX < 0x03000000
+    NULL,
+    NULL,
+    NULL,
+    NULL,
+#endif
+    (getbufferproc) %(GETBUFFER_FUNC)s,
+    (releasebufferproc) %(RELEASEBUFFER_FUNC)s
+};
+''' % subst_vars)
+        self.pytype.slots.setdefault("tp_as_buffer", "&" + buffer_procs)
+
     def _generate_type_structure(self, code_sink, docstring):
         """generate the type structure"""
 
@@ -520,6 +878,7 @@ static PyObject*
             'FUNC': container_tp_init_function_name,
             'PYSTRUCT': self.pystruct,
             'PYTYPESTRUCT': self.pytypestruct,
+            'TYPE_CHECK': utils.get_type_check('arg', '&' + self.pytypestruct),
             'CTYPE': self.full_name,
             'ITEM_CONVERTER': item_python_to_c_converter,
             'PYTHON_NAME': self.python_name,
@@ -527,29 +886,110 @@ static PyObject*
             'CONTAINER_CONVERTER_FUNC_NAME': this_type_converter,
             'ADD_VALUE': self.container_traits.add_value_method,
             }
+        if self.container_traits.has_reserve:
+            subst_vars['RESERVE'] = "\n        container->reserve(size);"
+            subst_vars['RESERVE_HINT'] = r'''
+#if PY_VERSION_HEX >= 0x03040000
+        Py_ssize_t size_hint = PyObject_LengthHint(arg, 0);
+        if (size_hint < 0) {
+            Py_DECREF(iterator);
+            return 0;
+        }
+        try {
+            container->reserve(size_hint);
+        } catch (...) {
+            /* __length_hint__ is only a hint; ignore values that cannot be reserved */
+        }
+#endif'''
+        else:
+            subst_vars['RESERVE'] = ''
+            subst_vars['RESERVE_HINT'] = ''
 
         if self.key_type is None:
 
+            buffer_format = self._get_buffer_format()
+            if buffer_format is None:
+                subst_vars['BUFFER_CONVERSION'] = ''
+            else:
+                subst_vars['ACCEPTED_FORMATS'] = buffer_format[1]
+                subst_vars['BUFFER_CONVERTER'] = this_type_converter + '_from_buffer'
+                subst_vars['BUFFER_CONVERSION'] = r'''
+    } else if (PyObject_CheckBuffer(arg) && %(BUFFER_CONVERTER)s(arg, container)) {
+        /* copied from a buffer of matching items */''' % subst_vars
+
+                ## buffers of other item types or layouts are not an
+                ## error: they are converted item by item below
+                code_sink.writeln(r'''
+static int
+%(BUFFER_CONVERTER)s(PyObject *arg, %(CTYPE)s *container)
+{
+    Py_buffer view;
+    const char *format;
+    if (PyObject_GetBuffer(arg, &view, PyBUF_C_CONTIGUOUS|PyBUF_FORMAT) == -1) {
+        PyErr_Clear();
+        return 0;
+    }
+    format = (view.format == NULL ? "B" : view.format);
+    if (*format == '@' || *format == '=') {
+        format++;
+    }
+    if (view.itemsize != sizeof(%(ITEM_CTYPE)s) || format[0] == '\0' || format[1] != '\0'
+        || strchr("%(ACCEPTED_FORMATS)s", format[0]) == NULL) {
+        PyBuffer_Release(&view);
+        return 0;
+    }
+    container->resize(view.len / sizeof(%(ITEM_CTYPE)s));
+    if (view.len > 0) {
+        memcpy(&(*container)[0], view.buf, view.len);
+    }
+    PyBuffer_Release(&view);
+    return 1;
+}
+''' % subst_vars)
+
             # generate mapping converter function
 
             code_sink.writeln(r'''
 int %(CONTAINER_CONVERTER_FUNC_NAME)s(PyObject *arg, %(CTYPE)s *container)
 {
-    if (PyObject_IsInstance(arg, (PyObject*) &%(PYTYPESTRUCT)s)) {
-        *container = *((%(PYSTRUCT)s*)arg)->obj;
-    } else if (PyList_Check(arg)) {
-        container->clear();
-        Py_ssize_t size = PyList_Size(arg);
+    if (%(TYPE_CHECK)s) {
+        *container = *((%(PYSTRUCT)s*)arg)->obj;%(BUFFER_CONVERSION)s
+    } else if (PyList_Check(arg) || PyTuple_Check(arg)) {
+        Py_ssize_t size = PySequence_Fast_GET_SIZE(arg);
+        PyObject **items = PySequence_Fast_ITEMS(arg);
+        container->clear();%(RESERVE)s
         for (Py_ssize_t i = 0; i < size; i++) {
             %(ITEM_CTYPE)s item;
-            if (!%(ITEM_CONVERTER)s(PyList_GET_ITEM(arg, i), &item)) {
+            if (!%(ITEM_CONVERTER)s(items[i], &item)) {
                 return 0;
             }
             container->%(ADD_VALUE)s(item);
         }
-    } else {
-        PyErr_SetString(PyExc_TypeError, "parameter must be None, a %(PYTHON_NAME)s instance, or a list of %(ITEM_CTYPE)s");
+    } else if (PyUnicode_Check(arg) || PyBytes_Check(arg)) {
+        PyErr_SetString(PyExc_TypeError, "parameter must be None, a %(PYTHON_NAME)s instance, or an iterable of %(ITEM_CTYPE)s, not a string");
         return 0;
+    } else {
+        PyObject *iterator = PyObject_GetIter(arg);
+        PyObject *py_item;
+        if (iterator == NULL) {
+            PyErr_SetString(PyExc_TypeError, "parameter must be None, a %(PYTHON_NAME)s instance, or an iterable of %(ITEM_CTYPE)s");
+            return 0;
+        }
+        container->clear();%(RESERVE_HINT)s
+        while ((py_item = PyIter_Next(iterator)) != NULL) {
+            %(ITEM_CTYPE)s item;
+            int converted = %(ITEM_CONVERTER)s(py_item, &item);
+            Py_DECREF(py_item);
+            if (!converted) {
+                Py_DECREF(iterator);
+                return 0;
+            }
+            container->%(ADD_VALUE)s(item);
+        }
+        Py_DECREF(iterator);
+        if (PyErr_Occurred()) {
+            return 0;
+        }
     }
     return 1;
 }
@@ -567,13 +1007,28 @@ int %(CONTAINER_CONVERTER_FUNC_NAME)s(PyObject *arg, %(CTYPE)s *container)
             code_sink.writeln(r'''
 int %(CONTAINER_CONVERTER_FUNC_NAME)s(PyObject *arg, %(CTYPE)s *container)
 {
-    if (PyObject_IsInstance(arg, (PyObject*) &%(PYTYPESTRUCT)s)) {
+    if (%(TYPE_CHECK)s) {
         *container = *((%(PYSTRUCT)s*)arg)->obj;
-    } else if (PyList_Check(arg)) {
+    } else if (PyDict_Check(arg)) {
+        Py_ssize_t pos = 0;
+        PyObject *py_key, *py_value;
+        container->clear();
+        while (PyDict_Next(arg, &pos, &py_key, &py_value)) {
+            std::pair< %(KEY_CTYPE)s, %(ITEM_CTYPE)s > item;
+            if (!%(KEY_CONVERTER)s(py_key, &item.first)) {
+                return 0;
+            }
+            if (!%(ITEM_CONVERTER)s(py_value, &item.second)) {
+                return 0;
+            }
+            container->%(ADD_VALUE)s(item);
+        }
+    } else if (PyList_Check(arg) || PyTuple_Check(arg)) {
+        Py_ssize_t size = PySequence_Fast_GET_SIZE(arg);
+        PyObject **items = PySequence_Fast_ITEMS(arg);
         container->clear();
-        Py_ssize_t size = PyList_Size(arg);
         for (Py_ssize_t i = 0; i < size; i++) {
-            PyObject *tup = PyList_GET_ITEM(arg, i);
+            PyObject *tup = items[i];
             if (!PyTuple_Check(tup) || PyTuple_Size(tup) != 2) {
                 PyErr_SetString(PyExc_TypeError, "items must be tuples with two elements");
                 return 0;
@@ -588,8 +1043,34 @@ int %(CONTAINER_CONVERTER_FUNC_NAME)s(PyObject *arg, %(CTYPE)s *container)
             container->%(ADD_VALUE)s(item);
         }
     } else {
-        PyErr_SetString(PyExc_TypeError, "parameter must be None, a %(PYTHON_NAME)s instance, or a list of %(ITEM_CTYPE)s");
-        return 0;
+        PyObject *iterator = PyObject_GetIter(arg);
+        PyObject *tup;
+        if (iterator == NULL) {
+            PyErr_SetString(PyExc_TypeError, "parameter must be None, a %(PYTHON_NAME)s instance, or an iterable of (%(KEY_CTYPE)s, %(ITEM_CTYPE)s) tuples");
+            return 0;
+        }
+        container->clear();
+        while ((tup = PyIter_Next(iterator)) != NULL) {
+            std::pair< %(KEY_CTYPE)s, %(ITEM_CTYPE)s > item;
+            if (!PyTuple_Check(tup) || PyTuple_Size(tup) != 2) {
+                PyErr_SetString(PyExc_TypeError, "items must be tuples with two elements");
+                Py_DECREF(tup);
+                Py_DECREF(iterator);
+                return 0;
+            }
+            if (!%(KEY_CONVERTER)s(PyTuple_GET_ITEM(tup, 0), &item.first)
+                || !%(ITEM_CONVERTER)s(PyTuple_GET_ITEM(tup, 1), &item.second)) {
+                Py_DECREF(tup);
+                Py_DECREF(iterator);
+                return 0;
+            }
+            Py_DECREF(tup);
+            container->%(ADD_VALUE)s(item);
+        }
+        Py_DECREF(iterator);
+        if (PyErr_Occurred()) {
+            return 0;
+        }
     }
     return 1;
 }
@@ -691,9 +1172,7 @@ class ContainerParameter(ContainerParameterBase):
 
         self.py_name = wrapper.declarations.declare_variable(
             self.container_type.pystruct+'*', 'py_'+self.container_type.name)
-        wrapper.before_call.write_code(
-            "%s = PyObject_New(%s, %s);" %
-            (self.py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
+        self.container_type.write_allocate_pystruct(wrapper.before_call, self.py_name)
 
         wrapper.before_call.write_code("%s->obj = new %s(%s);" % (self.py_name, self.container_type.full_name, self.value))
 
@@ -726,9 +1205,7 @@ class ContainerRefParameter(ContainerParameterBase):
         if self.direction & Parameter.DIRECTION_OUT:
             py_name = wrapper.declarations.declare_variable(
                 self.container_type.pystruct+'*', 'py_'+self.container_type.name)
-            wrapper.after_call.write_code(
-                "%s = PyObject_New(%s, %s);" %
-                (py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
+            self.container_type.write_allocate_pystruct(wrapper.after_call, py_name)
             wrapper.after_call.write_code("%s->obj = new %s(%s);" % (py_name, self.container_type.full_name, container_tmp_var))
             wrapper.build_params.add_parameter("N", [py_name])
 
@@ -738,9 +1215,7 @@ class ContainerRefParameter(ContainerParameterBase):
 
         self.py_name = wrapper.declarations.declare_variable(
             self.container_type.pystruct+'*', 'py_'+self.container_type.name)
-        wrapper.before_call.write_code(
-            "%s = PyObject_New(%s, %s);" %
-            (self.py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
+        self.container_type.write_allocate_pystruct(wrapper.before_call, self.py_name)
 
         if self.direction & Parameter.DIRECTION_IN:
             wrapper.before_call.write_code("%s->obj = new %s(%s);" % (self.py_name, self.container_type.full_name, self.name))
@@ -798,9 +1273,7 @@ class ContainerPtrParameter(ContainerParameterBase):
             py_name = wrapper.declarations.declare_variable(
                 self.container_type.pystruct+'*', 'py_'+self.container_type.name)
 
-            wrapper.after_call.write_code(
-                "%s = PyObject_New(%s, %s);" %
-                (py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
+            self.container_type.write_allocate_pystruct(wrapper.after_call, py_name)
 
             wrapper.after_call.write_code("%s->obj = %s;" % (py_name, container_tmp_var))
 
@@ -853,10 +1326,13 @@ class ContainerReturnValue(ContainerReturnValueBase):
 
         self.py_name = py_name
 
-        wrapper.after_call.write_code(
-            "%s = PyObject_New(%s, %s);" %
-            (py_name, self.container_type.pystruct, '&'+self.container_type.pytypestruct))
-        wrapper.after_call.write_code("%s->obj = new %s(%s);" % (self.py_name, self.container_type.full_name, self.value))
+        self.container_type.write_allocate_pystruct(wrapper.after_call, py_name)
+        if self.container_type.container_traits.has_swap and self.value == retval:
+            ## retval is a local copy: take its contents instead of copying them
+            wrapper.after_call.write_code("%s->obj = new %s;" % (self.py_name, self.container_type.full_name))
+            wrapper.after_call.write_code("%s->obj->swap(%s);" % (self.py_name, self.value))
+        else:
+            wrapper.after_call.write_code("%s->obj = new %s(%s);" % (self.py_name, self.container_type.full_name, self.value))
         wrapper.build_params.add_parameter("N", [py_name], prepend=True)
 
     def convert_python_to_c(self, wrapper):
@@ -40,11 +40,6 @@ class PythonToCConverter(ReverseWrapperBase):
         code_sink -- a CodeSink instance that will receive the generated code
         """
         
-        self.declarations.declare_variable('PyObject*', 'py_retval')
-        self.before_call.write_code(
-            'py_retval = Py_BuildValue((char *) "(O)", value);')
-        self.before_call.add_cleanup_code('Py_DECREF(py_retval);')
-
         save_return_value_value = self.return_value.value
         save_return_value_REQUIRES_ASSIGNMENT_CONSTRUCTOR = self.return_value.REQUIRES_ASSIGNMENT_CONSTRUCTOR
         self.return_value.value = "*address"
@@ -55,13 +50,7 @@ class PythonToCConverter(ReverseWrapperBase):
             self.return_value.value = save_return_value_value
             self.return_value.REQUIRES_ASSIGNMENT_CONSTRUCTOR = save_return_value_REQUIRES_ASSIGNMENT_CONSTRUCTOR
 
-        parse_tuple_params = ['py_retval']
-        params = self.parse_params.get_parameters()
-        assert params[0][0] == '"'
-        params[0] = '(char *) ' + params[0]
-        parse_tuple_params.extend(params)
-        self.before_call.write_error_check('!PyArg_ParseTuple(%s)' %
-                                           (', '.join(parse_tuple_params),))
+        self._write_parse_value()
 
         ## cleanup and return
         self.after_call.write_cleanup()
@@ -117,16 +106,7 @@ class CToPythonConverter(ForwardWrapperBase):
         code_sink.indent()
 
 
-        params = self.build_params.get_parameters()
-        if params:
-            if params == ['""']:
-                self.after_call.write_code('Py_INCREF(Py_None);')
-                self.after_call.write_code('py_retval = Py_None;')
-            else:
-                assert params[0][0] == '"'
-                params[0] = "(char *) " + params[0]
-                self.after_call.write_code('py_retval = Py_BuildValue(%s);' %
-                                           (', '.join(params),))
+        self._write_build_value()
 
         ## cleanup and return
         self.after_call.write_cleanup()
@@ -140,5 +120,8 @@ class CToPythonConverter(ForwardWrapperBase):
         code_sink.unindent()
         code_sink.writeln("}")
 
+    def _write_build_value(self):
+        self._write_single_build_value()
+
     def get_prototype(self):
         return "PyObject* %s(%s *cvalue)" % (self.c_function_name, self.return_value.ctype)
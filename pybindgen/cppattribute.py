@@ -26,6 +26,10 @@ class PyGetter(ForwardWrapperBase):
         """(not actually called)"""
         raise AssertionError
 
+    def _write_build_value(self):
+        self._write_single_build_value()
+
+
 class PySetter(ReverseWrapperBase):
     """generates a setter, for use in a PyGetSetDef table"""
     NO_GIL_LOCKING = True
@@ -36,6 +40,16 @@ class PySetter(ReverseWrapperBase):
         """(not actually called)"""
         raise AssertionError
 
+    def _write_parse_value(self):
+        """
+        Writes the code (into self.before_call) that rejects deleting
+        the attribute and converts the new 'value' python object.
+        """
+        self.before_call.write_error_check(
+            'value == NULL',
+            'PyErr_SetString(PyExc_TypeError, "cannot delete the attribute");')
+        super(PySetter, self)._write_parse_value()
+
 
 class CppInstanceAttributeGetter(PyGetter):
     '''
@@ -142,11 +156,6 @@ class CppInstanceAttributeSetter(PySetter):
         :param code_sink: a CodeSink instance that will receive the generated code
         """
 
-        self.declarations.declare_variable('PyObject*', 'py_retval')
-        self.before_call.write_code(
-            'py_retval = Py_BuildValue((char *) "(O)", value);')
-        self.before_call.add_cleanup_code('Py_DECREF(py_retval);')
-
         if self.setter is not None:
             ## if we have a setter method, redirect the value to a temporary variable
             if not self.return_value.REQUIRES_ASSIGNMENT_CONSTRUCTOR:
@@ -160,14 +169,7 @@ class CppInstanceAttributeSetter(PySetter):
             self.return_value.REQUIRES_ASSIGNMENT_CONSTRUCTOR = False
 
         self.return_value.convert_python_to_c(self)
-
-        parse_tuple_params = ['py_retval']
-        params = self.parse_params.get_parameters()
-        assert params[0][0] == '"'
-        params[0] = '(char *) ' + params[0]
-        parse_tuple_params.extend(params)
-        self.before_call.write_error_check('!PyArg_ParseTuple(%s)' %
-                                           (', '.join(parse_tuple_params),))
+        self._write_parse_value()
 
         if self.setter is not None:
             ## if we have a setter method, now is the time to call it
@@ -216,18 +218,8 @@ class CppStaticAttributeSetter(PySetter):
         :param code_sink: a CodeSink instance that will receive the generated code
         """
 
-        self.declarations.declare_variable('PyObject*', 'py_retval')
-        self.before_call.write_code(
-            'py_retval = Py_BuildValue((char *) "(O)", value);')
-        self.before_call.add_cleanup_code('Py_DECREF(py_retval);')
         self.return_value.convert_python_to_c(self)
-        parse_tuple_params = ['py_retval']
-        params = self.parse_params.get_parameters()
-        assert params[0][0] == '"'
-        params[0] = '(char *) ' + params[0]
-        parse_tuple_params.extend(params)
-        self.before_call.write_error_check('!PyArg_ParseTuple(%s)' %
-                                           (', '.join(parse_tuple_params),))
+        self._write_parse_value()
         ## cleanup and return
         self.after_call.write_cleanup()
         self.after_call.write_code('return 0;')
@@ -248,6 +240,119 @@ class CppStaticAttributeSetter(PySetter):
         code_sink.writeln('}')
 
 
+MEMBER_OFFSET_TYPES = {
+    'double': ('PyFloat_FromDouble', 'double', 'PyFloat_AsDouble', None, None),
+    'float': ('PyFloat_FromDouble', 'double', 'PyFloat_AsDouble', None, None),
+    'bool': ('PyBool_FromLong', 'int', 'PyObject_IsTrue', None, None),
+    'signed char': ('PyLong_FromLong', 'long', 'PyLong_AsLong', 'SCHAR_MIN', 'SCHAR_MAX'),
+    'short': ('PyLong_FromLong', 'long', 'PyLong_AsLong', 'SHRT_MIN', 'SHRT_MAX'),
+    'int': ('PyLong_FromLong', 'long', 'PyLong_AsLong', 'INT_MIN', 'INT_MAX'),
+    'long': ('PyLong_FromLong', 'long', 'PyLong_AsLong', None, None),
+    'long long': ('PyLong_FromLongLong', 'PY_LONG_LONG', 'PyLong_AsLongLong', None, None),
+    'unsigned char': ('PyLong_FromUnsignedLong', 'unsigned long', 'PyLong_AsUnsignedLong', None, 'UCHAR_MAX'),
+    'unsigned short': ('PyLong_FromUnsignedLong', 'unsigned long', 'PyLong_AsUnsignedLong', None, 'USHRT_MAX'),
+    'unsigned int': ('PyLong_FromUnsignedLong', 'unsigned long', 'PyLong_AsUnsignedLong', None, 'UINT_MAX'),
+    'unsigned long': ('PyLong_FromUnsignedLong', 'unsigned long', 'PyLong_AsUnsignedLong', None, None),
+    'unsigned long long': ('PyLong_FromUnsignedLongLong', 'unsigned PY_LONG_LONG',
+                           'PyLong_AsUnsignedLongLong', None, None),
+}
+"""
+C types of the data members that can be accessed by offset (see
+CppClass offset_accessors), mapped to (function converting to python,
+temporary C type, function converting from python, minimum value,
+maximum value).
+"""
+
+
+class CppMemberOffsetGetter(object):
+    '''
+    A getter shared by all the C scalar instance attributes of the
+    same type of a class.  The getset closure is the offset of the
+    data member inside the C++ object.
+    '''
+    def __init__(self, class_, ctype):
+        """
+        :param class_: the class (CppClass object)
+        :param ctype: C type of the data members (a MEMBER_OFFSET_TYPES key)
+        """
+        self.class_ = class_
+        self.ctype = ctype
+        self.c_function_name = "_wrap_%s__get_%s_member" % (self.class_.pystruct,
+                                                            utils.mangle_name(ctype))
+
+    def generate(self, code_sink):
+        """
+        :param code_sink: a CodeSink instance that will receive the generated code
+        """
+        to_python = MEMBER_OFFSET_TYPES[self.ctype][0]
+        code_sink.writeln("static PyObject* %s(%s *self, void *closure)"
+                          % (self.c_function_name, self.class_.pystruct))
+        code_sink.writeln('{')
+        code_sink.indent()
+        code_sink.writeln("return %s(*(%s *) ((char *) &*self->obj + (size_t) closure));"
+                          % (to_python, self.ctype))
+        code_sink.unindent()
+        code_sink.writeln('}')
+
+
+class CppMemberOffsetSetter(object):
+    '''
+    A setter shared by all the C scalar instance attributes of the
+    same type of a class.  The getset closure is the offset of the
+    data member inside the C++ object.
+    '''
+    def __init__(self, class_, ctype):
+        """
+        :param class_: the class (CppClass object)
+        :param ctype: C type of the data members (a MEMBER_OFFSET_TYPES key)
+        """
+        self.class_ = class_
+        self.ctype = ctype
+        self.c_function_name = "_wrap_%s__set_%s_member" % (self.class_.pystruct,
+                                                            utils.mangle_name(ctype))
+
+    def generate(self, code_sink):
+        """
+        :param code_sink: a CodeSink instance that will receive the generated code
+        """
+        dummy, tmp_type, from_python, min_value, max_value = MEMBER_OFFSET_TYPES[self.ctype]
+        code_sink.writeln("static int %s(%s *self, PyObject *value, void *closure)"
+                          % (self.c_function_name, self.class_.pystruct))
+        code_sink.writeln('{')
+        code_sink.indent()
+        code_sink.writeln("%s tmp_value;" % tmp_type)
+        code_sink.writeln()
+        code_sink.writeln("if (value == NULL) {")
+        code_sink.writeln('    PyErr_SetString(PyExc_TypeError, "cannot delete the attribute");')
+        code_sink.writeln("    return -1;")
+        code_sink.writeln("}")
+        if from_python.startswith('PyLong_'):
+            code_sink.writeln("if (PyFloat_Check(value)) {")
+            code_sink.writeln('    PyErr_SetString(PyExc_TypeError, "integer argument expected, got float");')
+            code_sink.writeln("    return -1;")
+            code_sink.writeln("}")
+        code_sink.writeln("if ((tmp_value = %s(value)) == (%s) -1 && PyErr_Occurred()) {"
+                          % (from_python, tmp_type))
+        code_sink.writeln("    return -1;")
+        code_sink.writeln("}")
+        range_checks = []
+        if min_value is not None:
+            range_checks.append("tmp_value < %s" % min_value)
+        if max_value is not None:
+            range_checks.append("tmp_value > %s" % max_value)
+        if range_checks:
+            code_sink.writeln("if (%s) {" % ' || '.join(range_checks))
+            code_sink.writeln('    PyErr_SetString(PyExc_OverflowError, "value is out of range for %s");'
+                              % self.ctype)
+            code_sink.writeln("    return -1;")
+            code_sink.writeln("}")
+        code_sink.writeln("*(%s *) ((char *) &*self->obj + (size_t) closure) = (%s) tmp_value;"
+                          % (self.ctype, self.ctype))
+        code_sink.writeln("return 0;")
+        code_sink.unindent()
+        code_sink.writeln('}')
+
+
 class PyMetaclass(object):
     """
     Class that generates a Python metaclass
@@ -275,6 +380,22 @@ class PyMetaclass(object):
         """
         Generate the metaclass to code_sink and register it in the module.
         """
+        ## PyType tp_setattro is too restrictive, and
+        ## PyObject_GenericSetAttr does not invalidate the type
+        ## attribute caches (CPython's own method cache and the virtual
+        ## method override caches of helper classes), so do it here.
+        code_sink.writeln('''
+static int
+%(pytypestruct)s__tp_setattro(PyObject *type, PyObject *name, PyObject *value)
+{
+    if (PyObject_GenericSetAttr(type, name, value) < 0) {
+        return -1;
+    }
+    PyType_Modified((PyTypeObject *) type);
+    return 0;
+}
+''' % dict(pytypestruct=self.pytypestruct))
+
         code_sink.writeln('''
 PyTypeObject %(pytypestruct)s = {
         PyVarObject_HEAD_INIT(NULL, 0)
@@ -294,7 +415,7 @@ PyTypeObject %(pytypestruct)s = {
 	0,					/* tp_call */
 	0,					/* tp_str */
 	0,					/* tp_getattro */
-	0,					/* tp_setattro */
+	%(pytypestruct)s__tp_setattro,		/* tp_setattro */
 	0,					/* tp_as_buffer */
 	Py_TPFLAGS_DEFAULT|Py_TPFLAGS_HAVE_GC|Py_TPFLAGS_BASETYPE, /* tp_flags */
  	0,					/* tp_doc */
@@ -333,8 +454,6 @@ PyTypeObject %(pytypestruct)s = {
 %(pytypestruct)s.tp_traverse = %(parent_metaclass)s->tp_traverse;
 %(pytypestruct)s.tp_clear = %(parent_metaclass)s->tp_clear;
 %(pytypestruct)s.tp_is_gc = %(parent_metaclass)s->tp_is_gc;
-/* PyType tp_setattro is too restrictive */
-%(pytypestruct)s.tp_setattro = PyObject_GenericSetAttr;
 PyType_Ready(&%(pytypestruct)s);
 """ % dict(pytypestruct=self.pytypestruct, parent_metaclass=self.parent_metaclass_expr))
         
@@ -349,21 +468,23 @@ class PyGetSetDef(object):
         :param cname: C name of the getset table
         """
         self.cname = cname
-        self.attributes = [] # (name, getter, setter)
+        self.attributes = [] # (name, getter, setter, closure)
 
     def empty(self):
         return len(self.attributes) == 0
 
-    def add_attribute(self, name, getter, setter):
+    def add_attribute(self, name, getter, setter, closure=None):
         """
         Add a new attribute
         :param name: attribute name
-        :param getter: a PyGetter object, or None
-        :param setter: a PySetter object, or None
+        :param getter: a PyGetter (or CppMemberOffsetGetter) object, or None
+        :param setter: a PySetter (or CppMemberOffsetSetter) object, or None
+        :param closure: None, or C expression of the additional data
+                        passed to the getter and setter
         """
-        assert getter is None or isinstance(getter, PyGetter)
-        assert setter is None or isinstance(setter, PySetter)
-        self.attributes.append((name, getter, setter))
+        assert getter is None or isinstance(getter, (PyGetter, CppMemberOffsetGetter))
+        assert setter is None or isinstance(setter, (PySetter, CppMemberOffsetSetter))
+        self.attributes.append((name, getter, setter, closure))
 
     def generate(self, code_sink):
         """
@@ -373,11 +494,15 @@ class PyGetSetDef(object):
         if not self.attributes:
             return '0'
 
-        getsets = {} # attrname -> (getter, setter)
-        for name, getter, setter in self.attributes:
+        getsets = {} # attrname -> (getter, setter, closure)
+        generated = {} # getter/setter object -> C function name
+        for name, getter, setter, closure in self.attributes:
 
             getter_name = 'NULL'
-            if getter is not None:
+            if getter in generated:
+                ## shared getter, already generated
+                getter_name = generated[getter]
+            elif getter is not None:
                 # getter.generate(code_sink)
                 try:
                     utils.call_with_error_handling(getter.generate, (code_sink,), {}, getter)
@@ -385,9 +510,12 @@ class PyGetSetDef(object):
                     pass
                 else:
                     getter_name = getter.c_function_name
+                generated[getter] = getter_name
 
             setter_name = 'NULL'
-            if setter is not None:
+            if setter in generated:
+                setter_name = generated[setter]
+            elif setter is not None:
                 #setter.generate(code_sink)
                 try:
                     utils.call_with_error_handling(setter.generate, (code_sink,), {}, setter)
@@ -395,12 +523,13 @@ class PyGetSetDef(object):
                     pass
                 else:
                     setter_name = setter.c_function_name
+                generated[setter] = setter_name
             assert name not in getsets
-            getsets[name] = (getter_name, setter_name)
+            getsets[name] = (getter_name, setter_name, closure or 'NULL')
         
         code_sink.writeln("static PyGetSetDef %s[] = {" % self.cname)
         code_sink.indent()
-        for name, (getter_c_name, setter_c_name) in getsets.items():
+        for name, (getter_c_name, setter_c_name, closure) in getsets.items():
             code_sink.writeln('{')
             code_sink.indent()
             code_sink.writeln('(char*) "%s", /* attribute name */' % name)
@@ -416,8 +545,8 @@ class PyGetSetDef(object):
                 % setter_c_name)
 
             code_sink.writeln('NULL, /* optional doc string */')
-            code_sink.writeln('NULL /* optional additional data '
-                              'for getter and setter */')
+            code_sink.writeln('%s /* optional additional data '
+                              'for getter and setter */' % closure)
             code_sink.unindent()
             code_sink.writeln('},')
         code_sink.writeln('{ NULL, NULL, NULL, NULL, NULL }')
@@ -22,6 +22,7 @@ from pybindgen.typehandlers.codesink import NullCodeSink, MemoryCodeSink
 
 from pybindgen.cppattribute import CppInstanceAttributeGetter, CppInstanceAttributeSetter, \
     CppStaticAttributeGetter, CppStaticAttributeSetter, \
+    CppMemberOffsetGetter, CppMemberOffsetSetter, MEMBER_OFFSET_TYPES, \
     PyGetSetDef, PyMetaclass
 
 from pybindgen.pytypeobject import PyTypeObject, PyNumberMethods, PySequenceMethods
@@ -29,11 +30,11 @@ from pybindgen.cppcustomattribute import CppCustomInstanceAttributeGetter, CppCu
 
 from pybindgen import settings
 from pybindgen import utils
+from pybindgen import vectorize
 
 from pybindgen.cppclass_container import CppClassContainerTraits
 from . import function
 
-import collections
 
 try:
     set
@@ -64,6 +65,29 @@ def get_python_to_c_converter(value, root_module, code_sink):
         raise ValueError("Don't know how to convert %r" % (value,))
     return val_converter, val_name
 
+def _get_operand_class(value):
+    """
+    Returns the CppClass of a numeric operator operand that is a
+    wrapped class value or reference, else None.
+    """
+    if isinstance(value, CppClass):
+        return value
+    elif isinstance(value, (CppClassParameter, CppClassRefParameter)):
+        return value.cpp_class
+    return None
+
+## declarations of the wrapped class operands of numeric operators
+_OPERAND_BINDING_DECLARATIONS = {
+    'const_reference': "const %s &",
+    'reference': "%s &",
+    'copy': "%s ",
+    }
+
+def _check_operand_binding(operand_binding):
+    if operand_binding not in _OPERAND_BINDING_DECLARATIONS:
+        raise ValueError("invalid operand_binding %r, expected one of %r"
+                         % (operand_binding, sorted(_OPERAND_BINDING_DECLARATIONS.keys())))
+
 def get_c_to_python_converter(value, root_module, code_sink):
     if isinstance(value, CppClass):
         val_converter = root_module.generate_c_to_python_type_converter(value.ThisClassReturn(value.full_name), code_sink)
@@ -274,6 +298,7 @@ class CppHelperClass(object):
         self.custom_methods = []
         self.post_generation_code = []
         self.virtual_methods = []
+        self.virtual_name_members = [] # list of (member name, python method name)
 
     def add_virtual_method(self, method):
         assert method.is_virtual
@@ -434,6 +459,7 @@ void set_pyobj(PyObject *pyobj)
 
 
             ## write the virtual proxies
+            self.virtual_name_members = []
             for virtual_proxy in self.virtual_proxies:
                 #virtual_proxy.class_ = self.class_
                 virtual_proxy.helper_class = self
@@ -455,6 +481,15 @@ void set_pyobj(PyObject *pyobj)
 
                 code_sink.writeln()
                 virtual_proxy.generate_declaration(code_sink)
+                member = (virtual_proxy.virtual_name_member, virtual_proxy.python_method_name)
+                if member not in self.virtual_name_members:
+                    self.virtual_name_members.append(member)
+
+            ## interned python method names + cached non-overriding types
+            if self.virtual_name_members:
+                code_sink.writeln()
+            for member_name, dummy in self.virtual_name_members:
+                code_sink.writeln("static PyBindGenVirtualName %s;" % member_name)
 
             for custom_declaration, dummy in self.custom_methods:
                 code_sink.writeln(custom_declaration)
@@ -469,7 +504,7 @@ void set_pyobj(PyObject *pyobj)
 
         return True
 
-    def generate(self, code_sink):
+    def generate(self, code_sink, module):
         """
         Generate the proxy class (virtual method bodies only) to a given code sink.
         returns pymethodef list of parent callers
@@ -477,6 +512,14 @@ void set_pyobj(PyObject *pyobj)
         if self.class_.import_from_module:
             return
 
+        ## the python method names are interned once, at module init time
+        for member_name, python_name in self.virtual_name_members:
+            code_sink.writeln("PyBindGenVirtualName %s::%s = {NULL, {NULL}, {0}, 0};"
+                              % (self.name, member_name))
+            module.after_init.write_code('%s::%s.name = PyString_InternFromString((char *) "%s");'
+                                         % (self.name, member_name, python_name))
+            module.after_init.write_error_check('%s::%s.name == NULL' % (self.name, member_name))
+
         ## write the parent callers (_name)
         method_defs = []
         for name, parent_caller in self.virtual_parent_callers.items():
@@ -535,7 +578,10 @@ class CppClass(object):
                  docstring=None,
                  custom_name=None,
                  import_from_module=None,
-                 destructor_visibility='public'
+                 destructor_visibility='public',
+                 freelist_size=None,
+                 inline_storage=False,
+                 offset_accessors=False
                  ):
         """
         :param name: class name
@@ -594,6 +640,39 @@ class CppClass(object):
 
         :param import_from_module: if not None, the type is imported
                     from a foreign Python module with the given name.
+
+        :param freelist_size: if not None, the maximum number of
+            deallocated python wrapper structures of this class kept
+            in a freelist, to be recycled by the next wrappers
+            allocated by the generated code (e.g. when returning
+            objects by value).  Only instances of the exact wrapper
+            type are recycled.  Not supported together with
+            allow_subclassing.  The module function
+            _freelist_stats(drain=False) returns a dict mapping class
+            names to (count, hits, misses) tuples; passing drain=True
+            also frees the cached structures and resets the counters.
+
+        :param inline_storage: if True, the python wrapper structure
+            reserves space for a value of the class, and the copies
+            made by the generated code (e.g. when returning objects by
+            value) are constructed with placement new inside the
+            wrapper itself, instead of being allocated with new.  The
+            obj pointer of the wrapper points to the embedded value.
+            Meant for small copyable classes; requires a public
+            destructor and no custom memory_policy.  The value is
+            placed at a suitably aligned address inside the reserved
+            space, whatever the alignment of the wrapper structure
+            itself; the generated code uses alignof, so it must be
+            compiled as C++11 or later.
+
+        :param offset_accessors: if True, the instance attributes
+            added with add_instance_attribute that are plain C scalar
+            data members (int, double, bool, etc., with no getter or
+            setter method) are accessed by one getter/setter pair per
+            C type, shared by all such attributes of the class and
+            given the offsetof() the member as getset closure, instead
+            of generating a getter/setter pair per attribute.  The
+            class must be a standard-layout type.
         """
         assert outer_class is None or isinstance(outer_class, CppClass)
         self.incomplete_type = incomplete_type
@@ -732,6 +811,22 @@ class CppClass(object):
         if self.destructor_visibility not in ['public', 'protected']:
             self.allow_subclassing = False
 
+        if freelist_size is not None:
+            if freelist_size <= 0:
+                raise ValueError("freelist_size must be a positive integer")
+            if self.allow_subclassing:
+                raise ValueError("freelist_size cannot be used with classes that allow subclassing")
+        self.freelist_size = freelist_size
+
+        if inline_storage:
+            if self.memory_policy is not None:
+                raise ValueError("inline_storage cannot be used with a memory_policy")
+            if is_singleton or incomplete_type or self.destructor_visibility != 'public':
+                raise ValueError("inline_storage requires a complete, non-singleton class with a public destructor")
+        self.inline_storage = inline_storage
+        self.offset_accessors = offset_accessors
+        self._offset_accessors = {} # C type -> (getter, setter)
+
         self.typeid_map_name = None
 
         if name != 'dummy':
@@ -829,7 +924,8 @@ class CppClass(object):
         self.binary_comparison_operators.add(operator)
 
     def add_binary_numeric_operator(self, operator, result_cppclass=None,
-                                    left_cppclass=None, right=None):
+                                    left_cppclass=None, right=None,
+                                    operand_binding='const_reference'):
         """
         Add support for a C++ binary numeric operator, such as +, -, \\*, or /.
 
@@ -842,12 +938,20 @@ class CppClass(object):
         :param right: the type of the right parameter. Can be a
           CppClass, Parameter, or param spec. Assumed to be this class
           if omitted
+
+        :param operand_binding: how operands of wrapped class types
+          are passed to the operator: 'const_reference' (the default)
+          binds a const reference to the wrapped object, 'reference'
+          a non-const reference, for operators declared to take
+          non-const operands (including non-const member operators),
+          and 'copy' a copy of the wrapped object
         """
         operator = utils.ascii(operator)
         if not isinstance(operator, string_types):
             raise TypeError("expected operator name as string")
         if operator not in ['+', '-', '*', '/']:
             raise ValueError("The operator %r is invalid or not yet supported by PyBindGen" % (operator,))
+        _check_operand_binding(operand_binding)
         try:
             l = self.binary_numeric_operators[operator]
         except KeyError:
@@ -870,12 +974,13 @@ class CppClass(object):
             except utils.SkipWrapper:
                 return
 
-        op = (result_cppclass, left_cppclass, right)
+        op = (result_cppclass, left_cppclass, right, operand_binding)
         if op not in l:
             l.append(op)
 
 
-    def add_inplace_numeric_operator(self, operator, right=None):
+    def add_inplace_numeric_operator(self, operator, right=None,
+                                     operand_binding='const_reference'):
         """
         Add support for a C++ inplace numeric operator, such as +=, -=, \\*=, or /=.
 
@@ -885,12 +990,24 @@ class CppClass(object):
         :param right: the type of the right parameter. Can be a
           CppClass, Parameter, or param spec. Assumed to be this class
           if omitted
+
+        :param operand_binding: how right operands of wrapped class
+          types
+          are passed to the operator: 'const_reference' (the default)
+          binds a const reference to the wrapped object, 'reference'
+          a non-const reference, for operators declared to take
+          non-const operands (including non-const member operators),
+          and 'copy' a copy of the wrapped object
+
+          The left operand is always copied, the copy being modified
+          by the operator.
         """
         operator = utils.ascii(operator)
         if not isinstance(operator, string_types):
             raise TypeError("expected operator name as string")
         if operator not in ['+=', '-=', '*=', '/=']:
             raise ValueError("The operator %r is invalid or not yet supported by PyBindGen" % (operator,))
+        _check_operand_binding(operand_binding)
         try:
             l = self.inplace_numeric_operators[operator]
         except KeyError:
@@ -905,10 +1022,12 @@ class CppClass(object):
                 right = utils.eval_param(right, None)
             except utils.SkipWrapper:
                 return
-        if right not in l:
-            l.append((self, self, right))
+        op = (self, self, right, operand_binding)
+        if op not in l:
+            l.append(op)
 
-    def add_unary_numeric_operator(self, operator, result_cppclass=None, left_cppclass=None):
+    def add_unary_numeric_operator(self, operator, result_cppclass=None, left_cppclass=None,
+                                   operand_binding='const_reference'):
         """
         Add support for a C++ unary numeric operators, currently only -.
 
@@ -917,12 +1036,20 @@ class CppClass(object):
 
         :param result_cppclass: the CppClass object of the result type, assumed to be this class if omitted
         :param left_cppclass: the CppClass object of the left operand type, assumed to be this class if omitted
+
+        :param operand_binding: how the operand, if of a wrapped class type,
+          are passed to the operator: 'const_reference' (the default)
+          binds a const reference to the wrapped object, 'reference'
+          a non-const reference, for operators declared to take a
+          non-const operand (including non-const member operators),
+          and 'copy' a copy of the wrapped object
         """
         operator = utils.ascii(operator)
         if not isinstance(operator, string_types):
             raise TypeError("expected operator name as string")
         if operator not in ['-']:
             raise ValueError("The operator %r is invalid or not yet supported by PyBindGen" % (operator,))
+        _check_operand_binding(operand_binding)
         try:
             l = self.unary_numeric_operators[operator]
         except KeyError:
@@ -932,7 +1059,7 @@ class CppClass(object):
             result_cppclass = self
         if left_cppclass is None:
             left_cppclass = self
-        op = (result_cppclass, left_cppclass)
+        op = (result_cppclass, left_cppclass, operand_binding)
         if op not in l:
             l.append(op)
 
@@ -1036,7 +1163,7 @@ class CppClass(object):
         all subclasses.  The hook function is called like this::
           hook_function(helper_class)
         """
-        if not isinstance(hook, collections.Callable):
+        if not callable(hook):
             raise TypeError("hook function must be callable")
         self.helper_class_hooks.append(hook)
         
@@ -1104,6 +1231,69 @@ class CppClass(object):
         return self._pystruct
     pystruct = property(get_pystruct)
 
+    def get_freelist_name(self):
+        """Name of the freelist global variable, or None if the class has no freelist"""
+        if self.freelist_size is None:
+            return None
+        return "%s__freelist" % self.pystruct
+    freelist_name = property(get_freelist_name)
+
+    def write_create_owned_instance(self, code_block, py_name, parameters):
+        """
+        Generates code to create a new C++ instance, owned by the
+        python wrapper py_name, and store it in py_name->obj.  With
+        inline_storage the instance is constructed inside the wrapper
+        structure, else write_create_instance is used.
+        """
+        if self.inline_storage and self.get_instance_creation_function() is default_instance_creation_function:
+            code_block.write_code("%s->obj = new (%s) %s(%s);"
+                                  % (py_name, self.get_inline_storage_address(py_name),
+                                     self.full_name, parameters))
+        else:
+            self.write_create_instance(code_block, "%s->obj" % py_name, parameters)
+
+    def _get_inline_storage_member(self):
+        """(internal) pystruct member holding the inline value, or ''"""
+        if not self.inline_storage:
+            return ''
+        ## the python allocator does not honour the alignment of
+        ## over-aligned types, so enough space is reserved to align
+        ## the value by hand (see get_inline_storage_address)
+        return ('''
+    struct {
+        unsigned char data[sizeof(%s) + alignof(%s) - 1];
+    } obj_storage;''' % (self.full_name, self.full_name))
+
+    def get_inline_storage_address(self, py_name):
+        """
+        Returns a C++ expression of the address, suitably aligned, of
+        the value stored inline in the wrapper py_name.
+        """
+        assert self.inline_storage
+        return ("((%s *) (((Py_uintptr_t) %s->obj_storage.data + alignof(%s) - 1)"
+                " & ~((Py_uintptr_t) alignof(%s) - 1)))"
+                % (self.full_name, py_name, self.full_name, self.full_name))
+
+    def write_relocate_inline_instance(self, code_block, py_name):
+        """
+        Generates code that moves an instance stored inline in the
+        wrapper py_name to the heap, before its ownership is
+        transferred to C++ code that may later delete it.
+        """
+        if not self.inline_storage:
+            return
+        code_block.write_code("if (%s && (PyObject *) %s != Py_None && %s->obj == %s) {"
+                              % (py_name, py_name, py_name, self.get_inline_storage_address(py_name)))
+        code_block.indent()
+        code_block.write_code("typedef %s obj_type;" % self.full_name)
+        code_block.write_code("obj_type *inline_obj = %s->obj;" % py_name)
+        self.wrapper_registry.write_unregister_wrapper(code_block, py_name, 'inline_obj')
+        code_block.write_code("%s->obj = new obj_type(*inline_obj);" % py_name)
+        code_block.write_code("inline_obj->~obj_type();")
+        self.wrapper_registry.write_register_new_wrapper(code_block, py_name, '%s->obj' % py_name)
+        code_block.unindent()
+        code_block.write_code("}")
+
     def get_construct_name(self):
         """Get a name usable for new %s construction, or raise
         CodeGenerationError if none found"""
@@ -1254,6 +1444,8 @@ class CppClass(object):
         """Set the Module object this class belongs to"""
         self._module = module
         self._update_names()
+        if self.inline_storage:
+            module.get_root().add_include('<new>')
 
     module = property(get_module, set_module)
 
@@ -1316,6 +1508,10 @@ class CppClass(object):
 #include <map>
 #include <string>
 #include <typeinfo>
+#if __cplusplus >= 201103L
+# include <unordered_map>
+# include <typeindex>
+#endif
 #if defined(__GNUC__) && __GNUC__ >= 3 && !defined(__clang__)
 # include <cxxabi.h>
 #endif
@@ -1326,11 +1522,30 @@ namespace pybindgen {
 
 class TypeMap
 {
-   std::map<std::string, PyTypeObject *> m_map;
+#if __cplusplus >= 201103L
+   typedef std::unordered_map<std::type_index, PyTypeObject *> Map;
+#else
+   typedef std::map<std::string, PyTypeObject *> Map;
+#endif
+   Map m_map;   // registered wrappers
+   Map m_cache; // resolved lookups of types that were not registered
+   unsigned long m_hits;
+   unsigned long m_misses;
+
+   static Map::key_type key(const std::type_info &cpp_type_info)
+   {
+#if __cplusplus >= 201103L
+       return std::type_index(cpp_type_info);
+#else
+       return std::string(cpp_type_info.name());
+#endif
+   }
+
+   PyTypeObject * lookup_base_wrapper(const std::type_info &cpp_type_info);
 
 public:
 
-   TypeMap() {}
+   TypeMap() : m_hits(0), m_misses(0) {}
 
    void register_wrapper(const std::type_info &cpp_type_info, PyTypeObject *python_wrapper)
    {
@@ -1340,13 +1555,10 @@ public:
              << ", python_wrapper=" << python_wrapper->tp_name << ")" << std::endl;
 #endif
 
-       m_map[std::string(cpp_type_info.name())] = python_wrapper;
+       m_map[key(cpp_type_info)] = python_wrapper;
+       m_cache.clear();
    }
 
-''')
-
-            if settings.gcc_rtti_abi_complete:
-                code_sink.writeln('''
    PyTypeObject * lookup_wrapper(const std::type_info &cpp_type_info, PyTypeObject *fallback_wrapper)
    {
 
@@ -1354,58 +1566,75 @@ public:
    std::cerr << "lookup_wrapper(this=" << this << ", type_name=" << cpp_type_info.name() << ")" << std::endl;
 #endif
 
-       PyTypeObject *python_wrapper = m_map[cpp_type_info.name()];
-       if (python_wrapper)
-           return python_wrapper;
-       else {
+       Map::key_type type_key = key(cpp_type_info);
+       Map::const_iterator iter = m_map.find(type_key);
+       if (iter != m_map.end()) {
+           m_hits++;
+           return iter->second;
+       }
+       PyTypeObject *python_wrapper;
+       iter = m_cache.find(type_key);
+       if (iter != m_cache.end()) {
+           m_hits++;
+           python_wrapper = iter->second;
+       } else {
+           m_misses++;
+           python_wrapper = lookup_base_wrapper(cpp_type_info);
+           m_cache[type_key] = python_wrapper;
+       }
+       return python_wrapper? python_wrapper : fallback_wrapper;
+   }
+
+   unsigned long hits() const { return m_hits; }
+   unsigned long misses() const { return m_misses; }
+
+   static PyObject * stats(PyObject *type_map, PyObject * PYBINDGEN_UNUSED(args))
+   {
+       TypeMap *self = reinterpret_cast<TypeMap*> (PyCObject_AsVoidPtr(type_map));
+       return Py_BuildValue((char *) "kk", self->m_hits, self->m_misses);
+   }
+};
+
+''')
+
+            if settings.gcc_rtti_abi_complete:
+                code_sink.writeln('''
+inline PyTypeObject * TypeMap::lookup_base_wrapper(const std::type_info &cpp_type_info)
+{
 #if defined(__GNUC__) && __GNUC__ >= 3 && !defined(__clang__)
 
-           // Get closest (in the single inheritance tree provided by cxxabi.h)
-           // registered python wrapper.
-           const abi::__si_class_type_info *_typeinfo =
-               dynamic_cast<const abi::__si_class_type_info*> (&cpp_type_info);
+    // Get closest (in the single inheritance tree provided by cxxabi.h)
+    // registered python wrapper.
+    const abi::__si_class_type_info *_typeinfo =
+        dynamic_cast<const abi::__si_class_type_info*> (&cpp_type_info);
+    while (_typeinfo) {
 #if PBG_TYPEMAP_DEBUG
-          std::cerr << "  -> looking at C++ type " << _typeinfo->name() << std::endl;
+        std::cerr << "  -> looking at C++ type " << _typeinfo->name() << std::endl;
 #endif
-           while (_typeinfo && (python_wrapper = m_map[std::string(_typeinfo->name())]) == 0) {
-               _typeinfo = dynamic_cast<const abi::__si_class_type_info*> (_typeinfo->__base_type);
+        Map::const_iterator iter = m_map.find(key(*_typeinfo));
+        if (iter != m_map.end()) {
 #if PBG_TYPEMAP_DEBUG
-               std::cerr << "  -> looking at C++ type " << _typeinfo->name() << std::endl;
+            std::cerr << "  -> found match " << std::endl;
 #endif
-           }
-
-#if PBG_TYPEMAP_DEBUG
-          if (python_wrapper) {
-              std::cerr << "  -> found match " << std::endl;
-          } else {
-              std::cerr << "  -> return fallback wrapper" << std::endl;
-          }
-#endif
-
-           return python_wrapper? python_wrapper : fallback_wrapper;
+            return iter->second;
+        }
+        _typeinfo = dynamic_cast<const abi::__si_class_type_info*> (_typeinfo->__base_type);
+    }
+    return NULL;
 
 #else // non gcc 3+ compilers can only match against explicitly registered classes, not hidden subclasses
-           return fallback_wrapper;
+    return NULL;
 #endif
-       }
-   }
-};
+}
 
 }
 ''')
             else:
                 code_sink.writeln('''
-   PyTypeObject * lookup_wrapper(const std::type_info &cpp_type_info, PyTypeObject *fallback_wrapper)
-   {
-
-#if PBG_TYPEMAP_DEBUG
-   std::cerr << "lookup_wrapper(this=" << this << ", type_name=" << cpp_type_info.name() << ")" << std::endl;
-#endif
-
-       PyTypeObject *python_wrapper = m_map[cpp_type_info.name()];
-       return python_wrapper? python_wrapper : fallback_wrapper;
-   }
-};
+inline PyTypeObject * TypeMap::lookup_base_wrapper(const std::type_info & PYBINDGEN_UNUSED(cpp_type_info))
+{
+    return NULL;
+}
 
 }
 ''')
@@ -1467,6 +1696,16 @@ public:
             except utils.SkipWrapper:
                 return
 
+            if isinstance(method, CppMethod) and method.vectorize:
+                try:
+                    vectorized = utils.call_with_error_handling(
+                        VectorizedCppMethod, (method, vectorize.get_vectorized_name(method, name)), {},
+                        method)
+                except utils.SkipWrapper:
+                    pass
+                else:
+                    self._add_method_obj(vectorized)
+
 
             # Grr! I hate C++.  Overloading + inheritance = disaster!
             # So I ended up coding something which C++ does not in
@@ -1766,6 +2005,22 @@ public:
             return
 
         assert isinstance(value_type, ReturnValue)
+
+        ctype = str(value_type.type_traits.ctype_no_const)
+        if (self.offset_accessors and getter is None and setter is None
+                and ctype in MEMBER_OFFSET_TYPES and ',' not in self.full_name):
+            try:
+                getter_wrapper, setter_wrapper = self._offset_accessors[ctype]
+            except KeyError:
+                getter_wrapper = CppMemberOffsetGetter(self, ctype)
+                setter_wrapper = CppMemberOffsetSetter(self, ctype)
+                self._offset_accessors[ctype] = getter_wrapper, setter_wrapper
+            if is_const:
+                setter_wrapper = None
+            self.instance_attributes.add_attribute(name, getter_wrapper, setter_wrapper,
+                                                   closure="(void *) offsetof(%s, %s)" % (self.full_name, name))
+            return
+
         getter_wrapper = CppInstanceAttributeGetter(value_type, self, name, getter=getter)
         getter_wrapper.stack_where_defined = traceback.extract_stack()
         if is_const:
@@ -1818,10 +2073,11 @@ public:
 typedef struct {
     PyObject_HEAD
     %sobj;
+    PyObject *wards;
     PyObject *inst_dict;
-    PyBindGenWrapperFlags flags:8;
+    PyBindGenWrapperFlags flags:8;%s
 } %s;
-    ''' % (pointer_type, self.pystruct))
+    ''' % (pointer_type, self._get_inline_storage_member(), self.pystruct))
 
         else:
 
@@ -1829,12 +2085,25 @@ typedef struct {
 typedef struct {
     PyObject_HEAD
     %sobj;
-    PyBindGenWrapperFlags flags:8;
+    PyObject *wards;
+    PyBindGenWrapperFlags flags:8;%s
 } %s;
-    ''' % (pointer_type, self.pystruct))
+    ''' % (pointer_type, self._get_inline_storage_member(), self.pystruct))
 
         code_sink.writeln()
 
+        if self.freelist_size is not None and not self.import_from_module:
+            code_sink.writeln('''
+typedef struct {
+    int count;
+    unsigned long hits;
+    unsigned long misses;
+    %s *items[%i];
+} %s__Freelist;
+
+extern %s__Freelist %s;
+    ''' % (self.pystruct, self.freelist_size, self.pystruct, self.pystruct, self.freelist_name))
+
         if self.import_from_module:
             code_sink.writeln('extern PyTypeObject *_%s;' % (self.pytypestruct,))
             code_sink.writeln('#define %s (*_%s)' % (self.pytypestruct, self.pytypestruct))
@@ -1922,7 +2191,7 @@ typedef struct {
         module.after_init.unindent(); module.after_init.write_code("}")
 
         if self.helper_class is not None:
-            self.helper_class.generate(code_sink)
+            self.helper_class.generate(code_sink, module)
 
 
     def generate(self, code_sink, module):
@@ -1934,8 +2203,22 @@ typedef struct {
 
         if self.typeid_map_name is not None:
             code_sink.writeln("\npybindgen::TypeMap %s;\n" % self.typeid_map_name)
-            module.after_init.write_code("PyModule_AddObject(m, (char *) \"_%s\", PyCObject_FromVoidPtr(&%s, NULL));"
-                                         % (self.typeid_map_name, self.typeid_map_name))
+            ## export the type map, and a _<typeid_map_name>_stats()
+            ## function returning its (hits, misses) lookup counters
+            module.after_init.write_code("{")
+            module.after_init.indent()
+            module.after_init.write_code(
+                'static PyMethodDef stats_method = {(char *) "_%s_stats", (PyCFunction) pybindgen::TypeMap::stats, METH_NOARGS, NULL};'
+                % (self.typeid_map_name,))
+            module.after_init.write_code("PyObject *_cobj = PyCObject_FromVoidPtr(&%s, NULL);" % self.typeid_map_name)
+            module.after_init.write_code("PyModule_AddObject(m, (char *) \"_%s_stats\", PyCFunction_New(&stats_method, _cobj));"
+                                         % (self.typeid_map_name,))
+            module.after_init.write_code("PyModule_AddObject(m, (char *) \"_%s\", _cobj);" % (self.typeid_map_name,))
+            module.after_init.unindent()
+            module.after_init.write_code("}")
+
+        if self.freelist_size is not None:
+            code_sink.writeln("\n%s__Freelist %s = {0, 0, 0, {NULL}};\n" % (self.pystruct, self.freelist_name))
 
         if self.automatic_type_narrowing:
             self._register_typeid(module)
@@ -1944,7 +2227,7 @@ typedef struct {
             self.wrapper_registry.generate(code_sink, module)
 
         if self.helper_class is not None:
-            parent_caller_methods = self.helper_class.generate(code_sink)
+            parent_caller_methods = self.helper_class.generate(code_sink, module)
         else:
             parent_caller_methods = []
 
@@ -2042,22 +2325,74 @@ typedef struct {
         # are about to generate)
         root_module = self.module.get_root()
         for dummy_op_symbol, op_types in self.binary_numeric_operators.items():
-            for (retval, left, right) in op_types:
+            for (retval, left, right, dummy_binding) in op_types:
                 get_c_to_python_converter(retval, root_module, code_sink)
                 get_python_to_c_converter(left, root_module, code_sink)
                 get_python_to_c_converter(right, root_module, code_sink)
 
         for dummy_op_symbol, op_types in self.inplace_numeric_operators.items():
-            for (retval, left, right) in op_types:
+            for (retval, left, right, dummy_binding) in op_types:
                 get_python_to_c_converter(left, root_module, code_sink)
                 get_python_to_c_converter(right, root_module, code_sink)
                 get_c_to_python_converter(retval, root_module, code_sink)
 
         for dummy_op_symbol, op_types in self.unary_numeric_operators.items():
-            for (retval, left) in op_types:
+            for (retval, left, dummy_binding) in op_types:
                 get_c_to_python_converter(retval, root_module, code_sink)
                 get_python_to_c_converter(left, root_module, code_sink)
 
+        def write_operator_call(operands, result_expression, retval, type_dispatch=True):
+            """
+            Writes the code that converts the operands, given as a
+            list of (py_name, c_name, value, binding) tuples, and
+            returns the converted result.  With type_dispatch,
+            operands of wrapped class types are only type checked and
+            bound to the wrapped object as given by 'binding' (see
+            add_binary_numeric_operator); the other operands are
+            converted with converter functions.  Falls through when
+            the operands do not match.
+            """
+            retval_converter, retval_name = get_c_to_python_converter(retval, root_module, code_sink)
+            type_checks = []
+            bindings = []
+            conversions = []
+            for py_name, c_name, value, binding in operands:
+                cpp_class = (_get_operand_class(value) if type_dispatch else None)
+                if cpp_class is None:
+                    converter, type_name = get_python_to_c_converter(value, root_module, code_sink)
+                    bindings.append("%s %s;" % (type_name, c_name))
+                    conversions.append("%s(%s, &%s)" % (converter, py_name, c_name))
+                else:
+                    type_checks.append("PyObject_TypeCheck(%s, &%s)" % (py_name, cpp_class.pytypestruct))
+                    bindings.append("%s%s = *((%s *) %s)->obj;"
+                                    % (_OPERAND_BINDING_DECLARATIONS[binding] % cpp_class.full_name,
+                                       c_name, cpp_class.pystruct, py_name))
+            if type_checks:
+                code_sink.writeln("if (%s) {" % ' && '.join(type_checks))
+            else:
+                code_sink.writeln("{")
+            code_sink.indent()
+            for binding in bindings:
+                code_sink.writeln(binding)
+            if conversions:
+                code_sink.writeln("if (%s) {" % ' && '.join(conversions))
+                code_sink.indent()
+            code_sink.writeln("%s result = %s;" % (retval_name, result_expression))
+            code_sink.writeln("return %s(&result);" % retval_converter)
+            if conversions:
+                code_sink.unindent()
+                code_sink.writeln("}")
+                code_sink.writeln("PyErr_Clear();")
+            code_sink.unindent()
+            code_sink.writeln("}")
+
+            ## instances of classes implicitly convertible to an
+            ## operand class need going through the converter functions
+            if type_dispatch and [value for dummy, dummy, value, dummy in operands
+                                  if _get_operand_class(value) is not None
+                                  and _get_operand_class(value).get_all_implicit_conversions()]:
+                write_operator_call(operands, result_expression, retval, type_dispatch=False)
+
         def try_wrap_operator(op_symbol, slot_name):
             if op_symbol in self.binary_numeric_operators:
                 op_types = self.binary_numeric_operators[op_symbol]
@@ -2072,28 +2407,13 @@ typedef struct {
                                "%s (PyObject *py_left, PyObject *py_right)\n"
                                "{") % wrapper_name)
             code_sink.indent()
-            for (retval, left, right) in op_types:
-                retval_converter, retval_name = get_c_to_python_converter(retval, root_module, code_sink)
-                left_converter, left_name = get_python_to_c_converter(left, root_module, code_sink)
-                right_converter, right_name = get_python_to_c_converter(right, root_module, code_sink)
-
-                code_sink.writeln("{")
-                code_sink.indent()
-                
-                code_sink.writeln("%s left;" % left_name)
-                code_sink.writeln("%s right;" % right_name)
-                
-                code_sink.writeln("if (%s(py_left, &left) && %s(py_right, &right)) {" % (left_converter, right_converter))
-                code_sink.indent()
-                code_sink.writeln("%s result = (left %s right);" % (retval_name, op_symbol))
-                code_sink.writeln("return %s(&result);" % retval_converter)
-                code_sink.unindent()
-                code_sink.writeln("}")
-                code_sink.writeln("PyErr_Clear();")
+            for (retval, left, right, binding) in op_types:
+                ## the inplace operators modify a copy of the left operand
+                write_operator_call([('py_left', 'left', left,
+                                      ('copy' if op_symbol.endswith('=') else binding)),
+                                     ('py_right', 'right', right, binding)],
+                                    "(left %s right)" % op_symbol, retval)
 
-                code_sink.unindent()
-                code_sink.writeln("}")
-                
             code_sink.writeln("Py_INCREF(Py_NotImplemented);")
             code_sink.writeln("return Py_NotImplemented;")
             code_sink.unindent()
@@ -2111,26 +2431,10 @@ typedef struct {
                                "%s (PyObject *py_self)\n"
                                "{") % wrapper_name)
             code_sink.indent()
-            for (retval, left) in op_types:
-                retval_converter, retval_name = get_c_to_python_converter(retval, root_module, code_sink)
-                left_converter, left_name = get_python_to_c_converter(left, root_module, code_sink)
-
-                code_sink.writeln("{")
-                code_sink.indent()
-                
-                code_sink.writeln("%s self;" % left_name)
-                
-                code_sink.writeln("if (%s(py_self, &self)) {" % (left_converter))
-                code_sink.indent()
-                code_sink.writeln("%s result = %s(self);" % (retval_name, op_symbol))
-                code_sink.writeln("return %s(&result);" % retval_converter)
-                code_sink.unindent()
-                code_sink.writeln("}")
-                code_sink.writeln("PyErr_Clear();")
+            for (retval, left, binding) in op_types:
+                write_operator_call([('py_self', 'self', left, binding)],
+                                    "%s(self)" % op_symbol, retval)
 
-                code_sink.unindent()
-                code_sink.writeln("}")
-                
             code_sink.writeln("Py_INCREF(Py_NotImplemented);")
             code_sink.writeln("return Py_NotImplemented;")
             code_sink.unindent()
@@ -2294,7 +2598,10 @@ static PyObject*\n%s(%s *self)
 
         py_copy = declarations.declare_variable("%s*" % self.pystruct, "py_copy")
         self.write_allocate_pystruct(code_block, py_copy)
-        code_block.write_code("%s->obj = new %s(*self->obj);" % (py_copy, construct_name))
+        if self.inline_storage:
+            self.write_create_owned_instance(code_block, py_copy, "*self->obj")
+        else:
+            code_block.write_code("%s->obj = new %s(*self->obj);" % (py_copy, construct_name))
         if self.allow_subclassing:
             code_block.write_code("%s->inst_dict = NULL;" % py_copy)
         code_block.write_code("%s->flags = PYBINDGEN_WRAPPER_FLAG_NONE;" % py_copy)
@@ -2432,7 +2739,18 @@ static PyObject*\n%s(%s *self)
                     raise CodeGenerationError("Cannot finish generating class %s: "
                                               "type is incomplete, but no free/unref_function defined"
                                               % self.full_name)
-                if self.destructor_visibility == 'public':
+                if self.destructor_visibility == 'public' and self.inline_storage:
+                    delete_code = ("    typedef %s obj_type;\n"
+                                   "    obj_type *tmp = self->obj;\n"
+                                   "    self->obj = NULL;\n"
+                                   "    if (!(self->flags&PYBINDGEN_WRAPPER_FLAG_OBJECT_NOT_OWNED)) {\n"
+                                   "        if (tmp == %s) {\n"
+                                   "            tmp->~obj_type();\n"
+                                   "        } else {\n"
+                                   "            delete tmp;\n"
+                                   "        }\n"
+                                   "    }" % (self.full_name, self.get_inline_storage_address('self')))
+                elif self.destructor_visibility == 'public':
                     delete_code = ("    %s *tmp = self->obj;\n"
                                    "    self->obj = NULL;\n"
                                    "    if (!(self->flags&PYBINDGEN_WRAPPER_FLAG_OBJECT_NOT_OWNED)) {\n"
@@ -2454,6 +2772,7 @@ static void
 %s(%s *self)
 {
     Py_CLEAR(self->inst_dict);
+    Py_CLEAR(self->wards);
     %s
 }
 ''' % (tp_clear_function_name, self.pystruct, delete_code))
@@ -2479,6 +2798,7 @@ static int
 %s(%s *self, visitproc visit, void *arg)
 {
     Py_VISIT(self->inst_dict);
+    Py_VISIT(self->wards);
     %s
     return 0;
 }
@@ -2562,9 +2882,19 @@ static void
         if self.allow_subclassing:
             code_block.write_code("%s(self);" % self.slots["tp_clear"])
         else:
+            code_block.write_code("Py_CLEAR(self->wards);")
             code_block.write_code(self._get_delete_code())
 
-        code_block.write_code('Py_TYPE(self)->tp_free((PyObject*)self);')
+        if self.freelist_size is not None:
+            code_block.write_code('if (Py_TYPE(self) == &%s && %s.count < %i) {\n'
+                                  '    %s.items[%s.count++] = self;\n'
+                                  '} else {\n'
+                                  '    Py_TYPE(self)->tp_free((PyObject*)self);\n'
+                                  '}'
+                                  % (self.pytypestruct, self.freelist_name, self.freelist_size,
+                                     self.freelist_name, self.freelist_name))
+        else:
+            code_block.write_code('Py_TYPE(self)->tp_free((PyObject*)self);')
 
         code_block.write_cleanup()
         
@@ -2586,10 +2916,10 @@ static void
         code_sink.indent()
 
         code_sink.writeln("""
-if (!PyObject_IsInstance((PyObject*) other, (PyObject*) &%s)) {
+if (!%s) {
     Py_INCREF(Py_NotImplemented);
     return Py_NotImplemented;
-}""" % self.pytypestruct)
+}""" % utils.get_type_check('(PyObject*) other', '&' + self.pytypestruct))
 
         code_sink.writeln("switch (opid)\n{")
 
@@ -2638,7 +2968,8 @@ if (!PyObject_IsInstance((PyObject*) other, (PyObject*) &%s)) {
     def write_allocate_pystruct(self, code_block, lvalue, wrapper_type=None):
         """
         Generates code to allocate a python wrapper structure, using
-        PyObject_New or PyObject_GC_New, plus some additional strcture
+        PyObject_New or PyObject_GC_New (or recycling one from the
+        class freelist, if it has one), plus some additional strcture
         initialization that may be needed.
         """
         if self.allow_subclassing:
@@ -2647,8 +2978,25 @@ if (!PyObject_IsInstance((PyObject*) other, (PyObject*) &%s)) {
             new_func = 'PyObject_New'
         if wrapper_type is None:
             wrapper_type = '&'+self.pytypestruct
-        code_block.write_code("%s = %s(%s, %s);" %
-                              (lvalue, new_func, self.pystruct, wrapper_type))
+        if self.freelist_size is not None and wrapper_type == '&'+self.pytypestruct:
+            code_block.write_code("if (%s.count > 0) {\n"
+                                  "    %s = %s.items[--%s.count];\n"
+                                  "    PyObject_INIT(%s, %s);\n"
+                                  "    %s.hits++;\n"
+                                  "} else {\n"
+                                  "    %s = %s(%s, %s);\n"
+                                  "    %s.misses++;\n"
+                                  "}"
+                                  % (self.freelist_name,
+                                     lvalue, self.freelist_name, self.freelist_name,
+                                     lvalue, wrapper_type,
+                                     self.freelist_name,
+                                     lvalue, new_func, self.pystruct, wrapper_type,
+                                     self.freelist_name))
+        else:
+            code_block.write_code("%s = %s(%s, %s);" %
+                                  (lvalue, new_func, self.pystruct, wrapper_type))
+        code_block.write_code("%s->wards = NULL;" % (lvalue,))
         if self.allow_subclassing:
             code_block.write_code(
                 "%s->inst_dict = NULL;" % (lvalue,))
@@ -2665,7 +3013,7 @@ if (!PyObject_IsInstance((PyObject*) other, (PyObject*) &%s)) {
 from pybindgen.cppmethod import CppMethod, CppConstructor, CppNoConstructor, CppFunctionAsConstructor, \
     CppOverloadedMethod, CppOverloadedConstructor, \
     CppVirtualMethodParentCaller, CppVirtualMethodProxy, CustomCppMethodWrapper, \
-    CppDummyMethod
+    CppDummyMethod, VectorizedCppMethod
 
 
 
@@ -2731,9 +3079,9 @@ def common_shared_object_return(value, py_name, cpp_class, code_block,
                         # The PyObject creates its own copy
                         if not cpp_class.has_copy_constructor:
                             raise CodeGenerationError("Class {0} cannot be copied".format(cpp_class.full_name))
-                        cpp_class.write_create_instance(code_block,
-                                                             "%s->obj" % py_name,
-                                                             value_value)
+                        cpp_class.write_create_owned_instance(code_block,
+                                                              py_name,
+                                                              value_value)
                         code_block.write_code(
                             "%s->flags = PYBINDGEN_WRAPPER_FLAG_NONE;" % (py_name,))
                         cpp_class.write_post_instance_creation_code(code_block,
@@ -2883,6 +3231,28 @@ def common_shared_object_return(value, py_name, cpp_class, code_block,
 
 
 
+def _get_implicit_conversion_checks(py_name, classes):
+    """
+    Returns a list of (condition, cpp_class) pairs: a python object
+    is to be converted from the first class whose condition is true.
+    With settings.fast_type_checks, the exact type comparisons, which
+    are cheap and by far the most likely to succeed, are all tested
+    before any subtype check, unless that could change which class is
+    selected (i.e. one of the classes is a subclass of a previous one).
+    """
+    if settings.fast_type_checks:
+        for index, cpp_class in enumerate(classes):
+            if [other for other in classes[:index] if cpp_class.is_subclass(other)]:
+                break
+        else:
+            return ([("Py_TYPE(%s) == &%s" % (py_name, cpp_class.pytypestruct), cpp_class)
+                     for cpp_class in classes]
+                    + [("PyType_IsSubtype(Py_TYPE(%s), &%s)" % (py_name, cpp_class.pytypestruct), cpp_class)
+                       for cpp_class in classes])
+    return [(utils.get_type_check(py_name, '&' + cpp_class.pytypestruct), cpp_class)
+            for cpp_class in classes]
+
+
 class CppClassParameterBase(Parameter):
     "Base class for all C++ Class parameter handlers"
     CTYPES = []
@@ -2969,28 +3339,21 @@ class CppClassParameter(CppClassParameterBase):
                     wrapper.parse_params.add_parameter('O', ['&'+self.py_name], self.name, optional=True)
 
                 if self.default_value is None:
-                    wrapper.before_call.write_code("if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
-                                                   "    %s = *((%s *) %s)->obj;" %
-                                                   (self.py_name, self.cpp_class.pytypestruct,
-                                                    tmp_value_variable,
-                                                    self.cpp_class.pystruct, self.py_name))
+                    keyword = "if"
                 else:
                     wrapper.before_call.write_code(
                         "if (%s == NULL) {\n"
                         "    %s = %s;" %
                         (self.py_name, tmp_value_variable, self.default_value))
-                    wrapper.before_call.write_code(
-                        "} else if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
+                    keyword = "} else if"
+                for condition, conversion_source in _get_implicit_conversion_checks(
+                        self.py_name, [self.cpp_class] + implicit_conversion_sources):
+                    wrapper.before_call.write_code("%s (%s) {\n"
                                                    "    %s = *((%s *) %s)->obj;" %
-                                                   (self.py_name, self.cpp_class.pytypestruct,
-                                                    tmp_value_variable,
-                                                    self.cpp_class.pystruct, self.py_name))
-                for conversion_source in implicit_conversion_sources:
-                    wrapper.before_call.write_code("} else if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
-                                                   "    %s = *((%s *) %s)->obj;" %
-                                                   (self.py_name, conversion_source.pytypestruct,
+                                                   (keyword, condition,
                                                     tmp_value_variable,
                                                     conversion_source.pystruct, self.py_name))
+                    keyword = "} else if"
                 wrapper.before_call.write_code("} else {\n")
                 wrapper.before_call.indent()
                 possible_type_names = ", ".join([cls.name for cls in [self.cpp_class] + implicit_conversion_sources])
@@ -3013,9 +3376,9 @@ class CppClassParameter(CppClassParameterBase):
                 "%s->inst_dict = NULL;" % (self.py_name,))
         wrapper.before_call.write_code("%s->flags = PYBINDGEN_WRAPPER_FLAG_NONE;" % (self.py_name,))
 
-        self.cpp_class.write_create_instance(wrapper.before_call,
-                                             "%s->obj" % self.py_name,
-                                             self.value)
+        self.cpp_class.write_create_owned_instance(wrapper.before_call,
+                                                   self.py_name,
+                                                   self.value)
         self.cpp_class.wrapper_registry.write_register_new_wrapper(wrapper.before_call, self.py_name,
                                                                    "%s->obj" % self.py_name)
         self.cpp_class.write_post_instance_creation_code(wrapper.before_call,
@@ -3094,17 +3457,15 @@ class CppClassRefParameter(CppClassParameterBase):
                         self.cpp_class.full_name, self.name)
                     wrapper.parse_params.add_parameter('O', ['&'+self.py_name], self.name)
 
-                    wrapper.before_call.write_code("if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
-                                                   "    %s = *((%s *) %s)->obj;" %
-                                                   (self.py_name, self.cpp_class.pytypestruct,
-                                                    tmp_value_variable,
-                                                    self.cpp_class.pystruct, self.py_name))
-                    for conversion_source in implicit_conversion_sources:
-                        wrapper.before_call.write_code("} else if (PyObject_IsInstance(%s, (PyObject*) &%s)) {\n"
+                    keyword = "if"
+                    for condition, conversion_source in _get_implicit_conversion_checks(
+                            self.py_name, [self.cpp_class] + implicit_conversion_sources):
+                        wrapper.before_call.write_code("%s (%s) {\n"
                                                        "    %s = *((%s *) %s)->obj;" %
-                                                       (self.py_name, conversion_source.pytypestruct,
+                                                       (keyword, condition,
                                                         tmp_value_variable,
                                                         conversion_source.pystruct, self.py_name))
+                        keyword = "} else if"
                     wrapper.before_call.write_code("} else {\n")
                     wrapper.before_call.indent()
                     possible_type_names = ", ".join([cls.name for cls in [self.cpp_class] + implicit_conversion_sources])
@@ -3127,9 +3488,9 @@ class CppClassRefParameter(CppClassParameterBase):
                     "%s->inst_dict = NULL;" % (self.py_name,))
             wrapper.after_call.write_code("%s->flags = PYBINDGEN_WRAPPER_FLAG_NONE;" % (self.py_name,))
 
-            self.cpp_class.write_create_instance(wrapper.before_call,
-                                                 "%s->obj" % self.py_name,
-                                                 '')
+            self.cpp_class.write_create_owned_instance(wrapper.before_call,
+                                                       self.py_name,
+                                                       '')
             self.cpp_class.wrapper_registry.write_register_new_wrapper(wrapper.before_call, self.py_name,
                                                                        "%s->obj" % self.py_name)
             self.cpp_class.write_post_instance_creation_code(wrapper.before_call,
@@ -3170,9 +3531,9 @@ class CppClassRefParameter(CppClassParameterBase):
         if self.direction == Parameter.DIRECTION_IN:
             if not self.cpp_class.has_copy_constructor:
                 raise CodeGenerationError("Class {0} cannot be copied".format(self.cpp_class.full_name))
-            self.cpp_class.write_create_instance(wrapper.before_call,
-                                                 "%s->obj" % self.py_name,
-                                                 self.value)
+            self.cpp_class.write_create_owned_instance(wrapper.before_call,
+                                                       self.py_name,
+                                                       self.value)
             self.cpp_class.wrapper_registry.write_register_new_wrapper(wrapper.before_call, self.py_name,
                                                                        "%s->obj" % self.py_name)
             self.cpp_class.write_post_instance_creation_code(wrapper.before_call,
@@ -3205,9 +3566,9 @@ class CppClassRefParameter(CppClassParameterBase):
                     "    %s->obj = NULL;\n"
                     "else{\n" % (self.py_name, self.py_name))
                 wrapper.after_call.indent()
-                self.cpp_class.write_create_instance(wrapper.after_call,
-                                                     "%s->obj" % self.py_name,
-                                                     self.value)
+                self.cpp_class.write_create_owned_instance(wrapper.after_call,
+                                                           self.py_name,
+                                                           self.value)
                 self.cpp_class.wrapper_registry.write_register_new_wrapper(wrapper.after_call, self.py_name,
                                                                            "%s->obj" % self.py_name)
                 self.cpp_class.write_post_instance_creation_code(wrapper.after_call,
@@ -3252,9 +3613,9 @@ class CppClassReturnValue(CppClassReturnValueBase):
 
         if not self.cpp_class.has_copy_constructor:
             raise CodeGenerationError("Class {0} cannot be copied".format(self.cpp_class.full_name))
-        self.cpp_class.write_create_instance(wrapper.after_call,
-                                             "%s->obj" % py_name,
-                                             self.value)
+        self.cpp_class.write_create_owned_instance(wrapper.after_call,
+                                                   py_name,
+                                                   self.value)
         self.cpp_class.wrapper_registry.write_register_new_wrapper(wrapper.after_call, py_name,
                                                                    "%s->obj" % py_name)
         self.cpp_class.write_post_instance_creation_code(wrapper.after_call,
@@ -3327,9 +3688,9 @@ class CppClassRefReturnValue(CppClassReturnValueBase):
 
             if not self.cpp_class.has_copy_constructor:
                 raise CodeGenerationError("Class {0} cannot be copied".format(self.cpp_class.full_name))
-            self.cpp_class.write_create_instance(wrapper.after_call,
-                                                 "%s->obj" % py_name,
-                                                 self.value)
+            self.cpp_class.write_create_owned_instance(wrapper.after_call,
+                                                       py_name,
+                                                       self.value)
             self.cpp_class.wrapper_registry.write_register_new_wrapper(wrapper.after_call, py_name,
                                                                        "%s->obj" % py_name)
             self.cpp_class.write_post_instance_creation_code(wrapper.after_call,
@@ -3428,6 +3789,8 @@ class CppClassPtrParameter(CppClassParameterBase):
         if self.take_value_from_python_self:
             self.py_name = 'self'
             value_ptr = 'self->obj'
+            if self.transfer_ownership:
+                self.cpp_class.write_relocate_inline_instance(wrapper.before_call, 'self')
         else:
             self.py_name = wrapper.declarations.declare_variable(
                 self.cpp_class.pystruct+'*', self.name,
@@ -3441,10 +3804,13 @@ class CppClassPtrParameter(CppClassParameterBase):
 
                 wrapper.before_call.write_error_check(
 
-                    "%s && ((PyObject *) %s != Py_None) && !PyObject_IsInstance((PyObject *) %s, (PyObject *) &%s)"
-                    % (self.py_name, self.py_name, self.py_name, self.cpp_class.pytypestruct),
+                    "%s && ((PyObject *) %s != Py_None) && !%s"
+                    % (self.py_name, self.py_name,
+                       utils.get_type_check('(PyObject *) ' + self.py_name, '&' + self.cpp_class.pytypestruct)),
 
                     'PyErr_SetString(PyExc_TypeError, "Parameter %i must be of type %s");' % (num, self.cpp_class.name))
+                if self.transfer_ownership:
+                    self.cpp_class.write_relocate_inline_instance(wrapper.before_call, self.py_name)
 
                 wrapper.before_call.write_code("if (%(PYNAME)s) {\n"
                                                "    if ((PyObject *) %(PYNAME)s == Py_None)\n"
@@ -3459,6 +3825,8 @@ class CppClassPtrParameter(CppClassParameterBase):
 
                 wrapper.parse_params.add_parameter(
                     'O!', ['&'+self.cpp_class.pytypestruct, '&'+self.py_name], self.name, optional=bool(self.default_value))
+                if self.transfer_ownership:
+                    self.cpp_class.write_relocate_inline_instance(wrapper.before_call, self.py_name)
                 wrapper.before_call.write_code("%s = (%s ? %s->obj : NULL);" % (value_ptr, self.py_name, self.py_name))
 
         value = self.transformation.transform(self, wrapper.declarations, wrapper.before_call, value_ptr)
@@ -3537,9 +3905,9 @@ class CppClassPtrParameter(CppClassParameterBase):
                     if self.direction == Parameter.DIRECTION_IN:
                         if not self.cpp_class.has_copy_constructor:
                             raise CodeGenerationError("Class {0} cannot be copied".format(self.cpp_class.full_name))
-                        self.cpp_class.write_create_instance(wrapper.before_call,
-                                                             "%s->obj" % self.py_name,
-                                                             '*'+self.value)
+                        self.cpp_class.write_create_owned_instance(wrapper.before_call,
+                                                                   self.py_name,
+                                                                   '*'+self.value)
                         self.cpp_class.write_post_instance_creation_code(wrapper.before_call,
                                                                          "%s->obj" % self.py_name,
                                                                          '*'+self.value)
@@ -3570,9 +3938,9 @@ class CppClassPtrParameter(CppClassParameterBase):
                                 "    %s->obj = NULL;\n"
                                 "else {\n" % (self.py_name, self.py_name))
                             wrapper.after_call.indent()
-                            self.cpp_class.write_create_instance(wrapper.after_call,
-                                                                 "%s->obj" % self.py_name,
-                                                                 '*'+value)
+                            self.cpp_class.write_create_owned_instance(wrapper.after_call,
+                                                                       self.py_name,
+                                                                       '*'+value)
                             self.cpp_class.write_post_instance_creation_code(wrapper.after_call,
                                                                              "%s->obj" % self.py_name,
                                                                              '*'+value)
@@ -3847,7 +4215,44 @@ def scan_custodians_and_wards(wrapper):
 
 
 
-def _add_ward(code_block, custodian, ward):
+def _add_ward(code_block, custodian, ward, custodian_class=None, propagate_errors=True,
+              custodian_is_self=False):
+    if custodian_class is not None:
+        ## keep the wards in the wards slot of the custodian, in a
+        ## dict keyed by the ward address; a custodian that is None,
+        ## missing, or not of the class (e.g. implicitly converted to
+        ## it) has no such slot, and its wards are not kept
+        wards = "((%s *) %s)->wards" % (custodian_class.pystruct, custodian)
+        ward_key = code_block.declare_variable('PyObject*', 'ward_key')
+        ward_status = code_block.declare_variable('int', 'ward_status')
+        if custodian_is_self:
+            condition = ward
+        else:
+            condition = "%s && %s && %s != Py_None && %s" % (
+                ward, custodian, custodian,
+                utils.get_type_check(custodian, '&' + custodian_class.pytypestruct))
+        code_block.write_code(
+            "if (%(condition)s) {\n"
+            "    %(ward_status)s = -1;\n"
+            "    if (%(wards)s != NULL || (%(wards)s = PyDict_New()) != NULL) {\n"
+            "        %(ward_key)s = PyLong_FromVoidPtr(%(ward)s);\n"
+            "        if (%(ward_key)s) {\n"
+            "            %(ward_status)s = PyDict_SetItem(%(wards)s, %(ward_key)s, %(ward)s);\n"
+            "            Py_DECREF(%(ward_key)s);\n"
+            "        }\n"
+            "    }" % vars())
+        code_block.indent()
+        if propagate_errors:
+            code_block.write_error_check("%s < 0" % ward_status)
+        else:
+            ## the wrapped call has already been made, too late to fail
+            code_block.write_code("if (%s < 0) {\n"
+                                  "    PyErr_Clear();\n"
+                                  "}" % ward_status)
+        code_block.unindent()
+        code_block.write_code("}")
+        return
+
     wards = code_block.declare_variable(
         'PyObject*', 'wards')
     code_block.write_code(
@@ -3876,12 +4281,31 @@ def _get_custodian_or_ward(wrapper, num):
         return "((PyObject *) %s)" % wrapper.parameters[num-1].py_name
 
 
+def _get_custodian_class(wrapper, num):
+    """
+    Returns the CppClass whose wrapper structure wards slot can hold
+    the wards of the custodian, or None if the custodian is not known
+    to be a wrapper generated by this module.
+    """
+    if num == -1:
+        cpp_class = getattr(wrapper.return_value, 'cpp_class', None)
+    elif num == 0:
+        cpp_class = getattr(wrapper, 'class_', None)
+    else:
+        cpp_class = getattr(wrapper.parameters[num-1], 'cpp_class', None)
+    if isinstance(cpp_class, CppClass) and not cpp_class.import_from_module:
+        return cpp_class
+    return None
+
+
 def implement_parameter_custodians_precall(wrapper):
     for custodian, ward, postcall in wrapper.custodians_and_wards:
         if not postcall:
             _add_ward(wrapper.before_call,
                       _get_custodian_or_ward(wrapper, custodian),
-                      _get_custodian_or_ward(wrapper, ward))
+                      _get_custodian_or_ward(wrapper, ward),
+                      _get_custodian_class(wrapper, custodian),
+                      custodian_is_self=(custodian == 0))
 
 
 def implement_parameter_custodians_postcall(wrapper):
@@ -3889,6 +4313,9 @@ def implement_parameter_custodians_postcall(wrapper):
         if postcall:
             _add_ward(wrapper.after_call,
                       _get_custodian_or_ward(wrapper, custodian),
-                      _get_custodian_or_ward(wrapper, ward))
+                      _get_custodian_or_ward(wrapper, ward),
+                      _get_custodian_class(wrapper, custodian),
+                      propagate_errors=False,
+                      custodian_is_self=(custodian == 0))
 
 
@@ -13,6 +13,7 @@ from pybindgen.typehandlers import codesink
 from pybindgen import overloading
 from pybindgen import settings
 from pybindgen import utils
+from pybindgen import vectorize
 from pybindgen.cppexception import CppException
 
 
@@ -25,7 +26,8 @@ class CppMethod(ForwardWrapperBase):
                  template_parameters=(), is_virtual=None, is_const=False,
                  unblock_threads=None, is_pure_virtual=False,
                  custom_template_method_name=None, visibility='public',
-                 custom_name=None, deprecated=False, docstring=None, throw=()):
+                 custom_name=None, deprecated=False, docstring=None, throw=(),
+                 vectorize=False):
         """
         Create an object the generates code to wrap a C++ class method.
 
@@ -72,6 +74,13 @@ class CppMethod(ForwardWrapperBase):
 
         :param throw: list of C++ exceptions that the function may throw
         :type throw: list of L{CppException}
+
+        :param vectorize: if true, an additional vectorized method is
+          generated, which calls the method over buffers or sequences
+          of values in a C loop (see L{pybindgen.vectorize}); its
+          python name is the method name followed by '_vectorized', or
+          the given string.  All parameters and the return value must
+          be numeric scalars.
         """
         self.stack_where_defined = traceback.extract_stack()
 
@@ -125,6 +134,7 @@ class CppMethod(ForwardWrapperBase):
         self.throw = list(throw)
 
         self.custodians_and_wards = [] # list of (custodian, ward, postcall)
+        self.vectorize = vectorize
         from . import cppclass
         cppclass.scan_custodians_and_wards(self)
 
@@ -355,6 +365,11 @@ class CppMethod(ForwardWrapperBase):
                     " full varargs/kwargs wrappers"
                 self.wrapper_args = ["%s *%s" % (self._get_pystruct(), _self_name),
                                      "PyObject *args"]
+        elif 'METH_FASTCALL' in flags:
+            assert not extra_wrapper_params, \
+                "extra_wrapper_params can only be used with full varargs/kwargs wrappers"
+            self.wrapper_args = ["%s *%s" % (self._get_pystruct(), _self_name),
+                                 "PyObject *const *args", "Py_ssize_t nargs", "PyObject *kwnames"]
         else:
             assert not extra_wrapper_params, \
                 "extra_wrapper_params can only be used with full varargs/kwargs wrappers"
@@ -396,6 +411,12 @@ class CppMethod(ForwardWrapperBase):
         tmp_sink.flush_to(code_sink)
         self.write_close_wrapper(code_sink)
 
+    def _use_fastcall(self):
+        ## special methods may be called directly from type slots,
+        ## with the METH_VARARGS wrapper signature
+        return (settings.fastcall_wrappers and settings.min_python_version >= (3, 7)
+                and not (self.mangled_name.startswith('__') and self.mangled_name.endswith('__')))
+
     def get_py_method_def_flags(self):
         "Get the PyMethodDef flags suitable for this method"
         flags = super(CppMethod, self).get_py_method_def_flags()
@@ -455,6 +476,50 @@ class CppMethod(ForwardWrapperBase):
                  params, const, pure_virtual))
 
 
+class VectorizedCppMethod(CppMethod):
+    """
+    Generates the vectorized entry point of a method wrapper created
+    with vectorize=True.
+    """
+
+    def __init__(self, method, custom_name):
+        """
+        :param method: the scalar method wrapper
+        :type method: L{CppMethod}
+        :param custom_name: python name of the vectorized method
+        """
+        vectorize.check_vectorizable(method)
+        if method.return_value.ctype == 'void':
+            return_value = ReturnValue.new('void')
+        else:
+            return_value = vectorize.VectorReturnValue(method.return_value)
+        super(VectorizedCppMethod, self).__init__(
+            method.method_name, return_value,
+            [vectorize.VectorParameter(param) for param in method.parameters],
+            is_static=method.is_static, template_parameters=method.template_parameters,
+            is_const=method.is_const, unblock_threads=method.unblock_threads,
+            custom_name=custom_name, deprecated=method.deprecated, throw=method.throw)
+
+    def _init_code_generation_state(self):
+        super(VectorizedCppMethod, self)._init_code_generation_state()
+        vectorize.init_code_generation_state(self)
+
+    def _before_call_hook(self):
+        vectorize.write_before_call(self)
+        super(VectorizedCppMethod, self)._before_call_hook()
+
+    def generate_call(self, class_=None):
+        "virtual method implementation; do not call"
+        vectorize.write_call_loop(self, lambda: super(VectorizedCppMethod, self).generate_call(class_))
+
+    def generate(self, code_sink, wrapper_name=None, extra_wrapper_params=()):
+        vectorize.write_helpers(self, code_sink)
+        super(VectorizedCppMethod, self).generate(code_sink, wrapper_name, extra_wrapper_params)
+
+    def generate_docstring(self, name):
+        return vectorize.generate_docstring(self, name)
+
+
 class CppOverloadedMethod(overloading.OverloadedWrapper):
     "Support class for overloaded methods"
     RETURN_TYPE = 'PyObject *'
@@ -998,6 +1063,7 @@ class CppVirtualMethodProxy(ReverseWrapperBase):
         self.method_name = method.method_name
         self.method = method
         self._helper_class = None
+        self._py_method = None
 
     def get_class(self):
         "Get the class wrapper object (CppClass)"
@@ -1013,18 +1079,32 @@ class CppVirtualMethodProxy(ReverseWrapperBase):
         return self._helper_class
     helper_class = property(get_helper_class, set_helper_class)
 
+    def get_python_method_name(self):
+        "Get the name of the python method that overrides this virtual method"
+        if settings._get_deprecated_virtuals():
+            return '_' + self.method_name
+        else:
+            return self.method_name
+    python_method_name = property(get_python_method_name)
+
+    def get_virtual_name_member(self):
+        """
+        Get the name of the helper class static data member
+        (PyBindGenVirtualName) holding the interned python method name
+        and the cached python type known not to override the method
+        """
+        return 'm_pyvirtual_%s' % self.method_name
+    virtual_name_member = property(get_virtual_name_member)
 
     def generate_python_call(self):
         """code to call the python method"""
-        if settings._get_deprecated_virtuals():
-            params = ['m_pyself', '(char *) "_%s"' % self.method_name]
-        else:
-            params = ['m_pyself', '(char *) "%s"' % self.method_name]
+        ## the bound method was already looked up when checking for an override
+        params = [self._py_method]
         build_params = self.build_params.get_parameters()
         if build_params[0][0] == '"':
             build_params[0] = '(char *) ' + build_params[0]
         params.extend(build_params)
-        self.before_call.write_code('py_retval = PyObject_CallMethod(%s);'
+        self.before_call.write_code('py_retval = PyObject_CallFunction(%s);'
                                     % (', '.join(params),))
         self.before_call.write_error_check('py_retval == NULL', failure_cleanup='PyErr_Print();')
         self.before_call.add_cleanup_code('Py_DECREF(py_retval);')
@@ -1059,12 +1139,34 @@ class CppVirtualMethodProxy(ReverseWrapperBase):
         ## just chain to parent class and don't do anything else
         call_params = ', '.join([param.name for param in self.parameters])
         py_method = self.declarations.declare_variable('PyObject*', 'py_method')
-        if settings._get_deprecated_virtuals():
-            self.before_call.write_code('%s = PyObject_GetAttrString(m_pyself, (char *) "_%s"); PyErr_Clear();'
-                                        % (py_method, self.method_name))
-        else:
-            self.before_call.write_code('%s = PyObject_GetAttrString(m_pyself, (char *) "%s"); PyErr_Clear();'
-                                        % (py_method, self.method_name))
+        self._py_method = py_method
+
+        ## Python types already known not to override the method (as
+        ## long as the type has not been modified since, which resets
+        ## its version tag) skip the attribute lookup altogether;
+        ## attributes set on the instance itself still take precedence.
+        virtual_name = "%s::%s" % (self._helper_class.name, self.virtual_name_member)
+        inst_dict = "reinterpret_cast< %s* >(m_pyself)->inst_dict" % self._helper_class.class_.pystruct
+        no_instance_override = ("(%s == NULL || PyDict_GetItem(%s, %s.name) == NULL)"
+                                % (inst_dict, inst_dict, virtual_name))
+        self.before_call.write_code(
+            "if (PyBindGenVirtualName_IsCached(&%s, Py_TYPE(m_pyself))\n"
+            "    && %s) {"
+            % (virtual_name, no_instance_override))
+        self.before_call.write_code("    %s = NULL;" % py_method)
+        self.before_call.write_code("} else {")
+        self.before_call.indent()
+        self.before_call.write_code('%s = PyObject_GetAttr(m_pyself, %s.name); PyErr_Clear();'
+                                    % (py_method, virtual_name))
+        self.before_call.write_code(
+            "if ((%s == NULL || Py_TYPE(%s) == &PyCFunction_Type)\n"
+            "    && PyType_HasFeature(Py_TYPE(m_pyself), Py_TPFLAGS_VALID_VERSION_TAG)\n"
+            "    && %s) {"
+            % (py_method, py_method, no_instance_override))
+        self.before_call.write_code("    PyBindGenVirtualName_Cache(&%s, Py_TYPE(m_pyself));" % virtual_name)
+        self.before_call.write_code("}")
+        self.before_call.unindent()
+        self.before_call.write_code("}")
         self.before_call.add_cleanup_code('Py_XDECREF(%s);' % py_method)
         
         self.before_call.write_code(
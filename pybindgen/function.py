@@ -20,6 +20,7 @@ from pybindgen.cppexception import CppException
 from pybindgen import overloading
 from pybindgen import settings
 from pybindgen import utils
+from pybindgen import vectorize
 
 import warnings
 import traceback
@@ -31,7 +32,7 @@ class Function(ForwardWrapperBase):
 
     def __init__(self, function_name, return_value, parameters, docstring=None, unblock_threads=None,
                  template_parameters=(), custom_name=None, deprecated=False, foreign_cpp_namespace=None,
-                 throw=()):
+                 throw=(), vectorize=False):
         """
         :param function_name: name of the C function
         :param return_value: the function return value
@@ -55,6 +56,13 @@ class Function(ForwardWrapperBase):
 
         :param throw: list of C++ exceptions that the function may throw
         :type throw: list of L{CppException}
+
+        :param vectorize: if true, an additional vectorized entry point
+          is generated, which calls the function over buffers or
+          sequences of values in a C loop (see L{pybindgen.vectorize});
+          its python name is the function name followed by
+          '_vectorized', or the given string.  All parameters and the
+          return value must be numeric scalars.
         """
         self.stack_where_defined = traceback.extract_stack()
 
@@ -93,6 +101,7 @@ class Function(ForwardWrapperBase):
             assert isinstance(t, CppException)
         self.throw = list(throw)
         self.custodians_and_wards = [] # list of (custodian, ward, postcall)
+        self.vectorize = vectorize
         from pybindgen import cppclass
         cppclass.scan_custodians_and_wards(self)
 
@@ -230,6 +239,9 @@ class Function(ForwardWrapperBase):
         from . import cppclass
         cppclass.implement_parameter_custodians_postcall(self)
 
+    def _use_fastcall(self):
+        return settings.fastcall_wrappers and settings.min_python_version >= (3, 7)
+
     def generate(self, code_sink, wrapper_name=None, extra_wrapper_params=()):
         """
         Generates the wrapper code
@@ -251,15 +263,18 @@ class Function(ForwardWrapperBase):
 
         flags = self.get_py_method_def_flags()
         self.wrapper_args = []
+        if self.self_parameter_pystruct is None:
+            self_param = 'PyObject * PYBINDGEN_UNUSED(dummy)'
+        else:
+            self_param = '%s *self' % self.self_parameter_pystruct
         if 'METH_VARARGS' in flags:
-            if self.self_parameter_pystruct is None:
-                self_param = 'PyObject * PYBINDGEN_UNUSED(dummy)'
-            else:
-                self_param = '%s *self' % self.self_parameter_pystruct
             self.wrapper_args.append(self_param)
             self.wrapper_args.append("PyObject *args")
             if 'METH_KEYWORDS' in flags:
                 self.wrapper_args.append("PyObject *kwargs")
+        elif 'METH_FASTCALL' in flags:
+            self.wrapper_args.append(self_param)
+            self.wrapper_args.extend(["PyObject *const *args", "Py_ssize_t nargs", "PyObject *kwnames"])
         self.wrapper_args.extend(extra_wrapper_params)
         self.wrapper_return = "PyObject *"
         self.write_open_wrapper(code_sink)
@@ -345,6 +360,52 @@ class CustomFunctionWrapper(Function):
         pass
 
 
+class VectorizedFunction(Function):
+    """
+    Generates the vectorized entry point of a function wrapper created
+    with vectorize=True.
+    """
+
+    def __init__(self, function, custom_name):
+        """
+        :param function: the scalar function wrapper
+        :type function: L{Function}
+        :param custom_name: python name of the vectorized entry point
+        """
+        vectorize.check_vectorizable(function)
+        if function.return_value.ctype == 'void':
+            return_value = ReturnValue.new('void')
+        else:
+            return_value = vectorize.VectorReturnValue(function.return_value)
+        super(VectorizedFunction, self).__init__(
+            function.function_name, return_value,
+            [vectorize.VectorParameter(param) for param in function.parameters],
+            unblock_threads=function.unblock_threads,
+            template_parameters=function.template_parameters,
+            custom_name=custom_name, deprecated=function.deprecated,
+            foreign_cpp_namespace=function.foreign_cpp_namespace,
+            throw=function.throw)
+
+    def _init_code_generation_state(self):
+        super(VectorizedFunction, self)._init_code_generation_state()
+        vectorize.init_code_generation_state(self)
+
+    def _before_call_hook(self):
+        vectorize.write_before_call(self)
+        super(VectorizedFunction, self)._before_call_hook()
+
+    def generate_call(self):
+        "virtual method implementation; do not call"
+        vectorize.write_call_loop(self, super(VectorizedFunction, self).generate_call)
+
+    def generate(self, code_sink, wrapper_name=None, extra_wrapper_params=()):
+        vectorize.write_helpers(self, code_sink)
+        super(VectorizedFunction, self).generate(code_sink, wrapper_name, extra_wrapper_params)
+
+    def generate_docstring(self, name):
+        return vectorize.generate_docstring(self, name)
+
+
 class OverloadedFunction(overloading.OverloadedWrapper):
     """Adds support for overloaded functions"""
     RETURN_TYPE = 'PyObject *'
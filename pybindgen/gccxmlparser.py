@@ -17,8 +17,11 @@ else:
 import os.path
 import warnings
 import re
+import hashlib
+import pickle
 import pygccxml
 from pygccxml import parser
+from pygccxml.parser import declarations_cache
 from pygccxml import declarations
 from .module import Module
 from .typehandlers.codesink import FileCodeSink, CodeSink, NullCodeSink
@@ -42,7 +45,6 @@ from . import utils
 #from pygccxml.declarations.calldef import \
 #    destructor_t, constructor_t, member_function_t
 from pygccxml.declarations.variable import variable_t
-import collections
 
 
 ###
@@ -482,6 +484,173 @@ class PygenClassifier(object):
         raise NotImplementedError
 
 
+class SizeBalancedPygenClassifier(PygenClassifier):
+    """
+    Classifier that distributes the API definitions among a fixed set
+    of sections, so that the sections end up with roughly the same
+    amount of generated code.  The size of each class is estimated
+    like Module.assign_balanced_sections does, from its number of
+    constructors, attributes, methods and virtual methods; classes are kept in the same section as their base classes and
+    outer classes.
+    """
+    def __init__(self, section_names):
+        """
+        :param section_names: list of section names to distribute the
+           definitions among
+        """
+        super(SizeBalancedPygenClassifier, self).__init__()
+        assert section_names
+        self.section_names = list(section_names)
+        self._class_sections = None # id(class_t) -> section name
+        self._section_weights = None
+        self._other_sections = {} # id(declaration_t) -> section name
+
+    def _estimate_class_size(self, cls):
+        methods = cls.member_functions(allow_empty=True, recursive=False)
+        return utils.estimate_class_code_size(
+            len(cls.constructors(allow_empty=True, recursive=False)),
+            len(cls.variables(allow_empty=True, recursive=False)),
+            len(methods),
+            len([method for method in methods
+                 if method.virtuality != declarations.VIRTUALITY_TYPES.NOT_VIRTUAL]))
+
+    def _assign_classes(self, global_ns):
+        def get_related_classes(cls):
+            related = [hierarchy_info.related_class for hierarchy_info in cls.bases]
+            if isinstance(cls.parent, class_t):
+                related.append(cls.parent)
+            return related
+        classes = list(global_ns.classes(allow_empty=True, recursive=True))
+        bins = utils.balance_groups(classes, get_related_classes, self._estimate_class_size,
+                                    len(self.section_names))
+        self._class_sections = {}
+        self._section_weights = [0]*len(self.section_names)
+        for section_index, groups in enumerate(bins):
+            for group in groups:
+                for cls in group:
+                    self._class_sections[id(cls)] = self.section_names[section_index]
+                    self._section_weights[section_index] += self._estimate_class_size(cls)
+
+    def classify(self, pygccxml_definition):
+        global_ns = pygccxml_definition
+        while global_ns.parent is not None:
+            global_ns = global_ns.parent
+        if self._class_sections is None:
+            self._assign_classes(global_ns)
+
+        ## definitions nested in a class go with the class
+        decl = pygccxml_definition
+        while decl is not None:
+            try:
+                return self._class_sections[id(decl)]
+            except KeyError:
+                decl = decl.parent
+
+        ## anything else goes to the lightest section
+        try:
+            return self._other_sections[id(pygccxml_definition)]
+        except KeyError:
+            lightest = self._section_weights.index(min(self._section_weights))
+            self._section_weights[lightest] += 1
+            section = self.section_names[lightest]
+            self._other_sections[id(pygccxml_definition)] = section
+            return section
+
+
+class GccXmlParseCache(declarations_cache.cache_base_t):
+    """
+    On-disk cache of the declarations parsed from each header file,
+    for use as the gccxml_cache parameter of
+    L{ModuleParser.parse_init}.  An entry is reused only while the
+    header file, all the files it includes, and the gccxml
+    configuration are unchanged.  The least recently used entries are
+    removed when the cache grows over max_size bytes.
+    """
+    def __init__(self, directory, max_size=None):
+        """
+        :param directory: directory where the cache entries are kept;
+           it is created if it does not exist
+        :param max_size: maximum total size of the cache entries, in
+           bytes, or None for no limit
+        """
+        super(GccXmlParseCache, self).__init__()
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _get_entry_path(self, source_file, configuration):
+        key = hashlib.sha1()
+        for item in [getattr(pygccxml, '__version__', ''), os.path.abspath(source_file),
+                     declarations_cache.configuration_signature(configuration)]:
+            key.update(item.encode('utf-8'))
+        return os.path.join(self.directory, key.hexdigest() + '.cache')
+
+    def cached_value(self, source_file, configuration):
+        """
+        Returns the cached declarations of source_file, or None if
+        there are no valid cached declarations.
+        """
+        path = self._get_entry_path(source_file, configuration)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as entry_file:
+                file_signatures, decls = pickle.load(entry_file)
+        except Exception:
+            ## corrupted, or created by an incompatible version
+            os.remove(path)
+            return None
+        for file_name, signature in file_signatures:
+            if not os.path.exists(file_name) \
+                    or declarations_cache.file_signature(file_name) != signature:
+                os.remove(path)
+                return None
+        os.utime(path, None)
+        return decls
+
+    def update(self, source_file, configuration, declarations, included_files):
+        """Stores the declarations parsed from source_file"""
+        file_signatures = [(file_name, declarations_cache.file_signature(file_name))
+                           for file_name in set([source_file] + list(included_files))
+                           if os.path.exists(file_name)]
+        path = self._get_entry_path(source_file, configuration)
+        with open(path + '.tmp', 'wb') as entry_file:
+            pickle.dump((file_signatures, declarations), entry_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(path + '.tmp', path)
+        self._evict()
+
+    def _evict(self):
+        if self.max_size is None:
+            return
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.cache'):
+                continue
+            path = os.path.join(self.directory, file_name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, path, stat.st_size))
+            total_size += stat.st_size
+        entries.sort()
+        ## always keep the most recent entry
+        for dummy_mtime, path, size in entries[:-1]:
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
+
+    def flush(self):
+        """Entries are written as soon as they are updated; does nothing"""
+        pass
+
+    def clear(self):
+        """Removes all the cache entries"""
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith('.cache'):
+                os.remove(os.path.join(self.directory, file_name))
+
+
 class ModuleParser(object):
     """
     :attr enable_anonymous_containers: if True, pybindgen will attempt
@@ -551,7 +720,7 @@ class ModuleParser(object):
                                     methods are denoted by a annotation for a
                                     parameter named 'return'.
         """
-        if not isinstance(hook, collections.Callable):
+        if not callable(hook):
             raise TypeError("hook must be callable")
         self._pre_scan_hooks.append(hook)
 
@@ -570,7 +739,7 @@ class ModuleParser(object):
            - pybindgen_wrapper -- a pybindgen object that generates a wrapper,
                                 such as CppClass, Function, or CppMethod.
         """
-        if not isinstance(hook, collections.Callable):
+        if not callable(hook):
             raise TypeError("hook must be callable")
         self._post_scan_hooks.append(hook)
 
@@ -583,7 +752,7 @@ class ModuleParser(object):
         return False
 
     def parse(self, header_files, include_paths=None, whitelist_paths=None, includes=(),
-              pygen_sink=None, pygen_classifier=None, gccxml_options=None):
+              pygen_sink=None, pygen_classifier=None, gccxml_options=None, gccxml_cache=None):
         """
         parses a set of header files and returns a pybindgen Module instance.
         It is equivalent to calling the following methods:
@@ -596,7 +765,7 @@ class ModuleParser(object):
          The documentation for L{ModuleParser.parse_init} explains the parameters.
         """
         self.parse_init(header_files, include_paths, whitelist_paths, includes, pygen_sink,
-                        pygen_classifier, gccxml_options)
+                        pygen_classifier, gccxml_options, gccxml_cache)
         self.scan_types()
         self.scan_methods()
         self.scan_functions()
@@ -605,7 +774,7 @@ class ModuleParser(object):
 
     def parse_init(self, header_files, include_paths=None,
                    whitelist_paths=None, includes=(), pygen_sink=None, pygen_classifier=None,
-                   gccxml_options=None):
+                   gccxml_options=None, gccxml_cache=None):
         """
         Prepares to parse a set of header files.  The following
         methods should then be called in order to finish the rest of
@@ -655,6 +824,12 @@ class ModuleParser(object):
 
         :type gccxml_options: dict
 
+        :param gccxml_cache: cache of parsed declarations, to skip
+            running gccxml on headers that did not change since the
+            last time they were parsed; either a directory name, to
+            use a L{GccXmlParseCache} in it, or a pygccxml
+            declarations cache object.
+
         """
         assert isinstance(header_files, list)
         assert isinstance(includes, (list, tuple))
@@ -693,7 +868,9 @@ class ModuleParser(object):
         else:
             self.gccxml_config = parser.gccxml_configuration_t(**gccxml_options)
 
-        self.declarations = parser.parse(header_files, self.gccxml_config)
+        if isinstance(gccxml_cache, string_types):
+            gccxml_cache = GccXmlParseCache(gccxml_cache)
+        self.declarations = parser.parse(header_files, self.gccxml_config, cache=gccxml_cache)
         self.global_ns = declarations.get_global_namespace(self.declarations)
         if self.module_namespace_name == '::':
             self.module_namespace = self.global_ns
@@ -1619,6 +1796,18 @@ pybindgen.settings.error_handler = ErrorHandler()
                                        WrapperWarning, op.location.file_name, op.location.line)
                 return
 
+            ## operators taking non-const operands need them bound to
+            ## non-const references
+            if (isinstance(op, calldef.member_operator_t) and not op.has_const) \
+                    or [arg for arg in op.arguments
+                        if isinstance(arg.type, cpptypes.reference_t)
+                        and not isinstance(arg.type.base, cpptypes.const_t)]:
+                operand_binding = 'reference'
+                binding_repr = ", operand_binding='reference'"
+            else:
+                operand_binding = 'const_reference'
+                binding_repr = ""
+
             if len(argument_types) == 2:
                 dummy_global_annotations, parameter_annotations = annotations_scanner.get_annotations(op)
                 arg_spec = self.type_registry.lookup_parameter(argument_types[1], 'right',
@@ -1640,24 +1829,27 @@ pybindgen.settings.error_handler = ErrorHandler()
                     #print >> sys.stderr, "<<<<<potential NUMERIC OP>>>>>  %s: %s : %s --> %s" \
                     #    % (op.symbol, cls, [str(x) for x in argument_types], return_type)
 
-                    pygen_sink.writeln("cls.add_binary_numeric_operator(%r, root_module[%r], root_module[%r], %s)"
-                                       % (op.symbol, ret.full_name, arg0.full_name, arg_repr))
+                    pygen_sink.writeln("cls.add_binary_numeric_operator(%r, root_module[%r], root_module[%r], %s%s)"
+                                       % (op.symbol, ret.full_name, arg0.full_name, arg_repr, binding_repr))
                     if param is not None:
-                        class_wrapper.add_binary_numeric_operator(op.symbol, ret, arg0, param)
+                        class_wrapper.add_binary_numeric_operator(op.symbol, ret, arg0, param,
+                                                                  operand_binding=operand_binding)
 
                 # -- inplace numeric operators --
                 if op.symbol in ['+=', '-=', '/=', '*=']:
                     #print >> sys.stderr, "<<<<<potential NUMERIC OP>>>>>  %s: %s : %s --> %s" \
                     #    % (op.symbol, cls, [str(x) for x in argument_types], return_type)
 
-                    pygen_sink.writeln("cls.add_inplace_numeric_operator(%r, %s)" % (op.symbol, arg_repr))
+                    pygen_sink.writeln("cls.add_inplace_numeric_operator(%r, %s%s)"
+                                       % (op.symbol, arg_repr, binding_repr))
                     if param is not None:
-                        class_wrapper.add_inplace_numeric_operator(op.symbol, param)
+                        class_wrapper.add_inplace_numeric_operator(op.symbol, param,
+                                                                   operand_binding=operand_binding)
 
             elif len(argument_types) == 1: # unary operator
                 if op.symbol in ['-']:
-                    pygen_sink.writeln("cls.add_unary_numeric_operator(%r)" % (op.symbol,))
-                    class_wrapper.add_unary_numeric_operator(op.symbol)
+                    pygen_sink.writeln("cls.add_unary_numeric_operator(%r%s)" % (op.symbol, binding_repr))
+                    class_wrapper.add_unary_numeric_operator(op.symbol, operand_binding=operand_binding)
 
             else:
                 warnings.warn_explicit("NUMERIC OP: wrong number of arguments, got %i, expected 1 or 2"
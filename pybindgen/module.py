@@ -45,7 +45,7 @@ to create sub-modules for wrapping nested namespaces.  For instance::
 
 """
 
-from pybindgen.function import Function, OverloadedFunction, CustomFunctionWrapper
+from pybindgen.function import Function, OverloadedFunction, CustomFunctionWrapper, VectorizedFunction
 from pybindgen.typehandlers.base import CodeBlock, DeclarationsScope, ReturnValue, TypeHandler
 from pybindgen.typehandlers.codesink import MemoryCodeSink, CodeSink, FileCodeSink, NullCodeSink
 from pybindgen.cppclass import CppClass
@@ -54,8 +54,14 @@ from pybindgen.enum import Enum
 from pybindgen.container import Container
 from pybindgen.converter_functions import PythonToCConverter, CToPythonConverter
 from pybindgen import utils
+from pybindgen.utils import string_types
+from pybindgen import vectorize
 import warnings
 import traceback
+import multiprocessing
+import os
+import hashlib
+import json
 
 
 class MultiSectionFactory(object):
@@ -107,11 +113,117 @@ class MultiSectionFactory(object):
         raise NotImplementedError
 
 
+class IncrementalMultiSectionFactory(MultiSectionFactory):
+    """
+    Multi-section factory that writes each section to a '<section
+    name>.cc' file in a directory, but only rewrites the files whose
+    content has changed since the previous run, so that their
+    modification time is preserved and the build system does not
+    recompile them.  The SHA-1 hash of each file content is recorded
+    in a manifest file (JSON), which is used in the next run to find
+    out which files are up to date.
+
+    Example::
+
+       out = IncrementalMultiSectionFactory("build", "foomodule.cc", "foomodule.h")
+       root_module.generate(out)
+       out.close()
+    """
+
+    def __init__(self, directory, main_file_name, header_file_name,
+                 manifest_file_name=None):
+        """
+        :param directory: directory where the files are written
+        :param main_file_name: name of the main source file
+        :param header_file_name: name of the common header file
+        :param manifest_file_name: name of the manifest file; by default,
+           the main file name with a '.manifest' extension.
+        """
+        super(IncrementalMultiSectionFactory, self).__init__()
+        self.directory = directory
+        self.main_file_name = main_file_name
+        self.header_file_name = header_file_name
+        if manifest_file_name is None:
+            manifest_file_name = os.path.splitext(main_file_name)[0] + '.manifest'
+        self.manifest_file_name = manifest_file_name
+        self.sinks = {} # file name -> MemoryCodeSink
+        self.written_files = [] # files (re)written by the last close()
+        self.unchanged_files = [] # files left untouched by the last close()
+
+    def _get_file_sink(self, file_name):
+        try:
+            return self.sinks[file_name]
+        except KeyError:
+            sink = MemoryCodeSink()
+            self.sinks[file_name] = sink
+            return sink
+
+    def get_section_code_sink(self, section_name):
+        if section_name == '__main__':
+            return self.get_main_code_sink()
+        return self._get_file_sink("%s.cc" % section_name)
+
+    def get_main_code_sink(self):
+        return self._get_file_sink(self.main_file_name)
+
+    def get_common_header_code_sink(self):
+        return self._get_file_sink(self.header_file_name)
+
+    def get_common_header_include(self):
+        return '"%s"' % self.header_file_name
+
+    def _load_manifest(self):
+        try:
+            manifest_file = open(os.path.join(self.directory, self.manifest_file_name))
+        except IOError:
+            return {}
+        try:
+            try:
+                return json.load(manifest_file)
+            except ValueError:
+                return {}
+        finally:
+            manifest_file.close()
+
+    def close(self):
+        """
+        Writes the files whose content differs from the previous run,
+        and the new manifest.
+        """
+        old_manifest = self._load_manifest()
+        manifest = {}
+        self.written_files = []
+        self.unchanged_files = []
+        for file_name, sink in sorted(self.sinks.items()):
+            content = sink.flush()
+            digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+            manifest[file_name] = digest
+            path = os.path.join(self.directory, file_name)
+            if old_manifest.get(file_name) == digest and os.path.exists(path):
+                self.unchanged_files.append(file_name)
+                continue
+            output = open(path, "wt")
+            try:
+                output.write(content)
+            finally:
+                output.close()
+            self.written_files.append(file_name)
+        manifest_file = open(os.path.join(self.directory, self.manifest_file_name), "wt")
+        try:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        finally:
+            manifest_file.close()
+
+
 class _SinkManager(object):
     """
     Internal abstract base class for bridging differences between
     multi-file and single-file code generation.
     """
+    ## false if only the wrappers are being generated, not the code
+    ## depending on all of them (the parallel generation workers)
+    generates_module_code = True
+
     def get_code_sink_for_wrapper(self, wrapper):
         """
         :param wrapper: wrapper object
@@ -124,6 +236,16 @@ class _SinkManager(object):
         raise NotImplementedError
     def close(self):
         raise NotImplementedError
+    def generate_wrapper(self, wrapper, generate, *args):
+        """
+        Generates the code of a function, class, container, exception,
+        or enum wrapper, by calling generate(body_code_sink,
+        header_code_sink, main_code_sink, \\*args).
+
+        :returns: the value returned by generate
+        """
+        sink, header_sink = self.get_code_sink_for_wrapper(wrapper)
+        return generate(sink, header_sink, self.get_main_code_sink(), *args)
 
 class _MultiSectionSinkManager(_SinkManager):
     """
@@ -179,6 +301,378 @@ class _MonolithicSinkManager(_SinkManager):
         self.code_sink.flush_to(self.final_code_sink)
 
 
+def _iter_modules(module):
+    """Iterates over a module and all its sub-modules, depth first"""
+    yield module
+    for submodule in module.submodules:
+        for mod in _iter_modules(submodule):
+            yield mod
+
+
+def _get_wrapper_section(wrapper):
+    section = getattr(wrapper, "section", None)
+    if section == '__main__':
+        return None
+    return section
+
+
+def _set_wrapper_section(wrapper, section):
+    overloads = getattr(wrapper, 'wrappers', None)
+    if overloads is None:
+        wrapper.section = section
+    else:
+        for overload in overloads:
+            overload.section = section
+
+
+def _estimate_wrapper_code_size(wrapper):
+    """
+    Estimates the compile cost of a wrapper, roughly in number of
+    generated C functions.
+    """
+    if isinstance(wrapper, CppClass):
+        methods = [method for overload in wrapper.methods.values() for method in overload.wrappers]
+        return utils.estimate_class_code_size(
+            len(wrapper.constructors),
+            len(wrapper.instance_attributes.attributes) + len(wrapper.static_attributes.attributes),
+            len(methods), len([method for method in methods if getattr(method, 'is_virtual', False)]))
+    elif isinstance(wrapper, Container):
+        return 6
+    return len(getattr(wrapper, 'wrappers', [None]))
+
+
+class _RecordingCodeSink(CodeSink):
+    """
+    Code sink that appends (channel, line) pairs to a list, so that
+    the lines written to several code sinks can later be replayed in
+    the same order.
+    """
+    def __init__(self, channel, log):
+        super(_RecordingCodeSink, self).__init__()
+        self.channel = channel
+        self.log = log
+
+    def writeln(self, line=''):
+        """Write one or more lines of code"""
+        for formatted_line in self._format_code(line):
+            self.log.append((self.channel, formatted_line))
+
+
+class _ModuleStateSnapshot(object):
+    """
+    Records the state of the code generation targets shared between
+    the wrappers of a module tree (module init function code,
+    declarations, header, body, one-time definitions), so that the
+    code added to them by a wrapper can be extracted and later
+    applied to another copy of the same module tree.
+    """
+    def __init__(self, root_module):
+        self.root_module = root_module
+        self.modules = list(_iter_modules(root_module))
+        self.lines = [(mod.before_init.sink.chunks, mod.after_init.sink.chunks,
+                       mod.declarations.get_code_sink().chunks)
+                      for mod in self.modules]
+        self.line_counts = [[len(lines) for lines in module_lines] for module_lines in self.lines]
+        self.cleanup_state = self._get_cleanup_state()
+        self.declared_variables = [dict(mod.declarations.declared_variables) for mod in self.modules]
+        self.header_count = len(root_module.header.chunks)
+        self.body_count = len(root_module.body.chunks)
+        self.one_time_definitions = set(root_module.one_time_definitions)
+
+    def _get_cleanup_state(self):
+        return [(mod.before_init._last_cleanup_position, len(mod.before_init._cleanup_actions),
+                 mod.after_init._last_cleanup_position, len(mod.after_init._cleanup_actions))
+                for mod in self.modules]
+
+    def get_changes(self):
+        """
+        Returns the changes made since the snapshot was taken, or
+        None if they can not be replayed.
+        """
+        if self._get_cleanup_state() != self.cleanup_state:
+            return None
+        module_lines = [[lines[count:] for lines, count in zip(mod_lines, mod_counts)]
+                        for mod_lines, mod_counts in zip(self.lines, self.line_counts)]
+        declared_variables = []
+        for mod, old_variables in zip(self.modules, self.declared_variables):
+            declared_variables.append(
+                [(name, old_variables.get(name, 0), num)
+                 for name, num in mod.declarations.declared_variables.items()
+                 if old_variables.get(name, 0) != num])
+        return dict(module_lines=module_lines,
+                    declared_variables=declared_variables,
+                    header=self.root_module.header.chunks[self.header_count:],
+                    body=self.root_module.body.chunks[self.body_count:],
+                    one_time_definitions=sorted(set(self.root_module.one_time_definitions)
+                                                - self.one_time_definitions))
+
+
+def _iter_generated_objects(wrapper):
+    """
+    Iterates, in a deterministic order, over the objects whose state
+    is set when generating a wrapper: the wrapper itself, its python
+    type structures, container traits, overloads, return values and
+    parameters and, for classes, the method and constructor wrappers
+    and the helper class.
+    """
+    objects = [wrapper]
+    container = getattr(wrapper, 'container_traits', None) or wrapper
+    if container is not wrapper:
+        objects.append(container)
+    for obj, name in [(wrapper, 'pytype'), (container, 'iter_pytype'),
+                      (container, 'key_type'), (container, 'value_type')]:
+        if getattr(obj, name, None) is not None:
+            objects.append(getattr(obj, name))
+    objects.extend(getattr(wrapper, 'wrappers', None) or [])
+    if isinstance(wrapper, CppClass):
+        for overload in wrapper.methods.values():
+            objects.append(overload)
+            objects.extend(overload.wrappers)
+        objects.extend(wrapper.constructors)
+        if wrapper.helper_class is not None:
+            objects.append(wrapper.helper_class)
+            objects.extend(wrapper.helper_class.virtual_methods)
+            objects.extend(wrapper.helper_class.virtual_proxies)
+    for obj in objects:
+        yield obj
+        if getattr(obj, 'return_value', None) is not None:
+            yield obj.return_value
+        for parameter in getattr(obj, 'parameters', None) or []:
+            yield parameter
+
+
+class _NotReplayable(Exception):
+    pass
+
+
+def _encode_value(value, refs, new_objects=()):
+    """
+    Encodes the value of a wrapper attribute so that it can be sent
+    to another process: plain data (strings, numbers, and containers
+    of them) is copied, the objects in refs are replaced by their
+    index, and the pybindgen objects in new_objects are encoded with
+    their attributes.  Raises _NotReplayable for other values.
+    """
+    if value is None or isinstance(value, (string_types, int, float, bool)):
+        return ('value', value)
+    elif id(value) in refs:
+        return ('ref', refs[id(value)])
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return (type(value), [_encode_value(item, refs, new_objects) for item in value])
+    elif isinstance(value, dict):
+        return (dict, [(_encode_value(key, refs, new_objects), _encode_value(item, refs, new_objects))
+                       for key, item in value.items()])
+    elif [obj for obj in new_objects if obj is value]:
+        ## guard against reference cycles
+        new_objects = [obj for obj in new_objects if obj is not value]
+        return ('new', (type(value), [(name, _encode_value(item, refs, new_objects))
+                                      for name, item in sorted(vars(value).items())]))
+    raise _NotReplayable
+
+
+def _decode_value(encoded, objects):
+    kind, data = encoded
+    if kind == 'value':
+        return data
+    elif kind == 'ref':
+        return objects[data]
+    elif kind == 'new':
+        cls, attributes = data
+        obj = cls.__new__(cls)
+        for name, item in attributes:
+            setattr(obj, name, _decode_value(item, objects))
+        return obj
+    elif kind is dict:
+        return dict([(_decode_value(key, objects), _decode_value(item, objects)) for key, item in data])
+    return kind([_decode_value(item, objects) for item in data])
+
+
+class _WrapperStateSnapshot(object):
+    """
+    Records the attributes of the objects generated along with a
+    wrapper, so that the attributes set by code generation, e.g. the
+    names of the generated C functions, the type slots, or the
+    constructors overload of a class, can be applied to the same
+    wrapper in another copy of the module tree.  Attributes that
+    refer to other objects created by code generation (e.g. the
+    inherited method clones in all_wrappers) are left to be computed
+    again when needed.
+    """
+    def __init__(self, wrapper):
+        self.objects = list(_iter_generated_objects(wrapper))
+        self.refs = dict([(id(obj), index) for index, obj in enumerate(self.objects)])
+        self.attributes = [self._encode_attributes(obj) for obj in self.objects]
+
+    def _encode_attributes(self, obj, new_objects=()):
+        attributes = {}
+        for name, value in vars(obj).items():
+            try:
+                attributes[name] = _encode_value(value, self.refs, new_objects)
+            except _NotReplayable:
+                attributes[name] = ('id', id(value))
+        return attributes
+
+    def get_changes(self):
+        """
+        Returns a list of (object_index, attribute_name,
+        encoded_value) for the attributes set since the snapshot was
+        taken.
+        """
+        changes = []
+        for index, (obj, old_attributes) in enumerate(zip(self.objects, self.attributes)):
+            new_objects = [value for value in vars(obj).values()
+                           if ('id', id(value)) not in old_attributes.values()
+                           and type(value).__module__.startswith('pybindgen.')
+                           and hasattr(value, '__dict__')]
+            for name, encoded in sorted(self._encode_attributes(obj, new_objects).items()):
+                if encoded[0] != 'id' and old_attributes.get(name) != encoded:
+                    changes.append((index, name, encoded))
+        return changes
+
+
+def _apply_wrapper_changes(wrapper, changes):
+    objects = list(_iter_generated_objects(wrapper))
+    for index, name, encoded in changes:
+        setattr(objects[index], name, _decode_value(encoded, objects))
+
+
+def _have_one_time_definitions(root_module, changes):
+    for definition_name in changes['one_time_definitions']:
+        if definition_name in root_module.one_time_definitions:
+            return True
+    return False
+
+
+def _can_apply_module_changes(root_module, changes):
+    if changes is None:
+        return False
+    for mod, variables in zip(_iter_modules(root_module), changes['declared_variables']):
+        for name, old_num, dummy_num in variables:
+            if mod.declarations.declared_variables.get(name, 0) != old_num:
+                return False
+    return True
+
+
+def _apply_module_changes(root_module, changes):
+    for mod, (before_init, after_init, declarations), variables \
+            in zip(_iter_modules(root_module), changes['module_lines'], changes['declared_variables']):
+        mod.before_init.sink.chunks.extend(before_init)
+        mod.after_init.sink.chunks.extend(after_init)
+        mod.declarations.get_code_sink().chunks.extend(declarations)
+        for name, dummy_old_num, num in variables:
+            mod.declarations.declared_variables[name] = num
+    root_module.header.chunks.extend(changes['header'])
+    root_module.body.chunks.extend(changes['body'])
+    for definition_name in changes['one_time_definitions']:
+        root_module.one_time_definitions[definition_name] = None
+
+
+class _SectionWorkerSinkManager(_SinkManager):
+    """
+    Sink manager used by the worker processes of parallel
+    multi-section code generation.  Only the wrappers of the given
+    sections are generated; for each one the generated code and the
+    changes to the module state are recorded, indexed by the order in
+    which the wrappers are generated.
+    """
+    generates_module_code = False
+
+    def __init__(self, root_module, sections):
+        super(_SectionWorkerSinkManager, self).__init__()
+        self.root_module = root_module
+        self.sections = sections
+        self.null_sink = NullCodeSink()
+        self.wrapper_index = 0
+        self.records = {}
+
+    def get_code_sink_for_wrapper(self, dummy_wrapper):
+        return self.null_sink, self.null_sink
+    def get_includes_code_sink(self):
+        return self.null_sink
+    def get_main_code_sink(self):
+        return self.null_sink
+    def close(self):
+        pass
+
+    def generate_wrapper(self, wrapper, generate, *args):
+        index = self.wrapper_index
+        self.wrapper_index += 1
+        if _get_wrapper_section(wrapper) not in self.sections:
+            return None
+        log = []
+        snapshot = _ModuleStateSnapshot(self.root_module)
+        wrapper_snapshot = _WrapperStateSnapshot(wrapper)
+        result = generate(_RecordingCodeSink('body', log), _RecordingCodeSink('header', log),
+                          _RecordingCodeSink('main', log), *args)
+        changes = snapshot.get_changes()
+        if changes is None:
+            return None
+        self.records[index] = (result, log, changes, wrapper_snapshot.get_changes())
+        return result
+
+
+class _ParallelMultiSectionSinkManager(_MultiSectionSinkManager):
+    """
+    Sink manager that writes the code recorded by
+    _SectionWorkerSinkManager objects, in the same order as sequential
+    code generation would produce it.  Wrappers that were not
+    generated by a worker, or whose recorded code depends on code
+    generation state that differs in the main process, are generated
+    normally, as well as the wrappers that follow them in the same
+    section.  The wrappers whose recorded code includes a one-time
+    definition already written by another section (e.g. the
+    implementation of the wrapper registry) are generated again
+    normally, without it.
+    """
+    def __init__(self, multi_section_factory, root_module, records):
+        super(_ParallelMultiSectionSinkManager, self).__init__(multi_section_factory)
+        self.root_module = root_module
+        self.records = records
+        self.wrapper_index = 0
+        self.sequential_sections = set()
+
+    def generate_wrapper(self, wrapper, generate, *args):
+        index = self.wrapper_index
+        self.wrapper_index += 1
+        section = _get_wrapper_section(wrapper)
+        record = self.records.get(index)
+        if record is None or section in self.sequential_sections \
+                or not _can_apply_module_changes(self.root_module, record[2]):
+            if section is not None:
+                self.sequential_sections.add(section)
+            return super(_ParallelMultiSectionSinkManager, self).generate_wrapper(wrapper, generate, *args)
+        if _have_one_time_definitions(self.root_module, record[2]):
+            return super(_ParallelMultiSectionSinkManager, self).generate_wrapper(wrapper, generate, *args)
+
+        result, log, changes, wrapper_changes = record
+        sink, header_sink = self.get_code_sink_for_wrapper(wrapper)
+        sinks = dict(body=sink, header=header_sink, main=self.get_main_code_sink())
+        for channel, line in log:
+            sinks[channel].writeln(line)
+        _apply_module_changes(self.root_module, changes)
+        _apply_wrapper_changes(wrapper, wrapper_changes)
+        return result
+
+
+## state inherited by the forked worker processes of parallel code generation
+_parallel_generation = None
+
+def _generate_sections_in_worker(sections):
+    module, module_file_base_name = _parallel_generation
+    out = _SectionWorkerSinkManager(module, set(sections))
+    module.do_generate(out, module_file_base_name)
+    return out.records
+
+
+def _get_fork_context():
+    if not hasattr(os, 'fork'):
+        return None
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError: # python < 3.4
+        return multiprocessing
+
+
 class ModuleBase(dict):
     """
     ModuleBase objects can be indexed dictionary style to access contained types.  Example::
@@ -307,6 +801,44 @@ class ModuleBase(dict):
                              % (self._current_section, section_name))
         self._current_section = '__main__'
 
+    def assign_balanced_sections(self, num_sections, section_name_format=None):
+        """
+        Splits the functions and types of the module (and its
+        sub-modules) that do not belong to any section into
+        num_sections sections of roughly the same estimated code size.
+        Classes are kept in the same section as their base and outer
+        classes, and so are the other types nested in them.
+
+        .. note::
+
+          Sections only take effect when a :class:`MultiSectionFactory`
+          is used as code generation output.
+
+        :param num_sections: number of sections to create
+        :param section_name_format: format of the section names,
+           given the section number; by default '<module name>_section%i'
+        :returns: list of the names of the sections
+        """
+        assert self.parent is None
+        if section_name_format is None:
+            section_name_format = self.name + '_section%i'
+        section_names = [section_name_format % (number + 1) for number in range(num_sections)]
+
+        wrappers = []
+        for mod in _iter_modules(self):
+            wrappers.extend([wrapper for wrapper in (list(mod.functions.values()) + mod.classes + mod.containers
+                                                     + mod.exceptions + mod.enums)
+                             if _get_wrapper_section(wrapper) is None])
+
+        def get_dependencies(wrapper):
+            return list(getattr(wrapper, 'bases', [])) + [getattr(wrapper, 'outer_class', None)]
+        bins = utils.balance_groups(wrappers, get_dependencies, _estimate_wrapper_code_size, num_sections)
+        for section_name, bin_ in zip(section_names, bins):
+            for group in bin_:
+                for wrapper in group:
+                    _set_wrapper_section(wrapper, section_name)
+        return section_names
+
     def get_name(self):
         return self._name
 
@@ -386,6 +918,14 @@ class ModuleBase(dict):
         wrapper.module = self
         wrapper.section = self.current_section
         overload.add(wrapper)
+        if wrapper.vectorize:
+            try:
+                vectorized = utils.call_with_error_handling(
+                    VectorizedFunction, (wrapper, vectorize.get_vectorized_name(wrapper, name)), {},
+                    wrapper)
+            except utils.SkipWrapper:
+                return
+            self._add_function_obj(vectorized)
 
     def add_function(self, *args, **kwargs):
         """
@@ -674,6 +1214,89 @@ class ModuleBase(dict):
             parent = parent.parent
         return names
 
+    def _generate_freelist_stats(self, code_sink, classes):
+        """
+        (internal) Generates the _freelist_stats(drain=False) module
+        function, which reports (and optionally drains) the wrapper
+        freelists of the given classes.
+        """
+        func_name = "_wrap_%s__freelist_stats" % self.prefix
+        code_sink.writeln('''
+static PyObject *
+%s(PyObject * PYBINDGEN_UNUSED(dummy), PyObject *args, PyObject *kwargs)
+{
+    int drain = 0;
+    PyObject *stats;
+    PyObject *item;
+    const char *keywords[] = {"drain", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, (char *) "|i", (char **) keywords, &drain)) {
+        return NULL;
+    }
+    stats = PyDict_New();
+    if (stats == NULL) {
+        return NULL;
+    }''' % func_name)
+        code_sink.indent()
+        for class_ in classes:
+            freelist = class_.freelist_name
+            code_sink.writeln('''
+item = Py_BuildValue((char *) "(ikk)", %(FL)s.count, %(FL)s.hits, %(FL)s.misses);
+if (item == NULL || PyDict_SetItemString(stats, (char *) "%(NAME)s", item) == -1) {
+    Py_XDECREF(item);
+    Py_DECREF(stats);
+    return NULL;
+}
+Py_DECREF(item);
+if (drain) {
+    while (%(FL)s.count > 0) {
+        PyObject_Del(%(FL)s.items[--%(FL)s.count]);
+    }
+    %(FL)s.hits = 0;
+    %(FL)s.misses = 0;
+}''' % dict(FL=freelist, NAME=class_.slots['tp_name']))
+        code_sink.writeln("return stats;")
+        code_sink.unindent()
+        code_sink.writeln("}\n")
+
+        self.after_init.write_code("{")
+        self.after_init.indent()
+        self.after_init.write_code(
+            'static PyMethodDef freelist_stats_method = {(char *) "_freelist_stats", (PyCFunction) %s, METH_KEYWORDS|METH_VARARGS, NULL};'
+            % func_name)
+        self.after_init.write_code(
+            'PyModule_AddObject(m, (char *) "_freelist_stats", PyCFunction_New(&freelist_stats_method, NULL));')
+        self.after_init.unindent()
+        self.after_init.write_code("}")
+
+    def _generate_function(self, sink, dummy_header_sink, main_sink, func_name, overload):
+        """(internal) Generates a module function; returns its PyMethodDef entry, or None"""
+        sink.writeln()
+        try:
+            utils.call_with_error_handling(overload.generate, (sink,), {}, overload)
+        except utils.SkipWrapper:
+            return None
+        try:
+            utils.call_with_error_handling(overload.generate_declaration, (main_sink,), {}, overload)
+        except utils.SkipWrapper:
+            return None
+
+        sink.writeln()
+        return overload.get_py_method_def(func_name)
+
+    def _generate_type(self, sink, dummy_header_sink, dummy_main_sink, type_):
+        """(internal) Generates a class, container, or exception"""
+        sink.writeln()
+        type_.generate(sink, self)
+        sink.writeln()
+
+    def _generate_enum(self, sink, header_sink, dummy_main_sink, enum):
+        """(internal) Generates an enum"""
+        sink.writeln()
+        enum.generate(sink)
+        enum.generate_declaration(header_sink, self)
+        sink.writeln()
+
     def do_generate(self, out, module_file_base_name=None):
         """(internal) Generates the module."""
         assert isinstance(out, _SinkManager)
@@ -727,20 +1350,9 @@ class ModuleBase(dict):
             main_sink.writeln('/* --- module functions --- */')
             main_sink.writeln()
             for func_name, overload in self.functions.items():
-                sink, header_sink = out.get_code_sink_for_wrapper(overload)
-                sink.writeln()
-                try:
-                    utils.call_with_error_handling(overload.generate, (sink,), {}, overload)
-                except utils.SkipWrapper:
-                    continue
-                try:
-                    utils.call_with_error_handling(overload.generate_declaration, (main_sink,), {}, overload)
-                except utils.SkipWrapper:
-                    continue
-                
-                sink.writeln()
-                py_method_defs.append(overload.get_py_method_def(func_name))
-                del sink
+                py_method_def = out.generate_wrapper(overload, self._generate_function, func_name, overload)
+                if py_method_def is not None:
+                    py_method_defs.append(py_method_def)
 
         ## generate the function table
         main_sink.writeln("static PyMethodDef %s_functions[] = {"
@@ -757,35 +1369,27 @@ class ModuleBase(dict):
             main_sink.writeln('/* --- classes --- */')
             main_sink.writeln()
             for class_ in [c for c in self.classes if c.import_from_module]:
-                sink, header_sink = out.get_code_sink_for_wrapper(class_)
-                sink.writeln()
-                class_.generate(sink, self)
-                sink.writeln()
+                out.generate_wrapper(class_, self._generate_type, class_)
             for class_ in [c for c in self.classes if not c.import_from_module]:
-                sink, header_sink = out.get_code_sink_for_wrapper(class_)
-                sink.writeln()
-                class_.generate(sink, self)
-                sink.writeln()
+                out.generate_wrapper(class_, self._generate_type, class_)
+            freelist_classes = [c for c in self.classes
+                                if not c.import_from_module and c.freelist_size is not None]
+            if freelist_classes and out.generates_module_code:
+                self._generate_freelist_stats(main_sink, freelist_classes)
 
         ## generate the containers
         if self.containers:
             main_sink.writeln('/* --- containers --- */')
             main_sink.writeln()
             for container in self.containers:
-                sink, header_sink = out.get_code_sink_for_wrapper(container)
-                sink.writeln()
-                container.generate(sink, self)
-                sink.writeln()
+                out.generate_wrapper(container, self._generate_type, container)
 
         ## generate the exceptions
         if self.exceptions:
             main_sink.writeln('/* --- exceptions --- */')
             main_sink.writeln()
             for exc in self.exceptions:
-                sink, header_sink = out.get_code_sink_for_wrapper(exc)
-                sink.writeln()
-                exc.generate(sink, self)
-                sink.writeln()
+                out.generate_wrapper(exc, self._generate_type, exc)
 
         # typedefs
         for (wrapper, alias) in self.typedefs:
@@ -798,11 +1402,7 @@ class ModuleBase(dict):
             main_sink.writeln('/* --- enumerations --- */')
             main_sink.writeln()
             for enum in self.enums:
-                sink, header_sink = out.get_code_sink_for_wrapper(enum)
-                sink.writeln()
-                enum.generate(sink)
-                enum.generate_declaration(header_sink, self)
-                sink.writeln()
+                out.generate_wrapper(enum, self._generate_enum, enum)
 
         ## register the submodules
         if self.submodules:
@@ -907,7 +1507,7 @@ class Module(ModuleBase):
         """
         super(Module, self).__init__(name, docstring=docstring, cpp_namespace=cpp_namespace)
 
-    def generate(self, out, module_file_base_name=None):
+    def generate(self, out, module_file_base_name=None, jobs=1):
         """Generates the module
 
         :type out: a file object, L{FileCodeSink}, or L{MultiSectionFactory}
@@ -916,18 +1516,99 @@ class Module(ModuleBase):
         This is useful when we want to produce a _foo module that will
         be imported into a foo module, to avoid making all types
         docstrings contain _foo.Xpto instead of foo.Xpto.
+
+        :param jobs: number of worker processes used to generate the
+        sections of a L{MultiSectionFactory} output in parallel.  The
+        output is the same as with sequential generation, provided
+        that code generation for the wrappers of a section does not
+        depend on the wrappers of other sections, other than through
+        the module init function, the common header, and one-time
+        definitions.  Requires os.fork(); errors reported by the
+        workers do not reach settings.error_handler in the main
+        process.
         """
         if hasattr(out, 'write'):
             out = FileCodeSink(out)
         if isinstance(out, CodeSink):
             sink_manager = _MonolithicSinkManager(out)
         elif isinstance(out, MultiSectionFactory):
-            sink_manager = _MultiSectionSinkManager(out)
+            records = None
+            if jobs > 1:
+                records = self._generate_sections_in_parallel(module_file_base_name, jobs)
+            if records is None:
+                sink_manager = _MultiSectionSinkManager(out)
+            else:
+                sink_manager = _ParallelMultiSectionSinkManager(out, self, records)
         else:
             raise TypeError
         self.do_generate(sink_manager, module_file_base_name)
         sink_manager.close()
 
+    def _generate_sections_in_parallel(self, module_file_base_name, jobs):
+        """
+        Generates the wrappers of each section in worker processes;
+        returns the recorded code, or None if parallel code generation
+        is not possible.
+        """
+        global _parallel_generation
+        fork_context = _get_fork_context()
+        if fork_context is None:
+            return None
+
+        ## sections whose wrappers depend on each other (base or
+        ## outer classes) have to be generated by the same process,
+        ## and those related to the main section by the main process
+        section_groups = {None: [None]}
+        def merge_sections(section1, section2):
+            group1 = section_groups.setdefault(section1, [section1])
+            group2 = section_groups.setdefault(section2, [section2])
+            if group1 is not group2:
+                group1.extend(group2)
+                for section in group2:
+                    section_groups[section] = group1
+
+        section_sizes = {}
+        for mod in _iter_modules(self):
+            for wrapper in (list(mod.functions.values()) + mod.classes + mod.containers
+                            + mod.exceptions + mod.enums):
+                section = _get_wrapper_section(wrapper)
+                section_sizes[section] = section_sizes.get(section, 0) + 1
+                dependencies = list(getattr(wrapper, 'bases', []))
+                if getattr(wrapper, 'outer_class', None) is not None:
+                    dependencies.append(wrapper.outer_class)
+                merge_sections(section, section)
+                for dependency in dependencies:
+                    merge_sections(section, _get_wrapper_section(dependency))
+
+        groups = []
+        for group in section_groups.values():
+            if None not in group and group not in groups:
+                groups.append(group)
+        if not groups:
+            return None
+
+        ## distribute the section groups among the workers, biggest first
+        groups = sorted([sorted(group) for group in groups])
+        batches = utils.balance_bins([(group, sum([section_sizes[section] for section in group]))
+                                      for group in groups], min(jobs, len(groups)))
+        batches = [sum(batch, []) for batch in batches]
+
+        _parallel_generation = (self, module_file_base_name)
+        try:
+            pool = fork_context.Pool(len(batches), maxtasksperchild=1)
+            try:
+                results = pool.map(_generate_sections_in_worker, batches, 1)
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            _parallel_generation = None
+
+        records = {}
+        for result in results:
+            records.update(result)
+        return records
+
     def get_python_to_c_type_converter_function_name(self, value_type):
         """
         Internal API, do not use.
@@ -47,6 +47,78 @@ def vector_counter(vec):
             raise StopIteration
         yield list(values)
 
+## Cheap checks used by the overload dispatcher, for each
+## PyArg_ParseTuple format unit.  A check only needs to be a necessary
+## condition for the format unit to accept the object (false positives
+## are fine, the delegate wrapper is called and does the full parsing).
+_INT_CHECK = "(PyLong_Check(%(obj)s) || (!PyFloat_Check(%(obj)s) && PyNumber_Check(%(obj)s)))"
+_FLOAT_CHECK = "(PyFloat_Check(%(obj)s) || PyNumber_Check(%(obj)s))"
+_FORMAT_UNIT_CHECKS = {
+    'b': _INT_CHECK, 'B': _INT_CHECK, 'h': _INT_CHECK, 'H': _INT_CHECK,
+    'i': _INT_CHECK, 'I': _INT_CHECK, 'l': _INT_CHECK, 'k': _INT_CHECK,
+    'L': _INT_CHECK, 'K': _INT_CHECK, 'n': _INT_CHECK,
+    'f': _FLOAT_CHECK, 'd': _FLOAT_CHECK,
+    's': "(PyUnicode_Check(%(obj)s) || PyBytes_Check(%(obj)s))",
+    's#': "(PyUnicode_Check(%(obj)s) || PyObject_CheckBuffer(%(obj)s))",
+    'et': "(PyUnicode_Check(%(obj)s) || PyBytes_Check(%(obj)s) || PyByteArray_Check(%(obj)s))",
+    'O!': "PyObject_TypeCheck(%(obj)s, %(type)s)",
+}
+
+
+def get_parse_params_check(parse_params):
+    """
+    Returns a C boolean expression that is false when the arguments
+    (args, kwargs, nargs, nkwargs) can certainly not be parsed by a
+    PyArg_ParseTupleAndKeywords call with the given parameters.
+
+    :param parse_params: a ParseTupleParameters object
+
+    >>> from pybindgen.typehandlers.base import ParseTupleParameters
+    >>> params = ParseTupleParameters()
+    >>> params.add_parameter('d', ['&x'], 'x')
+    1
+    >>> params.add_parameter('O!', ['&PyFoo_Type', '&foo'], 'foo', optional=True)
+    2
+    >>> print(get_parse_params_check(params))
+    nargs + nkwargs >= 1 && nargs + nkwargs <= 2
+        && (nkwargs == 0 || nkwargs == (PyDict_GetItemString(kwargs, "x") != NULL) + (PyDict_GetItemString(kwargs, "foo") != NULL))
+        && (nargs <= 0 || (PyFloat_Check(PyTuple_GET_ITEM(args, 0)) || PyNumber_Check(PyTuple_GET_ITEM(args, 0))))
+        && (nargs <= 1 || PyObject_TypeCheck(PyTuple_GET_ITEM(args, 1), &PyFoo_Type))
+    """
+    min_args = 0
+    max_args = 0
+    checks = []
+    for (template, values, dummy_name, optional) in parse_params._parse_tuple_items:
+        if not template:
+            continue
+        try:
+            check = _FORMAT_UNIT_CHECKS[template]
+        except KeyError:
+            pass
+        else:
+            obj = "PyTuple_GET_ITEM(args, %i)" % max_args
+            check = check % dict(obj=obj, type=values[0])
+            checks.append("(nargs <= %i || %s)" % (max_args, check))
+        max_args += 1
+        if not optional:
+            min_args = max_args
+
+    keywords = parse_params.get_keywords() or []
+    if min_args == max_args:
+        conditions = ["nargs + nkwargs == %i" % max_args]
+    else:
+        conditions = ["nargs + nkwargs >= %i && nargs + nkwargs <= %i" % (min_args, max_args)]
+    if not max_args:
+        pass
+    elif keywords:
+        conditions.append("(nkwargs == 0 || nkwargs == %s)" % ' + '.join(
+                ['(PyDict_GetItemString(kwargs, "%s") != NULL)' % kw for kw in keywords]))
+    else:
+        conditions.append("nkwargs == 0")
+    conditions.extend(checks)
+    return '\n    && '.join(conditions)
+
+
 class OverloadedWrapper(object):
     """
     An object that aggregates a set of wrapper objects; it generates
@@ -95,36 +167,29 @@ class OverloadedWrapper(object):
         for wrapper in self.wrappers:
             wrapper.force_parse = ForwardWrapperBase.PARSE_TUPLE_AND_KEYWORDS
 
-        # loop that keeps removing wrappers until all remaining wrappers have the same flags
-        modified = True
-        while modified:
-            existing_flags = None
-            modified = False
-            for wrapper in self.wrappers:
-                try:
-                    wrapper_flags = utils.call_with_error_handling(
-                        wrapper.get_py_method_def_flags, args=(), kwargs={}, wrapper=wrapper)
-                except utils.SkipWrapper:
-                    _, ex, tb = sys.exc_info()
-                    modified = True
-                    self.wrappers.remove(wrapper)
-                    settings.error_handler.handle_error(wrapper, ex, tb)
-                    break
-
-                wrapper_flags = set(wrapper_flags)
-                if existing_flags is None:
-                    existing_flags = wrapper_flags
-                else:
-                    if wrapper_flags != existing_flags:
-                        modified = True
-                        self.wrappers.remove(wrapper)
-                        tb = traceback.extract_stack()
-                        ex = utils.SkipWrapper(
-                            "overloading: removed the wrapper %s because its"
-                            " method flags are different from existing ones."
-                            % (wrapper,))
-                        settings.error_handler.handle_error(wrapper, ex, tb)
-                        break
+        # remove the wrappers whose flags differ from the first one's
+        existing_flags = None
+        for wrapper in list(self.wrappers):
+            try:
+                wrapper_flags = utils.call_with_error_handling(
+                    wrapper.get_py_method_def_flags, args=(), kwargs={}, wrapper=wrapper)
+            except utils.SkipWrapper:
+                _, ex, tb = sys.exc_info()
+                self.wrappers.remove(wrapper)
+                settings.error_handler.handle_error(wrapper, ex, tb)
+                continue
+
+            wrapper_flags = set(wrapper_flags)
+            if existing_flags is None:
+                existing_flags = wrapper_flags
+            elif wrapper_flags != existing_flags:
+                self.wrappers.remove(wrapper)
+                tb = traceback.extract_stack()
+                ex = utils.SkipWrapper(
+                    "overloading: removed the wrapper %s because its"
+                    " method flags are different from existing ones."
+                    % (wrapper,))
+                settings.error_handler.handle_error(wrapper, ex, tb)
 
     def _compute_all_wrappers(self):
         """
@@ -164,6 +229,7 @@ class OverloadedWrapper(object):
             ## Generate the individual "low level" wrappers that handle a single prototype
             self.wrapper_actual_name = self.all_wrappers[0].wrapper_base_name
             delegate_wrappers = []
+            dispatch_checks = []
             for number, wrapper in enumerate(self.all_wrappers):
                 ## enforce uniform method flags
                 wrapper.force_parse = wrapper.PARSE_TUPLE_AND_KEYWORDS
@@ -190,7 +256,13 @@ class OverloadedWrapper(object):
                 except utils.SkipWrapper:
                     continue
 
+                if getattr(wrapper, 'NEEDS_OVERLOADING_INTERFACE', False):
+                    ## custom wrappers parse the arguments themselves
+                    dispatch_check = None
+                else:
+                    dispatch_check = get_parse_params_check(wrapper.parse_params)
                 delegate_wrappers.append(wrapper.wrapper_actual_name)
+                dispatch_checks.append(dispatch_check)
 
             ## if all wrappers did not generate, then the overload
             ## aggregator wrapper should not be generated either..
@@ -212,24 +284,44 @@ class OverloadedWrapper(object):
             code_sink.writeln(self.RETURN_TYPE + ' retval;')
             code_sink.writeln('PyObject *error_list;')
             code_sink.writeln('PyObject *exceptions[%i] = {0,};' % len(delegate_wrappers))
-            for number, delegate_wrapper in enumerate(delegate_wrappers):
-                ## call the delegate wrapper
-                args = ['self']
-                if 'METH_VARARGS' in flags:
-                    args.append('args')
-                if 'METH_KEYWORDS' in flags:
-                    args.append('kwargs')
-                args.append('&exceptions[%i]' % number)
-                code_sink.writeln("retval = %s(%s);" % (delegate_wrapper, ', '.join(args)))
-                ## if no parse exception, call was successful:
-                ## free previous exceptions and return the result
-                code_sink.writeln("if (!exceptions[%i]) {" % number)
-                code_sink.indent()
-                for i in range(number):
-                    code_sink.writeln("Py_DECREF(exceptions[%i]);" % i)
-                code_sink.writeln("return retval;")
-                code_sink.unindent()
-                code_sink.writeln("}")
+            args = ['self']
+            if 'METH_VARARGS' in flags:
+                args.append('args')
+            if 'METH_KEYWORDS' in flags:
+                args.append('kwargs')
+            type_dispatch = (settings.overload_type_dispatch
+                             and 'METH_VARARGS' in flags and 'METH_KEYWORDS' in flags)
+            if type_dispatch:
+                code_sink.writeln('Py_ssize_t nargs = PyTuple_GET_SIZE(args);')
+                code_sink.writeln('Py_ssize_t nkwargs = (kwargs == NULL ? 0 : PyDict_Size(kwargs));')
+            for number, (delegate_wrapper, dispatch_check) \
+                    in enumerate(zip(delegate_wrappers, dispatch_checks)):
+                if type_dispatch and dispatch_check is not None:
+                    ## only call the delegate wrapper if its signature
+                    ## can accept the given arguments
+                    code_sink.writeln("if (%s) {" % dispatch_check)
+                    code_sink.indent()
+                    self._write_delegate_call(code_sink, number, len(delegate_wrappers),
+                                              delegate_wrapper, args, type_dispatch)
+                    code_sink.unindent()
+                    code_sink.writeln("}")
+                else:
+                    self._write_delegate_call(code_sink, number, len(delegate_wrappers),
+                                              delegate_wrapper, args, type_dispatch)
+            if type_dispatch:
+                ## no candidate accepted the arguments: call the
+                ## delegate wrappers that were skipped, in order, to
+                ## collect their parse errors
+                for number, (delegate_wrapper, dispatch_check) \
+                        in enumerate(zip(delegate_wrappers, dispatch_checks)):
+                    if dispatch_check is None:
+                        continue
+                    code_sink.writeln("if (!exceptions[%i]) {" % number)
+                    code_sink.indent()
+                    self._write_delegate_call(code_sink, number, len(delegate_wrappers),
+                                              delegate_wrapper, args, type_dispatch)
+                    code_sink.unindent()
+                    code_sink.writeln("}")
 
             ## If the following generated code is reached it means
             ## that all of our delegate wrappers had parsing errors:
@@ -249,6 +341,30 @@ class OverloadedWrapper(object):
 
         return prototype_line
 
+    def _write_delegate_call(self, code_sink, number, num_delegates, delegate_wrapper, args, type_dispatch):
+        """
+        Writes the code that calls the delegate wrapper number
+        'number' and returns its result if the delegate was able to
+        parse the arguments.
+        """
+        code_sink.writeln("retval = %s(%s);" % (delegate_wrapper, ', '.join(args + ['&exceptions[%i]' % number])))
+        ## if no parse exception, call was successful:
+        ## free previous exceptions and return the result
+        code_sink.writeln("if (!exceptions[%i]) {" % number)
+        code_sink.indent()
+        if type_dispatch:
+            ## delegates may have been called out of order, free any
+            ## exception that was returned
+            for i in range(num_delegates):
+                if i != number:
+                    code_sink.writeln("Py_XDECREF(exceptions[%i]);" % i)
+        else:
+            for i in range(number):
+                code_sink.writeln("Py_DECREF(exceptions[%i]);" % i)
+        code_sink.writeln("return retval;")
+        code_sink.unindent()
+        code_sink.writeln("}")
+
     def get_py_method_def(self, name):
         """
         Returns an array element to use in a PyMethodDef table.
@@ -293,9 +409,12 @@ class OverloadedWrapper(object):
                  (docstring is None and "NULL" or ('"'+docstring+'"')))
 
     def generate_declaration(self, code_sink):
-        self.reset_code_generation_state()
-        self._compute_all_wrappers()
-        self.generate(NullCodeSink())
+        ## the prototype is already known if generate() was called
+        ## before, no need to fake generate the code again
+        if self.wrapper_return is None:
+            self.reset_code_generation_state()
+            self._compute_all_wrappers()
+            self.generate(NullCodeSink())
         assert isinstance(self.wrapper_return, string_types)
         assert isinstance(self.wrapper_actual_name, string_types)
         assert isinstance(self.wrapper_args, list)
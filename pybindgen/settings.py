@@ -1,6 +1,6 @@
 # pylint: disable-msg=W0105
 
-from pybindgen.wrapper_registry import NullWrapperRegistry, StdMapWrapperRegistry
+from pybindgen.wrapper_registry import NullWrapperRegistry, StdMapWrapperRegistry, HashTableWrapperRegistry
 
 """
 
@@ -69,6 +69,40 @@ deprecated_virtuals to False.
 """
 
 
+overload_type_dispatch = False
+"""
+If True, the wrapper generated for overloaded functions, methods and
+constructors first checks the number of arguments, the keyword names
+and the types of the positional arguments (using cheap checks like
+PyLong_Check or PyFloat_Check) against each overload, and only calls
+the overloads that can possibly accept the arguments.  The full
+'try each overload in turn' code, which collects the parse error of
+every overload, only runs when none of the candidates matched.
+"""
+
+
+fastcall_wrappers = False
+"""
+If True, and min_python_version is at least (3, 7), function and
+method wrappers are generated with the METH_FASTCALL|METH_KEYWORDS
+calling convention whenever all their parameters can be converted
+directly, avoiding the creation of an arguments tuple and the parsing
+of a PyArg_ParseTupleAndKeywords format string on each call.
+Constructors, overloaded wrappers and special methods (__xxx__)
+keep using the METH_VARARGS calling convention.
+"""
+
+
+fast_type_checks = False
+"""
+If True, the generated code checks whether python objects are
+instances of wrapped types by comparing their type (or checking for
+a subtype) directly, instead of calling PyObject_IsInstance, which
+also honours __instancecheck__ and __class__ overrides but is much
+slower.
+"""
+
+
 gcc_rtti_abi_complete = True
 """
 If True, and GCC >= 3 is detected at compile time, pybindgen will try
@@ -595,6 +595,34 @@ class ReverseWrapperBase(object):
         self.before_call.add_cleanup_code('if (PyEval_ThreadsInitialized())\n'
                                           '    PyGILState_Release(%s);' % gil_state_var)
 
+    def _write_parse_value(self):
+        """
+        Writes the code (into self.before_call) that converts the
+        'value' python object according to self.parse_params, for
+        wrappers that receive a single python value (attribute
+        setters, converter functions).  A single scalar, string or
+        wrapped object value is converted directly; otherwise the
+        value is packed into a tuple and parsed with PyArg_ParseTuple.
+        """
+        items = [item for item in self.parse_params._parse_tuple_items if item[0]]
+        if len(items) == 1 and not items[0][3] and items[0][0] in FASTCALL_FORMAT_UNITS \
+                and direct_conversion_supported(items[0][0]):
+            template, param_values, dummy, dummy = items[0]
+            FASTCALL_FORMAT_UNITS[template](self, self.before_call, 'value', 0, param_values)
+            return
+
+        py_value = self.declarations.declare_variable('PyObject*', 'py_retval')
+        self.before_call.write_code(
+            '%s = Py_BuildValue((char *) "(O)", value);' % py_value)
+        self.before_call.add_cleanup_code('Py_DECREF(%s);' % py_value)
+        parse_tuple_params = [py_value]
+        params = self.parse_params.get_parameters()
+        assert params[0][0] == '"'
+        params[0] = '(char *) ' + params[0]
+        parse_tuple_params.extend(params)
+        self.before_call.write_error_check('!PyArg_ParseTuple(%s)' %
+                                           (', '.join(parse_tuple_params),))
+
 
     def generate_python_call(self):
         """Generates the code (into self.before_call) to call into
@@ -773,6 +801,7 @@ class ForwardWrapperBase(object):
         self.call_params = []
         self.force_parse = force_parse
         self.meth_flags = []
+        self._py_method_def_flags = None # (key, flags) of the last generate_body()
         self.unblock_threads = unblock_threads
         self.no_c_retval = no_c_retval
         self.overload_index = None
@@ -797,6 +826,8 @@ class ForwardWrapperBase(object):
 
         self.declarations.reserve_variable('args')
         self.declarations.reserve_variable('kwargs')
+        self.declarations.reserve_variable('nargs')
+        self.declarations.reserve_variable('kwnames')
 
     def reset_code_generation_state(self):
         self.declarations.clear()
@@ -899,7 +930,13 @@ class ForwardWrapperBase(object):
         params_empty = (params == ['""'])
         params[0] = '(char *) ' + params[0]
         keywords = self.parse_params.get_keywords()
-        if not params_empty or self.force_parse != None:
+        if not params_empty and self.force_parse is None and self._use_fastcall() \
+                and all([template in FASTCALL_FORMAT_UNITS
+                         for template, dummy, dummy, dummy in self.parse_params._parse_tuple_items]):
+            self._write_fastcall_parse(keywords)
+            self.meth_flags.append("METH_FASTCALL")
+            self.meth_flags.append("METH_KEYWORDS")
+        elif not params_empty or self.force_parse != None:
             self.meth_flags.append("METH_VARARGS")
             if keywords is None \
                     and self.force_parse != self.PARSE_TUPLE_AND_KEYWORDS:
@@ -940,22 +977,15 @@ class ForwardWrapperBase(object):
                         % (self.return_value.ctype,))
 
             self._before_return_hook()
-
-            params = self.build_params.get_parameters()
-            if params:
-                if params == ['""']:
-                    self.after_call.write_code('Py_INCREF(Py_None);')
-                    self.after_call.write_code('py_retval = Py_None;')
-                else:
-                    assert params[0][0] == '"'
-                    params[0] = "(char *) " + params[0]
-                    self.after_call.write_code('py_retval = Py_BuildValue(%s);' %
-                                               (', '.join(params),))
+            self._write_build_value()
 
             ## cleanup and return
             self.after_call.write_cleanup()
             self.after_call.write_code('return py_retval;')
 
+        self._py_method_def_flags = (self._get_py_method_def_flags_key(),
+                                     list(set(self.meth_flags)))
+
         ## now write out the wrapper function body itself
         self.declarations.get_code_sink().flush_to(code_sink)
         code_sink.writeln()
@@ -963,28 +993,319 @@ class ForwardWrapperBase(object):
         self.before_call.sink.flush_to(code_sink)
         self.after_call.sink.flush_to(code_sink)
 
+    def _write_build_value(self):
+        """
+        Writes into self.after_call the code that builds the
+        'py_retval' python object from the build_params.  Subclasses
+        may override it to build simple values directly.
+        """
+        params = self.build_params.get_parameters()
+        if params:
+            if params == ['""']:
+                self.after_call.write_code('Py_INCREF(Py_None);')
+                self.after_call.write_code('py_retval = Py_None;')
+            else:
+                assert params[0][0] == '"'
+                params[0] = "(char *) " + params[0]
+                self.after_call.write_code('py_retval = Py_BuildValue(%s);' %
+                                           (', '.join(params),))
+
+    def _write_single_build_value(self):
+        """
+        Like _write_build_value, for wrappers that return a single
+        python value (attribute getters, converter functions), but
+        builds single scalar, string and wrapped object values
+        directly, without interpreting a Py_BuildValue format string.
+        """
+        items = self.build_params._build_value_items
+        if len(items) == 1 and items[0][0] in BUILD_VALUE_UNITS \
+                and direct_conversion_supported(items[0][0]):
+            template, values, dummy = items[0]
+            BUILD_VALUE_UNITS[template](self, values)
+        else:
+            ForwardWrapperBase._write_build_value(self)
+
+    def _use_fastcall(self):
+        """
+        Returns True if the wrapper may be generated with the
+        METH_FASTCALL calling convention, i.e. receiving the arguments
+        as a C array instead of a tuple.  Subclasses that support it
+        should override this method.
+        """
+        return False
+
+    def _write_fastcall_parse(self, keywords):
+        """
+        Writes into self.before_parse the code that converts the
+        arguments of a METH_FASTCALL|METH_KEYWORDS wrapper (args,
+        nargs, kwnames), doing the same job as PyArg_ParseTupleAndKeywords
+        would do for the parameters in self.parse_params but without
+        requiring an arguments tuple nor a format string.
+        """
+        items = [item for item in self.parse_params._parse_tuple_items if item[0]]
+        if keywords is None:
+            keywords = []
+        num_args = len(items)
+        py_args = self.declarations.declare_variable(
+            'PyObject *', 'py_args', '{' + ', '.join(['NULL']*num_args) + '}', '[%i]' % num_args)
+        arg_index = self.declarations.declare_variable('Py_ssize_t', 'arg_index')
+
+        self.before_parse.write_error_check(
+            'nargs > %i' % num_args,
+            'PyErr_Format(PyExc_TypeError, "function takes at most %i arguments (%%zd given)", nargs);'
+            % num_args)
+        self.before_parse.write_code('for (%s = 0; %s < nargs; %s++) {' % (arg_index, arg_index, arg_index))
+        self.before_parse.write_code('    %s[%s] = args[%s];' % (py_args, arg_index, arg_index))
+        self.before_parse.write_code('}')
+
+        ## match the keyword arguments against the parameter names
+        self.before_parse.write_code('if (kwnames != NULL) {')
+        self.before_parse.indent()
+        if keywords:
+            keywords_var = self.declarations.declare_variable(
+                'const char *', 'keywords',
+                '{' + ', '.join(['"%s"' % kw for kw in keywords] + ['NULL']) + '}',
+                '[]')
+            kw_index = self.declarations.declare_variable('Py_ssize_t', 'kw_index')
+            self.before_parse.write_code('for (%s = 0; %s < PyTuple_GET_SIZE(kwnames); %s++) {'
+                                         % (kw_index, kw_index, kw_index))
+            self.before_parse.indent()
+            self.before_parse.write_code('PyObject *kwname = PyTuple_GET_ITEM(kwnames, %s);' % kw_index)
+            self.before_parse.write_code('for (%s = 0; %s[%s] != NULL; %s++) {'
+                                         % (arg_index, keywords_var, arg_index, arg_index))
+            self.before_parse.write_code('    if (PyUnicode_CompareWithASCIIString(kwname, %s[%s]) == 0) {'
+                                         % (keywords_var, arg_index))
+            self.before_parse.write_code('        break;')
+            self.before_parse.write_code('    }')
+            self.before_parse.write_code('}')
+            self.before_parse.write_error_check(
+                '%s[%s] == NULL' % (keywords_var, arg_index),
+                'PyErr_Format(PyExc_TypeError, "\'%U\' is an invalid keyword argument for this function", kwname);')
+            self.before_parse.write_error_check(
+                '%s[%s] != NULL' % (py_args, arg_index),
+                'PyErr_Format(PyExc_TypeError, "argument for function given by name (\'%%U\') and position (%%zd)", kwname, %s + 1);'
+                % (arg_index,))
+            self.before_parse.write_code('%s[%s] = args[nargs + %s];' % (py_args, arg_index, kw_index))
+            self.before_parse.unindent()
+            self.before_parse.write_code('}')
+        else:
+            self.before_parse.write_error_check(
+                'PyTuple_GET_SIZE(kwnames) > 0',
+                'PyErr_SetString(PyExc_TypeError, "function takes no keyword arguments");')
+        self.before_parse.unindent()
+        self.before_parse.write_code('}')
+
+        ## convert each argument
+        for position, (template, param_values, param_name, optional) in enumerate(items):
+            py_arg = '%s[%i]' % (py_args, position)
+            if optional:
+                self.before_parse.write_code('if (%s != NULL) {' % py_arg)
+                self.before_parse.indent()
+            else:
+                if param_name is None:
+                    description = "(pos %i)" % (position + 1,)
+                else:
+                    description = "'%s' (pos %i)" % (param_name, position + 1)
+                self.before_parse.write_error_check(
+                    '%s == NULL' % py_arg,
+                    'PyErr_SetString(PyExc_TypeError, "function missing required argument %s");'
+                    % description)
+            FASTCALL_FORMAT_UNITS[template](self, self.before_parse, py_arg, position, param_values)
+            if optional:
+                self.before_parse.unindent()
+                self.before_parse.write_code('}')
+
+    def _get_py_method_def_flags_key(self):
+        """
+        Returns a value that changes whenever the PyMethodDef flags
+        computed by generate_body() may change.
+        """
+        return (self.force_parse, self._use_fastcall(), tuple(self.parameters))
+
     def get_py_method_def_flags(self):
         """
         Get a list of PyMethodDef flags that should be used for this wrapper.
+
+        The flags of the last generate_body() call are reused while
+        they remain valid, otherwise the wrapper body has to be
+        generated (and thrown away) to find them out, unless
+        PyArg_ParseTupleAndKeywords parsing is being forced.
         """
         flags = set(self.meth_flags)
         if flags:
             return list(flags)
 
+        if self.force_parse == self.PARSE_TUPLE_AND_KEYWORDS:
+            return list(set(["METH_VARARGS", "METH_KEYWORDS"]))
+
+        if self._py_method_def_flags is not None:
+            key, flags = self._py_method_def_flags
+            if key == self._get_py_method_def_flags_key():
+                return list(flags)
+
         tmp_sink = codesink.NullCodeSink()
         try:
-#             try:
-#                 self.generate_body(tmp_sink)
-#             except CodegenErrorBase:
-#                 return []
-#             else:
-#                 return list(set(self.meth_flags))
             self.generate_body(tmp_sink)
             return list(set(self.meth_flags))
         finally:
             self.reset_code_generation_state()
 
 
+def _write_fastcall_int(c_type, tmp_type, as_function, min_value=None, max_value=None):
+    def write(wrapper, code_block, py_arg, position, param_values):
+        tmp = wrapper.declarations.declare_variable(tmp_type, 'tmp_arg')
+        code_block.write_error_check(
+            'PyFloat_Check(%s)' % py_arg,
+            'PyErr_SetString(PyExc_TypeError, "integer argument expected, got float");')
+        code_block.write_error_check(
+            '(%s = %s(%s)) == (%s) -1 && PyErr_Occurred()' % (tmp, as_function, py_arg, tmp_type))
+        if min_value is not None:
+            code_block.write_error_check(
+                '%s < %s || %s > %s' % (tmp, min_value, tmp, max_value),
+                'PyErr_SetString(PyExc_OverflowError, "argument %i is out of range for %s");'
+                % (position + 1, c_type))
+        code_block.write_code('*((%s *) %s) = (%s) %s;' % (c_type, param_values[0], c_type, tmp))
+    return write
+
+def _write_fastcall_float(c_type):
+    def write(wrapper, code_block, py_arg, dummy_position, param_values):
+        tmp = wrapper.declarations.declare_variable('double', 'tmp_arg')
+        code_block.write_error_check(
+            '(%s = PyFloat_AsDouble(%s)) == -1.0 && PyErr_Occurred()' % (tmp, py_arg))
+        code_block.write_code('*((%s *) %s) = (%s) %s;' % (c_type, param_values[0], c_type, tmp))
+    return write
+
+def _write_fastcall_string(wrapper, code_block, py_arg, dummy_position, param_values):
+    tmp = wrapper.declarations.declare_variable('const char *', 'tmp_arg')
+    size = wrapper.declarations.declare_variable('Py_ssize_t', 'tmp_size')
+    code_block.write_error_check(
+        '(%s = PyUnicode_AsUTF8AndSize(%s, &%s)) == NULL' % (tmp, py_arg, size))
+    code_block.write_error_check(
+        'strlen(%s) != (size_t) %s' % (tmp, size),
+        'PyErr_SetString(PyExc_ValueError, "embedded null character");')
+    code_block.write_code('*((const char **) %s) = %s;' % (param_values[0], tmp))
+
+def _write_fastcall_string_and_size(wrapper, code_block, py_arg, dummy_position, param_values):
+    tmp = wrapper.declarations.declare_variable('const char *', 'tmp_arg')
+    code_block.write_error_check(
+        'PyUnicode_Check(%(ARG)s)'
+        ' ? (%(TMP)s = PyUnicode_AsUTF8AndSize(%(ARG)s, %(SIZE_ADDR)s)) == NULL'
+        ' : PyBytes_AsStringAndSize(%(ARG)s, (char **) &%(TMP)s, %(SIZE_ADDR)s) == -1'
+        % dict(ARG=py_arg, TMP=tmp, SIZE_ADDR=param_values[1]))
+    code_block.write_code('*((const char **) %s) = %s;' % (param_values[0], tmp))
+
+def _write_fastcall_object(wrapper, code_block, py_arg, dummy_position, param_values):
+    code_block.write_code('*((PyObject **) %s) = %s;' % (param_values[0], py_arg))
+
+def _write_fastcall_typed_object(wrapper, code_block, py_arg, position, param_values):
+    type_, address = param_values
+    code_block.write_error_check(
+        '!PyObject_TypeCheck(%s, %s)' % (py_arg, type_),
+        'PyErr_Format(PyExc_TypeError, "argument %i must be %%.50s, not %%.50s", (%s)->tp_name, Py_TYPE(%s)->tp_name);'
+        % (position + 1, type_, py_arg))
+    code_block.write_code('*((PyObject **) %s) = %s;' % (address, py_arg))
+
+def _write_fastcall_converter(wrapper, code_block, py_arg, dummy_position, param_values):
+    converter, address = param_values
+    code_block.write_error_check('!%s(%s, %s)' % (converter, py_arg, address))
+
+FASTCALL_FORMAT_UNITS = {
+    'b': _write_fastcall_int('unsigned char', 'long', 'PyLong_AsLong', '0', 'UCHAR_MAX'),
+    'h': _write_fastcall_int('short', 'long', 'PyLong_AsLong', 'SHRT_MIN', 'SHRT_MAX'),
+    'i': _write_fastcall_int('int', 'long', 'PyLong_AsLong', 'INT_MIN', 'INT_MAX'),
+    'l': _write_fastcall_int('long', 'long', 'PyLong_AsLong'),
+    'L': _write_fastcall_int('PY_LONG_LONG', 'PY_LONG_LONG', 'PyLong_AsLongLong'),
+    'B': _write_fastcall_int('unsigned char', 'unsigned long', 'PyLong_AsUnsignedLongMask'),
+    'H': _write_fastcall_int('unsigned short', 'unsigned long', 'PyLong_AsUnsignedLongMask'),
+    'I': _write_fastcall_int('unsigned int', 'unsigned long', 'PyLong_AsUnsignedLongMask'),
+    'k': _write_fastcall_int('unsigned long', 'unsigned long', 'PyLong_AsUnsignedLongMask'),
+    'K': _write_fastcall_int('unsigned PY_LONG_LONG', 'unsigned PY_LONG_LONG', 'PyLong_AsUnsignedLongLongMask'),
+    'f': _write_fastcall_float('float'),
+    'd': _write_fastcall_float('double'),
+    's': _write_fastcall_string,
+    's#': _write_fastcall_string_and_size,
+    'O': _write_fastcall_object,
+    'O!': _write_fastcall_typed_object,
+    'O&': _write_fastcall_converter,
+    '': None,
+}
+"""
+PyArg_ParseTuple format units that METH_FASTCALL wrappers (and
+attribute setters) know how to convert directly, mapped to the
+function that writes the conversion code into a code block.
+"""
+
+
+def _build_scalar(from_function):
+    def write(wrapper, values):
+        wrapper.after_call.write_code('py_retval = %s(%s);' % (from_function, values[0]))
+    return write
+
+def _build_string(wrapper, values):
+    tmp = wrapper.declarations.declare_variable('const char *', 'tmp_value')
+    wrapper.after_call.write_code('%s = %s;' % (tmp, values[0]))
+    wrapper.after_call.write_code('if (%s == NULL) {' % tmp)
+    wrapper.after_call.write_code('    Py_INCREF(Py_None);')
+    wrapper.after_call.write_code('    py_retval = Py_None;')
+    wrapper.after_call.write_code('} else {')
+    wrapper.after_call.write_code('    py_retval = PyUnicode_FromString(%s);' % tmp)
+    wrapper.after_call.write_code('}')
+
+def _build_string_and_size(wrapper, values):
+    tmp = wrapper.declarations.declare_variable('const char *', 'tmp_value')
+    wrapper.after_call.write_code('%s = %s;' % (tmp, values[0]))
+    wrapper.after_call.write_code('if (%s == NULL) {' % tmp)
+    wrapper.after_call.write_code('    Py_INCREF(Py_None);')
+    wrapper.after_call.write_code('    py_retval = Py_None;')
+    wrapper.after_call.write_code('} else {')
+    wrapper.after_call.write_code('    py_retval = PyUnicode_FromStringAndSize(%s, %s);' % (tmp, values[1]))
+    wrapper.after_call.write_code('}')
+
+def _build_new_reference(wrapper, values):
+    wrapper.after_call.write_code('py_retval = (PyObject *) %s;' % values[0])
+
+BUILD_VALUE_UNITS = {
+    'b': _build_scalar('PyLong_FromLong'),
+    'h': _build_scalar('PyLong_FromLong'),
+    'i': _build_scalar('PyLong_FromLong'),
+    'l': _build_scalar('PyLong_FromLong'),
+    'L': _build_scalar('PyLong_FromLongLong'),
+    'B': _build_scalar('PyLong_FromUnsignedLong'),
+    'H': _build_scalar('PyLong_FromUnsignedLong'),
+    'I': _build_scalar('PyLong_FromUnsignedLong'),
+    'k': _build_scalar('PyLong_FromUnsignedLong'),
+    'K': _build_scalar('PyLong_FromUnsignedLongLong'),
+    'f': _build_scalar('PyFloat_FromDouble'),
+    'd': _build_scalar('PyFloat_FromDouble'),
+    's': _build_string,
+    's#': _build_string_and_size,
+    'N': _build_new_reference,
+}
+"""
+Py_BuildValue format units that attribute getters and converter
+functions know how to convert directly, mapped to the function that
+writes the conversion code.
+"""
+
+
+def direct_conversion_supported(format_unit):
+    """
+    Returns True if a single value with the given PyArg_ParseTuple or
+    Py_BuildValue format unit may be converted directly, with the
+    conversion code of FASTCALL_FORMAT_UNITS or BUILD_VALUE_UNITS,
+    for the configured settings.min_python_version: python objects
+    always, numbers in Python 3, and strings from Python 3.3 on (they
+    need PyUnicode_AsUTF8AndSize).
+    """
+    from pybindgen import settings # not at module level, to avoid an import cycle
+    if format_unit in ('O', 'O!', 'O&', 'N'):
+        return True
+    elif format_unit in ('s', 's#'):
+        return settings.min_python_version >= (3, 3)
+    else:
+        return settings.min_python_version >= (3, 0)
+
+
 class TypeTransformation(object):
     """
     Type transformations are used to register handling of special
@@ -1356,12 +1677,20 @@ class TypeMatcher(object):
         self._transformations = []
         self._type_aliases = {}
         self._type_aliases_rev = {}
+        self._alias_classes = {} # name -> list of all names aliased to it (shared by the whole class)
+        self._alias_order = {} # name -> order in which it was first aliased
+        self._lookup_cache = {} # name -> (type_handler, transformation, traits name) or TypeLookupError
+        self.lookup_cache_hits = 0
+        self.lookup_cache_misses = 0
 
+    def _invalidate_lookup_cache(self):
+        self._lookup_cache.clear()
 
     def register_transformation(self, transformation):
         "Register a type transformation object"
         assert isinstance(transformation, TypeTransformation)
         self._transformations.append(transformation)
+        self._invalidate_lookup_cache()
 
     def register(self, name, type_handler):
         """Register a new handler class for a given C type
@@ -1374,33 +1703,20 @@ class TypeMatcher(object):
         if name in self._types:
             raise ValueError("return type %s already registered" % (name,))
         self._types[name] = type_handler
+        self._invalidate_lookup_cache()
 
     def _raw_lookup_with_alias_support(self, name):
-        already_tried = []
-        return self._raw_lookup_with_alias_support_recursive(name, already_tried)
-
-    def _raw_lookup_with_alias_support_recursive(self, name, already_tried):
         try:
             return self._types[name]
         except KeyError:
-            aliases_to_try = []
-            try:
-                aliases_to_try.append(self._type_aliases[name])
-            except KeyError:
-                pass
-            try:
-                aliases_to_try.append(self._type_aliases_rev[name])
-            except KeyError:
-                pass
-            for alias in aliases_to_try:
-                if alias in already_tried:
-                    continue
-                already_tried.append(name)
-                #if 'Time' in name or 'Time' in alias:
-                #    import sys
-                #    print >> sys.stderr, "**** trying name %r in place of %r" % (alias, name)
-                return self._raw_lookup_with_alias_support_recursive(alias, already_tried)
-            raise KeyError
+            ## try the other names of the alias equivalence class, in
+            ## the order in which they were first aliased
+            for alias in self._alias_classes.get(name, ()):
+                try:
+                    return self._types[alias]
+                except KeyError:
+                    pass
+            raise KeyError(name)
 
     def lookup(self, name):
         """
@@ -1411,13 +1727,37 @@ class TypeMatcher(object):
 
         Supports type transformations.
 
+        Results, including failures, are cached until the next
+        register(), register_transformation() or add_type_alias() call.
         """
         logger.debug("TypeMatcher.lookup(%r)", name)
+        try:
+            cached = self._lookup_cache[name]
+        except KeyError:
+            self.lookup_cache_misses += 1
+            try:
+                cached = self._lookup(name)
+            except TypeLookupError as ex:
+                cached = ex
+            self._lookup_cache[name] = cached
+        else:
+            self.lookup_cache_hits += 1
+        if isinstance(cached, TypeLookupError):
+            raise TypeLookupError(list(cached.args[0]))
+        type_handler, transformation, traits_name = cached
+        ## a fresh TypeTraits each time, because the callers may modify it
+        return type_handler, transformation, ctypeparser.TypeTraits(traits_name)
+
+    def _lookup(self, name):
+        """
+        Uncached lookup(); returns (type_handler, type_transformation,
+        name of the C type described by the type_traits)
+        """
         given_type_traits = ctypeparser.TypeTraits(name)
         noconst_name = str(given_type_traits.ctype_no_modifiers)
         tried_names = [noconst_name]
         try:
-            rv = self._raw_lookup_with_alias_support(noconst_name), None, given_type_traits
+            rv = self._raw_lookup_with_alias_support(noconst_name), None, name
         except KeyError:
             logger.debug("try to lookup type handler for %r => failure", name)
             ## Now try all the type transformations
@@ -1426,22 +1766,18 @@ class TypeMatcher(object):
                 if untransformed_name is None:
                     continue
                 untransformed_type_traits = ctypeparser.TypeTraits(untransformed_name)
-                untransformed_name = str(untransformed_type_traits.ctype_no_modifiers)
+                untransformed_noconst_name = str(untransformed_type_traits.ctype_no_modifiers)
                 try:
-                    rv = self._raw_lookup_with_alias_support(untransformed_name), transf, untransformed_type_traits
+                    rv = (self._raw_lookup_with_alias_support(untransformed_noconst_name),
+                          transf, untransformed_name)
                 except KeyError as ex:
-                    logger.debug("try to lookup type handler for %r => failure (%r)", untransformed_name, str(ex))
-                    tried_names.append(untransformed_name)
+                    logger.debug("try to lookup type handler for %r => failure (%r)", untransformed_noconst_name, str(ex))
+                    tried_names.append(untransformed_noconst_name)
                     continue
                 else:
-                    logger.debug("try to lookup type handler for %r => success (%r)", untransformed_name, rv)
+                    logger.debug("try to lookup type handler for %r => success (%r)", untransformed_noconst_name, rv)
                     return rv
             else:
-                #if 'Time' in name:
-                #    existing = [k for k in self._types.iterkeys() if 'Time' in k]
-                #    existing.sort()
-                #    raise TypeLookupError((tried_names, existing, self._type_aliases))
-                #else:
                 raise TypeLookupError(tried_names)
         else:
             logger.debug("try to lookup type handler for %r => success (%r)", name, rv)
@@ -1457,6 +1793,20 @@ class TypeMatcher(object):
         self._type_aliases[to_type_name_normalized] = from_type_name_normalized
         self._type_aliases_rev[from_type_name_normalized] = to_type_name_normalized
 
+        ## merge the equivalence classes of both names, appending the
+        ## newer class to the older one to keep the names in order
+        for name in [from_type_name_normalized, to_type_name_normalized]:
+            self._alias_order.setdefault(name, len(self._alias_order))
+        older_class = self._alias_classes.get(from_type_name_normalized, [from_type_name_normalized])
+        newer_class = self._alias_classes.get(to_type_name_normalized, [to_type_name_normalized])
+        if older_class is not newer_class:
+            if self._alias_order[newer_class[0]] < self._alias_order[older_class[0]]:
+                older_class, newer_class = newer_class, older_class
+            older_class.extend(newer_class)
+            for alias in older_class:
+                self._alias_classes[alias] = older_class
+        self._invalidate_lookup_cache()
+
 return_type_matcher = TypeMatcher()
 param_type_matcher = TypeMatcher()
 
@@ -59,6 +59,13 @@ class CodeSink(object):
         """Write one or more lines of code"""
         raise NotImplementedError
 
+    def _write_chunks(self, chunks):
+        """Write the code chunks flushed from a MemoryCodeSink, with
+        trailing whitespace removed from each line"""
+        for chunk in chunks:
+            for line in _render_chunk(chunk).split('\n'):
+                self.writeln(line.rstrip())
+
     def indent(self, level=4):
         '''Add a certain ammount of indentation to all lines written
         from now on and until unindent() is called'''
@@ -80,6 +87,25 @@ class CodeSink(object):
             self.indent_level = self.indent_stack.pop()
 
 
+def _render_chunk(chunk, indent_level=0):
+    """Formats a (indent, text, blank_indent) chunk of code lines; if
+    blank_indent is not None the lines have trailing whitespace
+    removed, and blank lines are indented by blank_indent only."""
+    indent, text, blank_indent = chunk
+    prefix = ' '*(indent_level + indent)
+    if blank_indent is None:
+        return prefix + text.replace('\n', '\n' + prefix)
+    blank_prefix = ' '*(indent_level + blank_indent)
+    lines = []
+    for line in text.split('\n'):
+        line = line.rstrip()
+        if line:
+            lines.append(prefix + line)
+        else:
+            lines.append(blank_prefix)
+    return '\n'.join(lines)
+
+
 class FileCodeSink(CodeSink):
     """A code sink that writes to a file-like object"""
     def __init__(self, file_):
@@ -94,8 +120,16 @@ class FileCodeSink(CodeSink):
 
     def writeln(self, line=''):
         """Write one or more lines of code"""
-        self.file.write('\n'.join(self._format_code(line)))
-        self.file.write('\n')
+        assert isinstance(line, string_types)
+        prefix = ' '*self.indent_level
+        self.file.write(prefix + line.replace('\n', '\n' + prefix) + '\n')
+
+    def _write_chunks(self, chunks):
+        ## write everything in a single block, rather than line by line
+        indent_level = self.indent_level
+        self.file.write(''.join([_render_chunk((indent, text, 0), indent_level) + '\n'
+                                 for indent, text, dummy_blank_indent in chunks]))
+
 
 class MemoryCodeSink(CodeSink):
     """A code sink that keeps the code in memory,
@@ -103,28 +137,34 @@ class MemoryCodeSink(CodeSink):
     def __init__(self):
         "Constructor"
         CodeSink.__init__(self)
-        self.lines = []
+        ## list of (indent, text, blank_indent) chunks; see _render_chunk
+        self.chunks = []
 
     def writeln(self, line=''):
         """Write one or more lines of code"""
-        self.lines.extend(self._format_code(line))
+        assert isinstance(line, string_types)
+        self.chunks.append((self.indent_level, line, None))
+
+    def _write_chunks(self, chunks):
+        ## splice the chunks in, nested at the current indentation level
+        indent_level = self.indent_level
+        self.chunks.extend([(indent_level + indent, text, indent_level)
+                            for indent, text, dummy_blank_indent in chunks])
 
     def flush_to(self, sink):
         """Flushes code to another code sink
         :param sink: another CodeSink instance
         """
         assert isinstance(sink, CodeSink)
-        for line in self.lines:
-            sink.writeln(line.rstrip())
-        self.lines = []
+        sink._write_chunks(self.chunks)
+        self.chunks = []
 
     def flush(self):
         "Flushes the code and returns the formatted output as a return value string"
-        l = []
-        for line in self.lines:
-            l.extend(self._format_code(line))
-        self.lines = []
-        return "\n".join(l) + '\n'
+        indent_level = self.indent_level
+        code = '\n'.join([_render_chunk(chunk, indent_level) for chunk in self.chunks]) + '\n'
+        self.chunks = []
+        return code
 
 
 class NullCodeSink(CodeSink):
@@ -9,6 +9,70 @@ except NameError:
     from sets import Set as set
 
 
+class _MemoCache(object):
+    """
+    Bounded memoization dictionary, with hit/miss counters.  Like the
+    re module cache, it is simply emptied when it grows beyond
+    max_size entries.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.data = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """Returns the cached value for key; raises KeyError on a miss"""
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
+
+    def store(self, key, value):
+        if len(self.data) >= self.max_size:
+            self.data.clear()
+        self.data[key] = value
+
+    def clear(self):
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+## Cached values are never handed out directly: parse_type returns a
+## clone of the cached CType, TypeTraits copies clones of the cached
+## CTypes.  A shallow clone is enough because only the toplevel list
+## of tokens of a CType is ever modified; the tokens and nested CTypes
+## (template and function arguments) are treated as immutable once
+## parsed.
+CACHE_MAX_SIZE = 4096
+_parse_type_cache = _MemoCache(CACHE_MAX_SIZE)
+_normalize_type_string_cache = _MemoCache(CACHE_MAX_SIZE)
+_type_traits_cache = _MemoCache(CACHE_MAX_SIZE)
+
+
+def get_cache_stats():
+    """
+    Returns a dict mapping 'parse_type', 'normalize_type_string' and
+    'TypeTraits' to the (hits, misses) counters of their caches.
+    """
+    return {
+        'parse_type': (_parse_type_cache.hits, _parse_type_cache.misses),
+        'normalize_type_string': (_normalize_type_string_cache.hits,
+                                  _normalize_type_string_cache.misses),
+        'TypeTraits': (_type_traits_cache.hits, _type_traits_cache.misses),
+        }
+
+def clear_caches():
+    """Empties the type parsing caches and resets their counters."""
+    _parse_type_cache.clear()
+    _normalize_type_string_cache.clear()
+    _type_traits_cache.clear()
+
+
 class CType(object):
     """
     A L{CType} represents a C/C++ type as a list of items.  Generally
@@ -164,10 +228,14 @@ def parse_type(type_string):
     :param type_string: C type expression
     :returns: a L{CType} object representing the type
     """
-    tokens = list(tokenizer.GetTokens(type_string + '\n'))
-    ctype, last_token = _parse_type_recursive(tokens)
-    assert last_token is None
-    return ctype
+    try:
+        ctype = _parse_type_cache.lookup(type_string)
+    except KeyError:
+        tokens = list(tokenizer.GetTokens(type_string + '\n'))
+        ctype, last_token = _parse_type_recursive(tokens)
+        assert last_token is None
+        _parse_type_cache.store(type_string, ctype)
+    return ctype.clone()
 
 def normalize_type_string(type_string):
     """
@@ -192,8 +260,12 @@ def normalize_type_string(type_string):
     >>> normalize_type_string('const std::map<std::string, void (*) (int, std::vector<zbr>) >')
     'std::map< std::string, void ( * ) ( int, std::vector< zbr > ) > const'
     """
-    ctype = parse_type(type_string)
-    return str(ctype)
+    try:
+        return _normalize_type_string_cache.lookup(type_string)
+    except KeyError:
+        normalized = str(parse_type(type_string))
+        _normalize_type_string_cache.store(type_string, normalized)
+        return normalized
 
 
 class TypeTraits(object):
@@ -303,6 +375,22 @@ class TypeTraits(object):
     """
 
     def __init__(self, ctype):
+        try:
+            cached = _type_traits_cache.lookup(ctype)
+        except KeyError:
+            self._parse(ctype)
+            cached = dict(self.__dict__)
+            for name, value in cached.items():
+                if isinstance(value, CType):
+                    cached[name] = value.clone()
+            _type_traits_cache.store(ctype, cached)
+        else:
+            for name, value in cached.items():
+                if isinstance(value, CType):
+                    value = value.clone()
+                setattr(self, name, value)
+
+    def _parse(self, ctype):
         self.ctype = parse_type(ctype)
         self.ctype_no_modifiers = self.ctype.clone()
         self.ctype_no_modifiers.remove_modifiers()
@@ -8,6 +8,7 @@ from .base import Parameter, ReturnValue, \
     DeclarationsScope, CodeBlock, NotSupportedError, ForwardWrapperBase, ReverseWrapperBase, \
     TypeConfigurationError
 
+from pybindgen import utils
 from pybindgen.cppclass import SmartPointerPolicy, CppClass, CppClassParameterBase, CppClassReturnValueBase, common_shared_object_return
 
 class BoostSharedPtr(SmartPointerPolicy):
@@ -182,8 +183,9 @@ class CppClassSharedPtrParameter(CppClassParameterBase):
 
             wrapper.before_call.write_error_check(
 
-                "%s && ((PyObject *) %s != Py_None) && !PyObject_IsInstance((PyObject *) %s, (PyObject *) &%s)"
-                % (self.py_name, self.py_name, self.py_name, self.cpp_class.pytypestruct),
+                "%s && ((PyObject *) %s != Py_None) && !%s"
+                % (self.py_name, self.py_name,
+                   utils.get_type_check('(PyObject *) ' + self.py_name, '&' + self.cpp_class.pytypestruct)),
 
                 'PyErr_SetString(PyExc_TypeError, "Parameter %i must be of type %s");' % (num, self.cpp_class.name))
 
@@ -119,6 +119,7 @@ typedef void* cmpfunc;
 #define PyCObject_FromVoidPtr(a, b) PyCapsule_New(a, NULL, b)
 #define PyCObject_AsVoidPtr(a) PyCapsule_GetPointer(a, NULL)
 #define PyString_FromString(a) PyBytes_FromString(a)
+#define PyString_InternFromString(a) PyUnicode_InternFromString(a)
 #define Py_TPFLAGS_CHECKTYPES 0 /* this flag doesn't exist in python 3 */
 #endif
 ''')
@@ -141,10 +142,78 @@ typedef enum _PyBindGenWrapperFlags {
 } PyBindGenWrapperFlags;
 #endif
 
+#ifndef _PyBindGenVirtualName_defined_
+#define _PyBindGenVirtualName_defined_
+#define PYBINDGEN_VIRTUAL_NAME_CACHE_SIZE 4
+typedef struct _PyBindGenVirtualName {
+   PyObject *name; /* interned name of the python method overriding a virtual method */
+   PyTypeObject *types[PYBINDGEN_VIRTUAL_NAME_CACHE_SIZE]; /* python types found not to override it */
+   unsigned int version_tags[PYBINDGEN_VIRTUAL_NAME_CACHE_SIZE]; /* tp_version_tag of each type when it was checked */
+   unsigned int next; /* entry replaced when a new type is cached */
+} PyBindGenVirtualName;
+
+/* true if 'type' was found not to override the method and has not been modified since */
+Py_LOCAL_INLINE(int)
+PyBindGenVirtualName_IsCached(PyBindGenVirtualName *vname, PyTypeObject *type)
+{
+    int i;
+    if (!PyType_HasFeature(type, Py_TPFLAGS_VALID_VERSION_TAG))
+        return 0;
+    for (i = 0; i < PYBINDGEN_VIRTUAL_NAME_CACHE_SIZE; i++) {
+        if (vname->types[i] == type)
+            return vname->version_tags[i] == type->tp_version_tag;
+    }
+    return 0;
+}
+
+/* records that 'type' does not override the method */
+Py_LOCAL_INLINE(void)
+PyBindGenVirtualName_Cache(PyBindGenVirtualName *vname, PyTypeObject *type)
+{
+    int i;
+    for (i = 0; i < PYBINDGEN_VIRTUAL_NAME_CACHE_SIZE; i++) {
+        if (vname->types[i] == type)
+            break;
+    }
+    if (i == PYBINDGEN_VIRTUAL_NAME_CACHE_SIZE) {
+        i = vname->next;
+        vname->next = (vname->next + 1) % PYBINDGEN_VIRTUAL_NAME_CACHE_SIZE;
+    }
+    vname->types[i] = type;
+    vname->version_tags[i] = type->tp_version_tag;
+}
+#endif
+
+''')
+
+    if settings.fast_type_checks:
+        code_sink.writeln(r'''
+#ifndef _PyBindGen_TypeCheck_defined_
+#define _PyBindGen_TypeCheck_defined_
+Py_LOCAL_INLINE(int)
+PyBindGen_TypeCheck(PyObject *obj, PyTypeObject *type)
+{
+    return Py_TYPE(obj) == type || PyType_IsSubtype(Py_TYPE(obj), type);
+}
+#endif
 ''')
 
     
 
+def get_type_check(obj, pytypestruct):
+    """
+    Returns a C expression that is true if a python object is an
+    instance of a type.
+
+    :param obj: C expression of the python object, a PyObject*
+    :param pytypestruct: C expression of the type, a PyTypeObject*
+    """
+    if settings.fast_type_checks:
+        return "PyBindGen_TypeCheck(%s, %s)" % (obj, pytypestruct)
+    else:
+        return "PyObject_IsInstance(%s, (PyObject*) %s)" % (obj, pytypestruct)
+
+
 def mangle_name(name):
     """make a name Like<This,and,That> look Like__lt__This_and_That__gt__"""
     s = name.replace('<', '__lt__').replace('>', '__gt__').replace(',', '_')
@@ -166,6 +235,71 @@ def get_mangled_name(base_name, template_args):
         return mangle_name(base_name)
 
 
+def balance_bins(weights, num_bins):
+    """
+    Distributes items among a number of bins, so that all bins get
+    roughly the same total weight (heaviest items first, each one
+    into the currently lightest bin).
+
+    >>> balance_bins([('a', 5), ('b', 3), ('c', 3), ('d', 2)], 2)
+    [['a', 'd'], ['b', 'c']]
+
+    :param weights: list of (item, weight) pairs
+    :param num_bins: number of bins
+    :returns: a list of num_bins lists of items
+    """
+    bins = [[] for dummy in range(num_bins)]
+    bin_weights = [0]*num_bins
+    order = sorted(range(len(weights)), key=lambda index: (-weights[index][1], index))
+    for index in order:
+        item, weight = weights[index]
+        lightest = bin_weights.index(min(bin_weights))
+        bins[lightest].append(item)
+        bin_weights[lightest] += weight
+    return bins
+
+
+def balance_groups(items, get_related, get_weight, num_bins):
+    """
+    Distributes items among a number of bins like balance_bins, but
+    keeping each item in the same bin as its related items.
+
+    :param items: list of items
+    :param get_related: function returning the items that must go in
+       the same bin as the given item; those not in items are ignored
+    :param get_weight: function returning the weight of an item
+    :param num_bins: number of bins
+    :returns: a list of num_bins lists of groups, each group being a
+       list of related items
+    """
+    groups = dict([(id(item), [item]) for item in items]) # id(item) -> group
+    for item in items:
+        for other in get_related(item):
+            if id(other) not in groups or groups[id(other)] is groups[id(item)]:
+                continue
+            group = groups[id(item)]
+            other_group = groups[id(other)]
+            group.extend(other_group)
+            for member in other_group:
+                groups[id(member)] = group
+    weights = []
+    for item in items:
+        group = groups[id(item)]
+        if group[0] is item:
+            weights.append((group, sum([get_weight(member) for member in group])))
+    return balance_bins(weights, num_bins)
+
+
+def estimate_class_code_size(num_constructors, num_attributes, num_methods, num_virtual_methods):
+    """
+    Estimates the compile cost of a class wrapper, roughly in number
+    of generated C functions, used to balance the sections.
+    """
+    ## type structure functions, plus the proxy and parent caller of
+    ## each virtual method
+    return 4 + num_constructors + num_attributes + num_methods + 2*num_virtual_methods
+
+
 class SkipWrapper(Exception):
     """Exception that is raised to signal a wrapper failed to generate but
     must simply be skipped.
@@ -0,0 +1,455 @@
+"""
+Support for vectorized ("ufunc-style") wrappers of functions and
+methods taking and returning numeric scalars.
+
+A vectorized wrapper accepts, for each parameter, either a one
+dimensional buffer (PEP 3118), a sequence, or a single value, and
+calls the scalar C/C++ function once per element in a C loop.
+Single values (and sequences of length 1) are broadcast to the length
+of the other arguments.  Results are written into an output buffer,
+given by the optional 'out' keyword argument or else created as a new
+array.array object, which is returned.
+"""
+
+import sys
+PY3 = (sys.version_info[0] >= 3)
+if PY3:
+    string_types = str,
+else:
+    string_types = basestring,
+
+from pybindgen.typehandlers.base import Parameter, ReturnValue, NotSupportedError
+
+
+## C type => kind of number, one of 'f' (floating point), 'i' (signed
+## integer), or 'u' (unsigned integer)
+VECTORIZE_KINDS = {
+    'double': 'f',
+    'float': 'f',
+    'int8_t': 'i',
+    'signed char': 'i',
+    'char signed': 'i',
+    'int16_t': 'i',
+    'short': 'i',
+    'short int': 'i',
+    'int': 'i',
+    'int32_t': 'i',
+    'long': 'i',
+    'long int': 'i',
+    'signed long': 'i',
+    'signed long int': 'i',
+    'long signed': 'i',
+    'long signed int': 'i',
+    'long long': 'i',
+    'long long int': 'i',
+    'int64_t': 'i',
+    'uint8_t': 'u',
+    'unsigned char': 'u',
+    'char unsigned': 'u',
+    'uint16_t': 'u',
+    'unsigned short': 'u',
+    'unsigned short int': 'u',
+    'short unsigned int': 'u',
+    'unsigned int': 'u',
+    'uint32_t': 'u',
+    'unsigned long': 'u',
+    'unsigned long int': 'u',
+    'long unsigned': 'u',
+    'long unsigned int': 'u',
+    'unsigned long long': 'u',
+    'unsigned long long int': 'u',
+    'long long unsigned': 'u',
+    'long long unsigned int': 'u',
+    'uint64_t': 'u',
+    'size_t': 'u',
+    'std::size_t': 'u',
+}
+
+
+_HELPERS_CODE = r'''
+#ifndef PYBINDGEN_VECTORIZE_DEFINED
+#define PYBINDGEN_VECTORIZE_DEFINED
+
+typedef struct {
+    Py_buffer view;
+    PyObject *copy;
+    char *data;
+    Py_ssize_t stride;
+    Py_ssize_t len;
+} PyBindGenVectorArg;
+
+static Py_ssize_t
+PyBindGenVector_Itemsize(char typecode)
+{
+    switch (typecode) {
+    case 'b': case 'B': return sizeof(char);
+    case 'h': case 'H': return sizeof(short);
+    case 'i': case 'I': return sizeof(int);
+    case 'l': case 'L': return sizeof(long);
+    case 'q': case 'Q': return sizeof(PY_LONG_LONG);
+    case 'f': return sizeof(float);
+    case 'd': return sizeof(double);
+    default: return 0;
+    }
+}
+
+static const char *
+PyBindGenVector_Typecodes(char kind)
+{
+    return (kind == 'f' ? "fd" : (kind == 'u' ? "BHILQ" : "bhilq"));
+}
+
+static char
+PyBindGenVector_Typecode(char kind, Py_ssize_t itemsize)
+{
+    const char *typecode;
+    for (typecode = PyBindGenVector_Typecodes(kind); *typecode; typecode++) {
+        if (PyBindGenVector_Itemsize(*typecode) == itemsize) {
+            return *typecode;
+        }
+    }
+    return 0;
+}
+
+static int
+PyBindGenVector_FormatMatches(const char *format, char kind)
+{
+    if (format == NULL) {
+        format = "B";
+    }
+    if (format[0] == '@' || format[0] == '=') {
+        format++;
+    }
+    return (format[0] != 0 && format[1] == 0
+            && strchr(PyBindGenVector_Typecodes(kind), format[0]) != NULL);
+}
+
+static PyObject *
+PyBindGenVector_GetArrayType(void)
+{
+    static PyObject *array_type = NULL;
+    if (array_type == NULL) {
+        PyObject *module = PyImport_ImportModule("array");
+        if (module == NULL) {
+            return NULL;
+        }
+        array_type = PyObject_GetAttrString(module, "array");
+        Py_DECREF(module);
+    }
+    return array_type;
+}
+
+static int
+PyBindGenVector_GetBuffer(PyBindGenVectorArg *arg, PyObject *obj, char kind, Py_ssize_t itemsize, int flags)
+{
+    if (PyObject_GetBuffer(obj, &arg->view, PyBUF_STRIDES | PyBUF_FORMAT | flags) < 0) {
+        arg->view.obj = NULL;
+        return -1;
+    }
+    if (arg->view.ndim > 1 || arg->view.itemsize != itemsize
+        || !PyBindGenVector_FormatMatches(arg->view.format, kind)) {
+        PyBuffer_Release(&arg->view);
+        arg->view.obj = NULL;
+        PyErr_SetString(PyExc_TypeError, "buffer is not one-dimensional or has the wrong item type");
+        return -1;
+    }
+    arg->data = (char *) arg->view.buf;
+    if (arg->view.ndim == 0) {
+        arg->len = 1;
+        arg->stride = 0;
+    } else {
+        arg->len = arg->view.shape[0];
+        arg->stride = arg->view.strides[0];
+    }
+    return 0;
+}
+
+static PyObject *
+PyBindGenVector_NewArray(char kind, Py_ssize_t itemsize, PyObject *initializer)
+{
+    PyObject *array_type = PyBindGenVector_GetArrayType();
+    char typecode[2] = {0, 0};
+
+    if (initializer == NULL || array_type == NULL) {
+        Py_XDECREF(initializer);
+        return NULL;
+    }
+    typecode[0] = PyBindGenVector_Typecode(kind, itemsize);
+    if (typecode[0] == 0) {
+        Py_DECREF(initializer);
+        PyErr_SetString(PyExc_TypeError, "no array typecode matches the item type");
+        return NULL;
+    }
+    return PyObject_CallFunction(array_type, (char *) "sN", typecode, initializer);
+}
+
+/* Acquire an input argument: a buffer of matching item type is used
+   in place, anything else is converted to a temporary array.  When
+   obj is NULL the argument takes the single value pointed by
+   default_value. */
+static int
+PyBindGenVector_Acquire(PyBindGenVectorArg *arg, PyObject *obj, char kind, Py_ssize_t itemsize, void *default_value)
+{
+    PyObject *initializer;
+
+    arg->copy = NULL;
+    arg->view.obj = NULL;
+    if (obj == NULL) {
+        arg->data = (char *) default_value;
+        arg->len = 1;
+        arg->stride = 0;
+        return 0;
+    }
+    if (PyObject_CheckBuffer(obj)) {
+        if (PyBindGenVector_GetBuffer(arg, obj, kind, itemsize, 0) == 0) {
+            return 0;
+        }
+        PyErr_Clear();
+    }
+    if (PySequence_Check(obj)) {
+        initializer = PySequence_Tuple(obj);
+    } else {
+        initializer = PyTuple_Pack(1, obj);
+    }
+    arg->copy = PyBindGenVector_NewArray(kind, itemsize, initializer);
+    if (arg->copy == NULL) {
+        return -1;
+    }
+    if (PyBindGenVector_GetBuffer(arg, arg->copy, kind, itemsize, 0) < 0) {
+        Py_CLEAR(arg->copy);
+        return -1;
+    }
+    return 0;
+}
+
+/* Acquire the output argument: a writable buffer of matching item
+   type and length, or a new array if obj is NULL or None. */
+static int
+PyBindGenVector_AcquireOutput(PyBindGenVectorArg *arg, PyObject *obj, char kind, Py_ssize_t itemsize, Py_ssize_t size)
+{
+    arg->copy = NULL;
+    arg->view.obj = NULL;
+    if (obj == NULL || obj == Py_None) {
+        arg->copy = PyBindGenVector_NewArray(kind, itemsize, PyBytes_FromStringAndSize(NULL, size * itemsize));
+        if (arg->copy == NULL) {
+            return -1;
+        }
+        obj = arg->copy;
+    }
+    if (PyBindGenVector_GetBuffer(arg, obj, kind, itemsize, PyBUF_WRITABLE) < 0) {
+        Py_CLEAR(arg->copy);
+        return -1;
+    }
+    if (arg->len != size || arg->view.ndim != 1) {
+        PyErr_Format(PyExc_ValueError, "output buffer has length %zd, expected %zd", arg->len, size);
+        PyBuffer_Release(&arg->view);
+        Py_CLEAR(arg->copy);
+        return -1;
+    }
+    return 0;
+}
+
+/* Broadcast an argument against the loop size computed so far. */
+static int
+PyBindGenVector_Broadcast(PyBindGenVectorArg *arg, Py_ssize_t *size)
+{
+    if (arg->len == 1) {
+        arg->stride = 0;
+        return 0;
+    }
+    if (*size != 1 && arg->len != *size) {
+        PyErr_Format(PyExc_ValueError, "arguments could not be broadcast together: lengths %zd and %zd",
+                     *size, arg->len);
+        return -1;
+    }
+    *size = arg->len;
+    return 0;
+}
+
+static void
+PyBindGenVector_Release(PyBindGenVectorArg *arg)
+{
+    if (arg->view.obj != NULL) {
+        PyBuffer_Release(&arg->view);
+    }
+    Py_XDECREF(arg->copy);
+}
+
+#endif /* PYBINDGEN_VECTORIZE_DEFINED */
+'''
+
+
+def get_vectorize_kind(type_handler):
+    """
+    Returns the kind of number ('f', 'i', or 'u') of a parameter or
+    return value type handler, or None if it is not a numeric scalar
+    passed by value.
+    """
+    traits = type_handler.type_traits
+    if traits is None or traits.type_is_pointer or traits.type_is_reference:
+        return None
+    return VECTORIZE_KINDS.get(str(traits.ctype_no_const))
+
+
+def check_vectorizable(wrapper):
+    """
+    Checks that a function or method wrapper can be vectorized,
+    raising NotSupportedError if not.
+    """
+    if not wrapper.parameters:
+        raise NotSupportedError("cannot vectorize %s: it has no parameters"
+                                % (wrapper.mangled_name,))
+    for param in wrapper.parameters:
+        if param.direction != Parameter.DIRECTION_IN or get_vectorize_kind(param) is None:
+            raise NotSupportedError("cannot vectorize %s: parameter %s (%s) is not a numeric"
+                                    " input scalar" % (wrapper.mangled_name, param.name, param.ctype))
+    if wrapper.return_value.ctype != 'void' and get_vectorize_kind(wrapper.return_value) is None:
+        raise NotSupportedError("cannot vectorize %s: return value (%s) is not a numeric scalar"
+                                % (wrapper.mangled_name, wrapper.return_value.ctype))
+
+
+def get_vectorized_name(wrapper, name):
+    """
+    Returns the python name of the vectorized entry point of a wrapper
+    whose python name is `name`.
+    """
+    if isinstance(wrapper.vectorize, string_types):
+        return wrapper.vectorize
+    return '%s_vectorized' % name
+
+
+class VectorParameter(Parameter):
+    """
+    Parameter of a vectorized wrapper: receives a buffer, sequence, or
+    single value, and passes each element in turn to the scalar
+    parameter of the wrapped function.
+    """
+
+    CTYPES = []
+    DIRECTIONS = [Parameter.DIRECTION_IN]
+
+    def __init__(self, scalar_param):
+        super(VectorParameter, self).__init__(str(scalar_param.type_traits.ctype_no_const),
+                                              scalar_param.name,
+                                              default_value=scalar_param.default_value)
+        self.kind = get_vectorize_kind(scalar_param)
+
+    def convert_python_to_c(self, wrapper):
+        py_name = wrapper.declarations.declare_variable('PyObject*', 'py_' + self.name, 'NULL')
+        vector = wrapper.declarations.declare_variable('PyBindGenVectorArg', self.name + '_vector')
+        if self.default_value is None:
+            default = 'NULL'
+        else:
+            default = '&' + wrapper.declarations.declare_variable(self.ctype, self.name + '_default',
+                                                                  self.default_value)
+        wrapper.parse_params.add_parameter('O', ['&' + py_name], self.name,
+                                           optional=(self.default_value is not None))
+        wrapper.before_call.write_error_check(
+            "PyBindGenVector_Acquire(&%s, %s, '%s', sizeof(%s), %s) < 0"
+            % (vector, py_name, self.kind, self.ctype, default))
+        wrapper.before_call.add_cleanup_code('PyBindGenVector_Release(&%s);' % vector)
+        wrapper.vector_args.append(vector)
+        wrapper.call_params.append('*(%s *) (%s.data + %s * %s.stride)'
+                                   % (self.ctype, vector, wrapper.vector_index, vector))
+
+
+class VectorReturnValue(ReturnValue):
+    """
+    Return value of a vectorized wrapper: each result of the wrapped
+    function is stored in the output buffer, which is returned.
+    """
+
+    CTYPES = []
+
+    def __init__(self, scalar_return_value):
+        super(VectorReturnValue, self).__init__(str(scalar_return_value.type_traits.ctype_no_const))
+        self.kind = get_vectorize_kind(scalar_return_value)
+
+    def get_c_error_return(self):
+        return "return 0;"
+
+    def convert_c_to_python(self, wrapper):
+        wrapper.build_params.add_parameter('O', ['%s.view.obj' % wrapper.vector_output])
+
+
+def init_code_generation_state(wrapper):
+    """Declares the loop variables of a vectorized wrapper."""
+    wrapper.vector_args = []
+    wrapper.vector_output = None
+    wrapper.vector_index = wrapper.declarations.declare_variable('Py_ssize_t', 'i')
+    wrapper.vector_size = wrapper.declarations.declare_variable('Py_ssize_t', 'size', '1')
+
+
+def write_before_call(wrapper):
+    """
+    Writes, after all the vectorized parameters are acquired, the code
+    that broadcasts them to a common length and acquires the output
+    buffer.
+    """
+    for vector in wrapper.vector_args:
+        wrapper.before_call.write_error_check('PyBindGenVector_Broadcast(&%s, &%s) < 0'
+                                              % (vector, wrapper.vector_size))
+    if not isinstance(wrapper.return_value, VectorReturnValue):
+        return
+    py_out = wrapper.declarations.declare_variable('PyObject*', 'py_out', 'NULL')
+    wrapper.parse_params.add_parameter('O', ['&' + py_out], 'out', optional=True)
+    wrapper.vector_output = wrapper.declarations.declare_variable('PyBindGenVectorArg', 'out_vector')
+    wrapper.before_call.write_error_check(
+        "PyBindGenVector_AcquireOutput(&%s, %s, '%s', sizeof(%s), %s) < 0"
+        % (wrapper.vector_output, py_out, wrapper.return_value.kind,
+           wrapper.return_value.ctype, wrapper.vector_size))
+    wrapper.before_call.add_cleanup_code('PyBindGenVector_Release(&%s);' % wrapper.vector_output)
+
+
+def write_call_loop(wrapper, generate_call):
+    """
+    Writes the loop that calls the scalar function once per element;
+    generate_call writes a single call, with the result in 'retval'.
+    """
+    index = wrapper.vector_index
+    wrapper.before_call.write_code('for (%s = 0; %s < %s; %s++) {'
+                                   % (index, index, wrapper.vector_size, index))
+    wrapper.before_call.indent()
+    generate_call()
+    if isinstance(wrapper.return_value, VectorReturnValue):
+        wrapper.before_call.write_code('*(%s *) (%s.data + %s * %s.stride) = retval;'
+                                       % (wrapper.return_value.ctype, wrapper.vector_output,
+                                          index, wrapper.vector_output))
+    wrapper.before_call.unindent()
+    wrapper.before_call.write_code('}')
+
+
+def generate_docstring(wrapper, name):
+    """
+    Returns the docstring of a vectorized wrapper, which documents the
+    'out' keyword argument of the wrappers returning values.
+    """
+    names = [param.name for param in wrapper.parameters]
+    types = ["type: {0}: buffer, sequence or {1}".format(param.name, param.ctype)
+             for param in wrapper.parameters]
+    if isinstance(wrapper.return_value, VectorReturnValue):
+        names.append("out=None")
+        types.append("type: out: writable buffer of {0}, or None for a new array"
+                     .format(wrapper.return_value.ctype))
+    return "{0}({1})\\n\\n{2}".format(name, ", ".join(names), "\\n".join(types))
+
+
+def write_helpers(wrapper, code_sink):
+    """
+    Writes the C helper functions used by vectorized wrappers, once
+    per module section (compilation unit).  The section is recorded
+    as a one-time definition of the root module, which, unlike an
+    attribute of the code sink, is replayed by parallel code
+    generation.
+    """
+    owner = getattr(wrapper, 'class_', None) or wrapper
+    try:
+        owner.module.get_root().declare_one_time_definition(
+            "PyBindGenVectorize_helpers__%s" % (getattr(owner, 'section', None),))
+    except KeyError:
+        return
+    ## without multi-section output all the sections share one code sink
+    if getattr(code_sink, 'have_written_vectorize_helpers', False):
+        return
+    code_sink.writeln(_HELPERS_CODE)
+    code_sink.have_written_vectorize_helpers = True
@@ -127,3 +127,202 @@ class StdMapWrapperRegistry(WrapperRegistry):
                               "    %(MAP)s.erase(%(ITER)s);\n"
                               "}\n"
                               % dict(ITER=iterator, MAP=self.map_name, WRAPPER=wrapper_lvalue, OBJECT_VALUE=object_rvalue))
+
+
+class HashTableWrapperRegistry(WrapperRegistry):
+    """
+    A wrapper registry that uses an open addressing hash table of
+    object pointers as implementation.  The hash table is plain C
+    code, so this registry can be used when generating pure C
+    wrapping code.  It is usually faster than
+    :class:`StdMapWrapperRegistry`, and does not allocate memory for
+    each registered wrapper.
+    """
+
+    def __init__(self, base_name):
+        super(HashTableWrapperRegistry, self).__init__(base_name)
+        self.table_name = "%s_wrapper_registry" % base_name
+        self.module = None
+
+    def generate_forward_declarations(self, code_sink, module, import_from_module):
+        self.module = module
+        try:
+            module.declare_one_time_definition("WrapperHashTable")
+        except KeyError:
+            pass
+        else:
+            code_sink.writeln('''
+typedef struct {
+    void *object;
+    PyObject *wrapper;
+} PyBindGenWrapperTableEntry;
+
+typedef struct {
+    PyBindGenWrapperTableEntry *entries;
+    size_t mask; /* number of entries minus one, if entries != NULL */
+    size_t used;
+} PyBindGenWrapperTable;
+
+PyObject * PyBindGenWrapperTable_Lookup(PyBindGenWrapperTable *table, void *object);
+void PyBindGenWrapperTable_Insert(PyBindGenWrapperTable *table, void *object, PyObject *wrapper);
+void PyBindGenWrapperTable_Remove(PyBindGenWrapperTable *table, void *object);
+''')
+        if import_from_module:
+            code_sink.writeln("extern PyBindGenWrapperTable *_%s;" % self.table_name)
+            code_sink.writeln("#define %s (*_%s)" % (self.table_name, self.table_name))
+        else:
+            code_sink.writeln("extern PyBindGenWrapperTable %s;" % self.table_name)
+
+    def _generate_implementation(self, code_sink):
+        """generates the hash table functions, once per module"""
+        try:
+            self.module.declare_one_time_definition("WrapperHashTableImplementation")
+        except KeyError:
+            return
+        code_sink.writeln(r'''
+static size_t
+PyBindGenWrapperTable_Hash(void *object)
+{
+    size_t hash = ((size_t) object) >> 3;
+    hash ^= hash >> 15;
+    hash *= 2654435761u;
+    hash ^= hash >> 13;
+    return hash;
+}
+
+PyObject *
+PyBindGenWrapperTable_Lookup(PyBindGenWrapperTable *table, void *object)
+{
+    size_t index;
+    if (table->entries == NULL) {
+        return NULL;
+    }
+    index = PyBindGenWrapperTable_Hash(object) & table->mask;
+    while (table->entries[index].object != NULL) {
+        if (table->entries[index].object == object) {
+            return table->entries[index].wrapper;
+        }
+        index = (index + 1) & table->mask;
+    }
+    return NULL;
+}
+
+static void
+PyBindGenWrapperTable_Store(PyBindGenWrapperTable *table, void *object, PyObject *wrapper)
+{
+    size_t index = PyBindGenWrapperTable_Hash(object) & table->mask;
+    while (table->entries[index].object != NULL && table->entries[index].object != object) {
+        index = (index + 1) & table->mask;
+    }
+    if (table->entries[index].object == NULL) {
+        table->entries[index].object = object;
+        table->used++;
+    }
+    table->entries[index].wrapper = wrapper;
+}
+
+void
+PyBindGenWrapperTable_Insert(PyBindGenWrapperTable *table, void *object, PyObject *wrapper)
+{
+    if (object == NULL) {
+        return;
+    }
+    /* keep the load factor under 3/4 */
+    if (table->entries == NULL || (table->used + 1) * 4 > (table->mask + 1) * 3) {
+        PyBindGenWrapperTableEntry *old_entries = table->entries;
+        size_t old_size = (old_entries == NULL ? 0 : table->mask + 1);
+        size_t new_size = (old_size == 0 ? 64 : old_size * 2);
+        size_t index;
+        PyBindGenWrapperTableEntry *new_entries = (PyBindGenWrapperTableEntry *)
+            PyMem_Malloc(new_size * sizeof(PyBindGenWrapperTableEntry));
+        if (new_entries == NULL) {
+            /* out of memory: the wrapper is not registered unless a free entry remains */
+            if (old_entries != NULL && table->used < table->mask) {
+                PyBindGenWrapperTable_Store(table, object, wrapper);
+            }
+            return;
+        }
+        memset(new_entries, 0, new_size * sizeof(PyBindGenWrapperTableEntry));
+        table->entries = new_entries;
+        table->mask = new_size - 1;
+        table->used = 0;
+        for (index = 0; index < old_size; index++) {
+            if (old_entries[index].object != NULL) {
+                PyBindGenWrapperTable_Store(table, old_entries[index].object, old_entries[index].wrapper);
+            }
+        }
+        PyMem_Free(old_entries);
+    }
+    PyBindGenWrapperTable_Store(table, object, wrapper);
+}
+
+void
+PyBindGenWrapperTable_Remove(PyBindGenWrapperTable *table, void *object)
+{
+    size_t index, next, home;
+    if (table->entries == NULL || object == NULL) {
+        return;
+    }
+    index = PyBindGenWrapperTable_Hash(object) & table->mask;
+    while (table->entries[index].object != object) {
+        if (table->entries[index].object == NULL) {
+            return;
+        }
+        index = (index + 1) & table->mask;
+    }
+    /* backward shift deletion: move up entries that would no longer
+       be reachable from their home position */
+    next = index;
+    for (;;) {
+        next = (next + 1) & table->mask;
+        if (table->entries[next].object == NULL) {
+            break;
+        }
+        home = PyBindGenWrapperTable_Hash(table->entries[next].object) & table->mask;
+        if (index <= next ? (home <= index || home > next) : (home <= index && home > next)) {
+            table->entries[index] = table->entries[next];
+            index = next;
+        }
+    }
+    table->entries[index].object = NULL;
+    table->entries[index].wrapper = NULL;
+    table->used--;
+}
+''')
+
+    def generate(self, code_sink, module):
+        self._generate_implementation(code_sink)
+        code_sink.writeln("PyBindGenWrapperTable %s = {NULL, 0, 0};" % self.table_name)
+        # register the table in the module namespace
+        module.after_init.write_code("PyModule_AddObject(m, (char *) \"_%s\", PyCObject_FromVoidPtr(&%s, NULL));"
+                                     % (self.table_name, self.table_name))
+
+    def generate_import(self, code_sink, code_block, module_pyobj_var):
+        self._generate_implementation(code_sink)
+        code_sink.writeln("PyBindGenWrapperTable *_%s;" % self.table_name)
+        code_block.write_code("PyObject *_cobj = PyObject_GetAttrString(%s, (char*) \"_%s\");"
+                              % (module_pyobj_var, self.table_name))
+        code_block.write_code("if (_cobj == NULL) {\n"
+                              "    _%(TABLE)s = (PyBindGenWrapperTable *) PyMem_Malloc(sizeof(PyBindGenWrapperTable));\n"
+                              "    _%(TABLE)s->entries = NULL;\n"
+                              "    _%(TABLE)s->mask = 0;\n"
+                              "    _%(TABLE)s->used = 0;\n"
+                              "    PyErr_Clear();\n"
+                              "} else {\n"
+                              "    _%(TABLE)s = (PyBindGenWrapperTable *) PyCObject_AsVoidPtr (_cobj);\n"
+                              "    Py_DECREF(_cobj);\n"
+                              "}"
+                              % dict(TABLE=self.table_name))
+
+    def write_register_new_wrapper(self, code_block, wrapper_lvalue, object_rvalue):
+        code_block.write_code("PyBindGenWrapperTable_Insert(&%s, (void *) %s, (PyObject *) %s);"
+                              % (self.table_name, object_rvalue, wrapper_lvalue))
+
+    def write_lookup_wrapper(self, code_block, wrapper_type, wrapper_lvalue, object_rvalue):
+        code_block.write_code("%(WRAPPER)s = (%(TYPE)s *) PyBindGenWrapperTable_Lookup(&%(TABLE)s, (void *) %(OBJECT)s);\n"
+                              "Py_XINCREF(%(WRAPPER)s);"
+                              % dict(WRAPPER=wrapper_lvalue, TYPE=wrapper_type, TABLE=self.table_name,
+                                     OBJECT=object_rvalue))
+
+    def write_unregister_wrapper(self, code_block, wrapper_lvalue, object_rvalue):
+        code_block.write_code("PyBindGenWrapperTable_Remove(&%s, (void *) %s);" % (self.table_name, object_rvalue))
@@ -204,6 +204,11 @@ SomeObject * set_foobar_with_return_as_custodian(Foobar *foobar)
     return some;
 }
 
+bool set_foobar_with_optional_custodian(Foobar *foobar, SomeObject *other)
+{
+    return other != NULL;
+}
+
 std::string some_object_get_something_prefixed(const SomeObject *obj, const std::string something)
 {
     return obj->get_prefix() + something;
@@ -322,6 +327,22 @@ int set_simple_list (SimpleStructList list)
     return count;
 }
 
+std::vector<double> get_double_vec (int size)
+{
+    std::vector<double> retval;
+    for (int i = 0; i < size; i++)
+        retval.push_back(i*0.5);
+    return retval;
+}
+
+double sum_double_vec (std::vector<double> vec)
+{
+    double sum = 0;
+    for (std::vector<double>::iterator iter = vec.begin(); iter != vec.end(); iter++)
+        sum += *iter;
+    return sum;
+}
+
 
 SimpleStructList
 TestContainer::get_simple_list ()
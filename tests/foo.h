@@ -539,6 +539,8 @@ Foobar* create_new_foobar();
 void set_foobar_with_other_as_custodian(Foobar *foobar, SomeObject *other);
 // -#- @foobar(custodian=-1, transfer_ownership=true); @return(caller_owns_return=true) -#-
 SomeObject * set_foobar_with_return_as_custodian(Foobar *foobar);
+// -#- @foobar(custodian=2, transfer_ownership=false); @other(transfer_ownership=false, null_ok=true, default_value=NULL) -#-
+bool set_foobar_with_optional_custodian(Foobar *foobar, SomeObject *other = NULL);
 
 class SingletonClass
 // -#- is_singleton=true -#-
@@ -811,6 +813,9 @@ typedef std::map<std::string, simple_struct_t> SimpleStructMap;
 SimpleStructList get_simple_list ();
 int set_simple_list (SimpleStructList list);
 
+std::vector<double> get_double_vec (int size);
+double sum_double_vec (std::vector<double> vec);
+
 class TestContainer
 {
 public:
@@ -860,6 +865,21 @@ std::map<std::string, int> get_map ();
 std::set<uint32_t> get_set ();
 
 
+// value type with a stricter alignment than the python allocator guarantees
+struct
+#ifdef __GNUC__
+__attribute__ ((aligned (64)))
+#endif
+OverAligned
+{
+    double value;
+    OverAligned () : value (0) {}
+    OverAligned (double value_) : value (value_) {}
+    bool is_aligned () const { return ((size_t) this) % 64 == 0; }
+};
+
+inline OverAligned get_over_aligned (double value) { return OverAligned (value); }
+
 // test binary operators
 
 struct Tupl
@@ -20,6 +20,11 @@ import foomodulegen_common
 
 
 def my_module_gen(out_file):
+    mod = build_module()
+    mod.generate(FileCodeSink(out_file))
+
+
+def build_module():
 
     mod = Module('foo')
     foomodulegen_common.customize_module_pre(mod)
@@ -89,7 +94,7 @@ int %s::custom_method_added_by_a_hook(int x)
     Zbr.add_constructor([Parameter.new('std::string', 'datum')])
     Zbr.add_method('get_datum', ReturnValue.new('std::string'), [])
     Zbr.add_method('get_int', ReturnValue.new('int'), [Parameter.new('int', 'x')],
-                             is_virtual=True)
+                             is_virtual=True, vectorize=True)
     Zbr.add_static_attribute('instance_count', ReturnValue.new('int'))
     Zbr.add_method('get_value', ReturnValue.new('int'), [Parameter.new('int*', 'x', direction=Parameter.DIRECTION_OUT)])
 
@@ -112,7 +117,7 @@ int %s::custom_method_added_by_a_hook(int x)
     mod.add_function('get_int_from_float', ReturnValue.new('int'),
                      [Parameter.new('double', 'from_float'),
                       Parameter.new('int', 'multiplier', default_value='1')],
-                     custom_name="get_int")
+                     custom_name="get_int", vectorize=True)
 
 
 
@@ -240,6 +245,11 @@ int %s::custom_method_added_by_a_hook(int x)
                      [Parameter.new('Foobar*', 'foobar',
                                     transfer_ownership=True, custodian=-1)])
 
+    mod.add_function('set_foobar_with_optional_custodian', ReturnValue.new('bool'),
+                     [Parameter.new('Foobar*', 'foobar', transfer_ownership=False, custodian=2),
+                      Parameter.new('SomeObject*', 'other', transfer_ownership=False,
+                                    null_ok=True, default_value='NULL')])
+
 
     ## get/set recfcounted object Zbr
     SomeObject.add_method('get_zbr', ReturnValue.new('Zbr*', caller_owns_return=True), [])
@@ -440,6 +450,10 @@ int %s::custom_method_added_by_a_hook(int x)
 
     mod.add_container('std::set<float>', 'float', 'set')
 
+    mod.add_container('std::vector<double>', 'double', 'vector')
+    mod.add_function('get_double_vec', ReturnValue.new('std::vector<double>'), [Parameter.new('int', 'size')])
+    mod.add_function('sum_double_vec', 'double', [Parameter.new('std::vector<double>', 'vec')])
+
     TestContainer = mod.add_class('TestContainer', allow_subclassing=True)
     TestContainer.add_constructor([])
     TestContainer.add_instance_attribute('m_floatSet', 'std::set<float>')
@@ -470,7 +484,15 @@ int %s::custom_method_added_by_a_hook(int x)
     TestContainer.add_method('set_simple_map', 'int', [Parameter.new('std::map<std::string, simple_struct_t>', 'map')], is_virtual=True)
 
 
-    Tupl = mod.add_class('Tupl')
+    OverAligned = mod.add_class('OverAligned', inline_storage=True)
+    OverAligned.add_constructor([])
+    OverAligned.add_copy_constructor()
+    OverAligned.add_constructor([Parameter.new('double', 'value_')])
+    OverAligned.add_instance_attribute('value', 'double')
+    OverAligned.add_method('is_aligned', 'bool', [], is_const=True)
+    mod.add_function('get_over_aligned', 'OverAligned', [Parameter.new('double', 'value')])
+
+    Tupl = mod.add_class('Tupl', freelist_size=4, inline_storage=True, offset_accessors=True)
     Tupl.add_binary_comparison_operator('<')
     Tupl.add_binary_comparison_operator('<=')
     Tupl.add_binary_comparison_operator('>=')
@@ -479,8 +501,9 @@ int %s::custom_method_added_by_a_hook(int x)
     Tupl.add_binary_comparison_operator('!=')
     Tupl.add_binary_numeric_operator('+')
     Tupl.add_binary_numeric_operator('-')
-    Tupl.add_binary_numeric_operator('*')
-    Tupl.add_binary_numeric_operator('/')
+    ## non-const member operators
+    Tupl.add_binary_numeric_operator('*', operand_binding='reference')
+    Tupl.add_binary_numeric_operator('/', operand_binding='reference')
     Tupl.add_instance_attribute('x', 'int', is_const=False)
     Tupl.add_instance_attribute('y', 'int', is_const=False)
     Tupl.add_constructor([Parameter.new('Tupl const &', 'arg0')])
@@ -490,7 +513,7 @@ int %s::custom_method_added_by_a_hook(int x)
     Tupl.add_inplace_numeric_operator('*=')
     Tupl.add_inplace_numeric_operator('/=')
 
-    Tupl.add_unary_numeric_operator('-')
+    Tupl.add_unary_numeric_operator('-', operand_binding='copy')
 
     Tupl.add_inplace_numeric_operator('+=', right='int')
 
@@ -553,7 +576,7 @@ int %s::custom_method_added_by_a_hook(int x)
                                throw=[std_exception])
 
     mod.add_function('my_inverse_func3', 'double', [Parameter.new('double', 'x')],
-                     throw=[std_exception])
+                     throw=[std_exception], vectorize=True)
     ClassThatThrows.add_method('my_inverse_method3', 'double', [Parameter.new('double', 'x')],
                                throw=[std_exception])
 
@@ -628,9 +651,10 @@ int %s::custom_method_added_by_a_hook(int x)
     pybindgen.settings.error_handler = MyErrorHandler()
 
     foomodulegen_common.customize_module(mod)
+    foomodulegen_common.enable_fast_paths()
+    pybindgen.settings.wrapper_registry = pybindgen.settings.HashTableWrapperRegistry
 
-    ## ---- finally, generate the whole thing ----
-    mod.generate(FileCodeSink(out_file))
+    return mod
 
 
 if __name__ == '__main__':
@@ -57,6 +57,19 @@ def customize_module_pre(module):
                                           custom_name='IndexError', is_standard_error=True)
 
 
+def enable_fast_paths():
+    """
+    Enables the optional code generation fast paths, so that one
+    variant of the foo module tests them while the others keep the
+    default settings.
+    """
+    pybindgen.settings.overload_type_dispatch = True
+    pybindgen.settings.fast_type_checks = True
+    if sys.version_info >= (3, 7):
+        pybindgen.settings.min_python_version = (3, 7)
+        pybindgen.settings.fastcall_wrappers = True
+
+
 def customize_module(module):
     pybindgen.settings.wrapper_registry = pybindgen.settings.StdMapWrapperRegistry
 
@@ -4,6 +4,7 @@ import weakref
 import gc
 import os.path
 import copy
+import array
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                 '..', 'build', 'tests'))
 
@@ -103,6 +104,21 @@ class TestFoo(unittest.TestCase):
         obj.m_prefix = "World"
         self.assertEqual(obj.m_prefix, "World")
 
+    def test_set_attribute_conversion_errors(self):
+        obj = foo.SomeObject("")
+        self.assertRaises(TypeError, setattr, obj, "m_prefix", 123)
+        self.assertRaises(TypeError, delattr, obj, "m_prefix")
+        obj.m_prefix = b"bytes"
+        self.assertEqual(obj.m_prefix, "bytes")
+        self.assertRaises(TypeError, setattr, obj, "foo", "not a Foo")
+        simple = foo.simple_struct_t()
+        simple.xpto = 7
+        self.assertEqual(simple.xpto, 7)
+        self.assertRaises(TypeError, setattr, simple, "xpto", 1.5)
+        self.assertRaises(OverflowError, setattr, simple, "xpto", 2**40)
+        self.assertEqual(simple.xpto, 7)
+        self.assertRaises(TypeError, setattr, foo.SomeObject, "staticData", None)
+
     def test_static_get_attribute(self):
         self.assertEqual(foo.SomeObject.staticData, "Hello Static World!")
 
@@ -170,6 +186,14 @@ class TestFoo(unittest.TestCase):
         obj = foo.get_hidden_subclass_pointer()
         self.assertEqual(type(obj), foo.Bar)
 
+    def test_type_narrowing_lookup_cache(self):
+        """Hidden subclass lookups are resolved once, then served from cache"""
+        obj = foo.get_hidden_subclass_pointer()
+        hits, misses = foo._PyFoo__typeid_map_stats()
+        obj = foo.get_hidden_subclass_pointer()
+        self.assertEqual(type(obj), foo.Bar)
+        self.assertEqual(foo._PyFoo__typeid_map_stats(), (hits + 1, misses))
+
     def test_subclass_gc(self):
         """Check if subclassed object is garbage collected"""
 
@@ -224,6 +248,37 @@ class TestFoo(unittest.TestCase):
         t = Test("xxx")
         self.assertEqual(t.call_get_prefix(), "xxxyyy")
 
+    def test_virtual_override_cache(self):
+        class Test(foo.SomeObject):
+            pass
+
+        t = Test("xxx")
+        self.assertEqual(t.call_get_prefix(), "xxx")
+        self.assertEqual(t.call_get_prefix(), "xxx")
+        ## modifying the class must invalidate the cached lookup
+        Test.get_prefix = lambda self: "yyy"
+        self.assertEqual(t.call_get_prefix(), "yyy")
+        del Test.get_prefix
+        self.assertEqual(t.call_get_prefix(), "xxx")
+        ## ... and so must setting the method on the instance itself
+        t.get_prefix = lambda: "zzz"
+        self.assertEqual(t.call_get_prefix(), "zzz")
+        self.assertEqual(Test("xxx").call_get_prefix(), "xxx")
+
+    def test_virtual_override_cache_many_types(self):
+        ## more types than cache entries, alternating, one of them overriding
+        types = [type("Test%i" % i, (foo.SomeObject,), {}) for i in range(6)]
+        types[3].get_prefix = lambda self: "yyy"
+        for dummy in range(3):
+            for i, cls in enumerate(types):
+                expected = ("yyy" if i == 3 else "xxx")
+                self.assertEqual(cls("xxx").call_get_prefix(), expected)
+        del types[3].get_prefix
+        types[0].get_prefix = lambda self: "zzz"
+        self.assertEqual(types[0]("xxx").call_get_prefix(), "zzz")
+        self.assertEqual(types[3]("xxx").call_get_prefix(), "xxx")
+        self.assertEqual(types[1]("xxx").call_get_prefix(), "xxx")
+
 
     def test_subclassable_transfer_ptr(self):
         while gc.collect():
@@ -503,6 +558,44 @@ class TestFoo(unittest.TestCase):
         self.assertEqual(foo.Foobar.instance_count, Foobar_count1)
 
 
+    def test_custodian_function_optional_custodian(self):
+        while gc.collect():
+            pass
+        SomeObject_count_before = foo.SomeObject.instance_count
+        Foobar_count1 = foo.Foobar.instance_count
+
+        ## a missing or None custodian keeps no ward
+        foo1 = foo.create_new_foobar()
+        self.assertEqual(foo.set_foobar_with_optional_custodian(foo1), False)
+        self.assertEqual(foo.set_foobar_with_optional_custodian(foo1, None), False)
+        del foo1
+        while gc.collect():
+            pass
+        self.assertEqual(foo.Foobar.instance_count, Foobar_count1)
+
+        foo1 = foo.create_new_foobar()
+        obj1 = foo.SomeObject("xxx")
+        refcount = sys.getrefcount(foo1)
+        self.assertEqual(foo.set_foobar_with_optional_custodian(foo1, obj1), True)
+        ## adding the same ward again keeps a single reference to it
+        self.assertEqual(foo.set_foobar_with_optional_custodian(foo1, obj1), True)
+        self.assertEqual(sys.getrefcount(foo1), refcount + 1)
+        Foobar_count2 = foo.Foobar.instance_count
+
+        ## now, deleting foo1 should keep Foobar count the same, since
+        ## obj1 is keeping it alive
+        del foo1
+        while gc.collect():
+            pass
+        self.assertEqual(foo.Foobar.instance_count, Foobar_count2)
+
+        ## now deleting obj1 should cause both foo1 and obj1 to be destroyed
+        del obj1
+        while gc.collect():
+            pass
+        self.assertEqual(foo.SomeObject.instance_count, SomeObject_count_before)
+        self.assertEqual(foo.Foobar.instance_count, Foobar_count1)
+
     def test_custodian_method_param_self(self):
         while gc.collect():
             pass
@@ -838,7 +931,7 @@ class TestFoo(unittest.TestCase):
             self.assertEqual(simple.xpto, i)
             count += 1
         self.assertEqual(count, 10)
-        #self.assertEqual(len(container), 10)
+        self.assertEqual(len(container), 10)
 
         rv = foo.set_simple_list(container)
         self.assertEqual(rv, sum(range(10)))
@@ -865,6 +958,114 @@ class TestFoo(unittest.TestCase):
         rv = foo.set_simple_list(l)
         self.assertEqual(rv, sum(range(10)))
 
+    def test_container_from_iterable(self):
+        values = []
+        for i in range(5):
+            simple = foo.simple_struct_t()
+            simple.xpto = i
+            values.append(simple)
+        self.assertEqual(foo.set_simple_list(tuple(values)), sum(range(5)))
+        self.assertEqual(foo.set_simple_list(iter(values)), sum(range(5)))
+        self.assertEqual(foo.set_simple_list(v for v in values if v.xpto > 2), 7)
+
+        self.assertEqual(foo.sum_double_vec((1.5, 2.5)), 4.0)
+        self.assertEqual(foo.sum_double_vec(x / 2.0 for x in range(4)), 3.0)
+        self.assertEqual(list(foo.Std__vector__lt__double__gt__(range(3))), [0.0, 1.0, 2.0])
+        self.assertRaises(TypeError, foo.sum_double_vec, 3)
+        self.assertRaises(TypeError, foo.sum_double_vec, iter(["xpto"]))
+
+        def failing_generator():
+            yield 1.0
+            raise ValueError("stop")
+        self.assertRaises(ValueError, foo.sum_double_vec, failing_generator())
+
+        class BadHint(object):
+            def __iter__(self):
+                return iter([1.0, 2.0])
+            def __length_hint__(self):
+                return sys.maxsize
+        self.assertEqual(foo.sum_double_vec(BadHint()), 3.0)
+        self.assertRaises(TypeError, foo.Std__vector__lt__std__string__gt__, "abc")
+        self.assertEqual(list(foo.Std__vector__lt__std__string__gt__(iter(["abc"]))), ["abc"])
+
+        simple = foo.simple_struct_t()
+        simple.xpto = 5
+        mapping = foo.Std__map__lt__std__string__simple_struct_t__gt__({"a": simple, "b": simple})
+        self.assertEqual(len(mapping), 2)
+        mapping = foo.Std__map__lt__std__string__simple_struct_t__gt__((k, simple) for k in "xyz")
+        self.assertEqual(len(mapping), 3)
+        self.assertEqual(mapping["y"].xpto, 5)
+        self.assertRaises(TypeError, foo.Std__map__lt__std__string__simple_struct_t__gt__, ["a"])
+
+    def test_container_buffer_protocol(self):
+        import array
+        vec = foo.get_double_vec(5)
+        view = memoryview(vec)
+        self.assertEqual(view.format, 'd')
+        self.assertEqual(view.shape, (5,))
+        self.assertEqual(view.tolist(), [0.0, 0.5, 1.0, 1.5, 2.0])
+        view[0] = 10.0
+        self.assertEqual(list(vec), [10.0, 0.5, 1.0, 1.5, 2.0])
+        view.release()
+        self.assertEqual(len(memoryview(foo.get_double_vec(0))), 0)
+
+        self.assertEqual(foo.sum_double_vec(array.array('d', [1.5, 2.5, 3.0])), 7.0)
+        self.assertEqual(foo.sum_double_vec(memoryview(array.array('d', [0.5, 0.25]))), 0.75)
+        self.assertEqual(foo.sum_double_vec(array.array('d')), 0.0)
+        self.assertEqual(list(foo.Std__vector__lt__double__gt__(array.array('d', [4.0, 2.0]))), [4.0, 2.0])
+        ## buffers of other item types or layouts are converted item by item
+        self.assertEqual(foo.sum_double_vec(array.array('f', [1.0, 2.5])), 3.5)
+        self.assertEqual(foo.sum_double_vec(array.array('i', [1, 2])), 3.0)
+        self.assertEqual(foo.sum_double_vec(memoryview(array.array('d', [1.0, 2.0, 4.0]))[::2]), 5.0)
+        self.assertEqual(foo.sum_double_vec(bytearray(b'\x01\x02')), 3.0)
+        self.assertRaises(TypeError, foo.sum_double_vec, b'xpto')
+
+    def test_container_sequence_protocol(self):
+        vec = foo.get_double_vec(5)
+        self.assertEqual(len(vec), 5)
+        self.assertEqual(vec[1], 0.5)
+        self.assertEqual(vec[-1], 2.0)
+        self.assertRaises(IndexError, lambda: vec[5])
+        self.assertEqual(list(vec[1:4]), [0.5, 1.0, 1.5])
+        self.assertEqual(list(vec[::2]), [0.0, 1.0, 2.0])
+        vec[0] = 7.0
+        self.assertEqual(vec[0], 7.0)
+        vec[1:3] = [1.0, 2.0, 3.0]
+        self.assertEqual(list(vec), [7.0, 1.0, 2.0, 3.0, 1.5, 2.0])
+        del vec[0]
+        del vec[-2:]
+        self.assertEqual(list(vec), [1.0, 2.0, 3.0])
+        view = memoryview(vec)
+        self.assertRaises(BufferError, vec.__delitem__, 0)
+        vec[0:2] = [5.0, 6.0]
+        view.release()
+        self.assertEqual(list(vec), [5.0, 6.0, 3.0])
+
+        simple_list = foo.SimpleStructList()
+        self.assertEqual(len(simple_list), 0)
+
+    def test_container_mapping_protocol(self):
+        t = foo.TestContainer()
+        float_set = t.m_floatSet
+        self.assertEqual(len(float_set), 3)
+        self.assertTrue(2.0 in float_set)
+        self.assertFalse(5.0 in float_set)
+        self.assertFalse("xpto" in float_set)
+
+        simple = foo.simple_struct_t()
+        simple.xpto = 3
+        mapping = foo.Std__map__lt__std__string__simple_struct_t__gt__([("a", simple)])
+        self.assertEqual(len(mapping), 1)
+        self.assertTrue("a" in mapping)
+        self.assertEqual(mapping["a"].xpto, 3)
+        self.assertRaises(KeyError, lambda: mapping["b"])
+        simple.xpto = 4
+        mapping["b"] = simple
+        self.assertEqual(mapping["b"].xpto, 4)
+        del mapping["a"]
+        self.assertFalse("a" in mapping)
+        self.assertRaises(KeyError, mapping.__delitem__, "a")
+
     def test_container_reverse_wrappers(self):
         class MyTestContainer(foo.TestContainer):
             def __init__(self):
@@ -1150,6 +1351,54 @@ class TestFoo(unittest.TestCase):
         self.assertEqual(t2.x, -4)
         self.assertEqual(t2.y, -6)
 
+    def test_inline_storage(self):
+        t1 = foo.Tupl()
+        t1.x = 4
+        t1.y = 6
+        results = [t1 + t1 for dummy in range(5)]
+        t1.x = 0
+        for r in results:
+            self.assertEqual((r.x, r.y), (8, 12))
+        del results
+        t2 = -t1
+        t2.y = 1
+        self.assertEqual((t1.y, t2.x, t2.y), (6, 0, 1))
+
+    def test_inline_storage_over_aligned(self):
+        values = [foo.get_over_aligned(float(i)) for i in range(8)]
+        for i, v in enumerate(values):
+            self.assertEqual(v.value, float(i))
+            self.assertTrue(v.is_aligned())
+        copies = [copy.copy(v) for v in values]
+        self.assertTrue(all(c.is_aligned() for c in copies))
+
+    def test_offset_accessors(self):
+        t1 = foo.Tupl()
+        t1.x = -3
+        t1.y = 2**31 - 1
+        self.assertEqual((t1.x, t1.y), (-3, 2**31 - 1))
+        self.assertRaises(OverflowError, setattr, t1, "x", 2**31)
+        self.assertRaises(TypeError, setattr, t1, "x", 1.5)
+        self.assertRaises(TypeError, setattr, t1, "y", "xpto")
+        self.assertRaises(TypeError, delattr, t1, "y")
+        self.assertEqual((t1.x, t1.y), (-3, 2**31 - 1))
+
+    def test_wrapper_freelist(self):
+        foo._freelist_stats(drain=True)
+        t1 = foo.Tupl()
+        t1.x = 4
+        t1.y = 6
+        for dummy in range(10):
+            t2 = -t1
+            self.assertEqual(t2.x, -4)
+            del t2
+        count, hits, misses = foo._freelist_stats()['foo.Tupl']
+        self.assertEqual(misses, 1)
+        self.assertEqual(hits, 9)
+        self.assertEqual(count, 1)
+        foo._freelist_stats(drain=True)
+        self.assertEqual(foo._freelist_stats()['foo.Tupl'], (0, 0, 0))
+
 
     def test_int_typedef(self):
         rv = foo.xpto.get_flow_id(123)
@@ -1323,6 +1572,44 @@ class TestFoo(unittest.TestCase):
             msg = str(ex)
         self.assertEqual(msg, "value must be != 0")
 
+    def test_vectorized_function(self):
+        r = foo.get_int_vectorized([1.5, 2.5, 3.5])
+        self.assertEqual(list(r), [1, 2, 3])
+        ## single values are broadcast
+        r = foo.get_int_vectorized([1.5, 2.5, 3.5], 2)
+        self.assertEqual(list(r), [2, 4, 6])
+        r = foo.get_int_vectorized(2.0, multiplier=[1, 2, 3])
+        self.assertEqual(list(r), [2, 4, 6])
+        self.assertRaises(ValueError, foo.get_int_vectorized, [1.0, 2.0], [1, 2, 3])
+        self.assertRaises(TypeError, foo.get_int_vectorized, ["x"])
+
+    def test_vectorized_function_buffers(self):
+        x = array.array(str('d'), [1.0, 2.0, 4.0])
+        out = array.array(str('d'), [0.0]*3)
+        r = foo.my_inverse_func3_vectorized(x, out=out)
+        self.assertTrue(r is out)
+        self.assertEqual(list(out), [1.0, 0.5, 0.25])
+        r = foo.my_inverse_func3_vectorized(memoryview(x)[::2])
+        self.assertEqual(list(r), [1.0, 0.25])
+        self.assertRaises(ValueError, foo.my_inverse_func3_vectorized, x,
+                          out=array.array(str('d'), [0.0]))
+        self.assertRaises(TypeError, foo.my_inverse_func3_vectorized, x,
+                          out=array.array(str('i'), [0]*3))
+        self.assertRaises(foo.exception, foo.my_inverse_func3_vectorized, [1.0, 0.0])
+        self.assertTrue(foo.my_inverse_func3_vectorized.__doc__.startswith(
+                "my_inverse_func3_vectorized(x, out=None)"))
+        self.assertTrue("type: out:" in foo.my_inverse_func3_vectorized.__doc__)
+
+    def test_vectorized_method(self):
+        z = foo.Zbr()
+        r = z.get_int_vectorized(array.array(str('i'), [1, 2, 3]))
+        self.assertEqual(list(r), [1, 2, 3])
+        class MyZbr(foo.Zbr):
+            def get_int(self, x):
+                return x*10
+        z = MyZbr()
+        self.assertEqual(list(z.get_int_vectorized([1, 2])), [10, 20])
+
 
     def test_bug436154(self):
         r = foo.Foo.add_sub(1, 2)
@@ -7,6 +7,7 @@ from pybindgen import module, cppclass, overloading, utils
 
 import unittest
 import doctest
+import os
 import re
 import sys
 
@@ -60,7 +61,431 @@ class ParamLookupTests(unittest.TestCase):
         transformed = typehandlers.Parameter.new('MySmartPointer<testtype>', 'name')
         self.assertTrue(isinstance(transformed, TestParam))
         self.assertTrue(transformed.has_been_transformed)
-        
+
+
+class TypeParserCacheTests(unittest.TestCase):
+
+    def testParseTypeCache(self):
+        ctypeparser.clear_caches()
+        ctype = ctypeparser.parse_type('const foo::bar<const char*, zbr&>*')
+        ctype.remove_modifiers()
+        self.assertEqual(str(ctypeparser.parse_type('const foo::bar<const char*, zbr&>*')),
+                         'foo::bar< char const *, zbr & > const *')
+        self.assertEqual(ctypeparser.get_cache_stats()['parse_type'], (1, 1))
+
+    def testTypeTraitsCache(self):
+        ctypeparser.clear_caches()
+        traits = ctypeparser.TypeTraits('char *')
+        traits.make_const()
+        traits.make_target_const()
+        self.assertEqual(str(traits.ctype), 'char const * const')
+        traits = ctypeparser.TypeTraits('char *')
+        self.assertEqual(str(traits.ctype), 'char *')
+        self.assertEqual(str(traits.ctype_no_const), 'char *')
+        self.assertFalse(traits.type_is_const)
+        self.assertFalse(traits.target_is_const)
+        self.assertEqual(ctypeparser.get_cache_stats()['TypeTraits'], (1, 1))
+
+
+class CodeSinkTests(unittest.TestCase):
+
+    def testNestedFlush(self):
+        import io
+        inner = codesink.MemoryCodeSink()
+        inner.indent()
+        inner.writeln("foo();  \n\nif (x) {\n    bar();\n}")
+        outer = codesink.MemoryCodeSink()
+        outer.indent(2)
+        inner.flush_to(outer)
+        outer.writeln("zbr();")
+        out = codesink.FileCodeSink(io.StringIO())
+        out.indent(1)
+        outer.flush_to(out)
+        self.assertEqual(out.file.getvalue(),
+                         "       foo();\n"
+                         " \n"
+                         "       if (x) {\n"
+                         "           bar();\n"
+                         "       }\n"
+                         "   zbr();\n")
+        self.assertEqual(outer.chunks, [])
+
+
+class TypeMatcherCacheTests(unittest.TestCase):
+
+    def testNegativeLookupInvalidated(self):
+        matcher = typehandlers.TypeMatcher()
+        self.assertRaises(typehandlers.TypeLookupError, matcher.lookup, 'Foo')
+        self.assertRaises(typehandlers.TypeLookupError, matcher.lookup, 'Foo')
+        self.assertEqual(matcher.lookup_cache_hits, 1)
+        matcher.register('Foo', typehandlers.Parameter)
+        handler, transf, traits = matcher.lookup('const Foo')
+        self.assertTrue(handler is typehandlers.Parameter)
+        self.assertEqual(str(traits.ctype), 'Foo const')
+        traits.make_const()
+        handler, transf, traits = matcher.lookup('const Foo')
+        self.assertEqual(str(traits.ctype), 'Foo const')
+
+    def testAliasChain(self):
+        matcher = typehandlers.TypeMatcher()
+        matcher.add_type_alias('int', 'int32_t')
+        matcher.add_type_alias('int32_t', 'my_int')
+        matcher.add_type_alias('your_int', 'my_int')
+        self.assertRaises(typehandlers.TypeLookupError, matcher.lookup, 'your_int')
+        matcher.register('int', typehandlers.Parameter)
+        for name in ['int', 'int32_t', 'my_int', 'your_int']:
+            self.assertTrue(matcher.lookup(name)[0] is typehandlers.Parameter)
+
+    def testAliasOrder(self):
+        matcher = typehandlers.TypeMatcher()
+        matcher.add_type_alias('a', 'b')
+        matcher.add_type_alias('c', 'd')
+        matcher.add_type_alias('e', 'd')
+        matcher.add_type_alias('b', 'e')
+        matcher.register('b', typehandlers.Parameter)
+        matcher.register('c', typehandlers.ReturnValue)
+        ## 'b' was aliased before 'c', so it is tried first
+        self.assertTrue(matcher.lookup('d')[0] is typehandlers.Parameter)
+
+
+class MethodDefFlagsTests(unittest.TestCase):
+
+    def testFlagsGeneratedOnce(self):
+        mod = module.Module('foo')
+        func = mod.add_function('foo', None, [typehandlers.Parameter.new('int', 'x')])
+        generated = []
+        generate_body = func.generate_body
+        func.generate_body = lambda *args: generated.append(1) or generate_body(*args)
+        flags = set(func.get_py_method_def_flags())
+        self.assertEqual(len(generated), 1)
+        self.assertEqual(set(func.get_py_method_def_flags()), flags)
+        func.reset_code_generation_state()
+        self.assertEqual(set(func.get_py_method_def_flags()), flags)
+        self.assertEqual(len(generated), 1)
+        func.force_parse = func.PARSE_TUPLE_AND_KEYWORDS
+        self.assertEqual(set(func.get_py_method_def_flags()),
+                         set(['METH_VARARGS', 'METH_KEYWORDS']))
+        self.assertEqual(len(generated), 1)
+
+
+class _MemorySectionFactory(module.MultiSectionFactory):
+    def __init__(self):
+        self.sinks = {}
+    def get_section_code_sink(self, section_name):
+        return self.sinks.setdefault(section_name, codesink.MemoryCodeSink())
+    def get_main_code_sink(self):
+        return self.get_section_code_sink('__main__')
+    def get_common_header_code_sink(self):
+        return self.get_section_code_sink('header')
+    def get_common_header_include(self):
+        return '"foo.h"'
+
+
+class VectorizeErrorHandlingTests(unittest.TestCase):
+
+    def testNotVectorizableReported(self):
+        from pybindgen import settings
+        errors = []
+        class ErrorHandler(settings.ErrorHandler):
+            def handle_error(self, wrapper, exception, traceback_):
+                errors.append((wrapper, exception))
+                return True
+        old_error_handler = settings.error_handler
+        settings.error_handler = ErrorHandler()
+        try:
+            mod = module.Module('foo')
+            mod.add_function('func', None, [typehandlers.Parameter.new('std::string', 'x')],
+                             vectorize=True)
+            klass = mod.add_class('Klass')
+            klass.add_method('method', None, [typehandlers.Parameter.new('std::string', 'x')],
+                             vectorize=True)
+        finally:
+            settings.error_handler = old_error_handler
+        self.assertEqual(len(errors), 2)
+        for dummy_wrapper, exception in errors:
+            self.assertTrue(isinstance(exception, typehandlers.NotSupportedError))
+        ## the scalar wrappers are kept
+        self.assertEqual(list(mod.functions.keys()), ['func'])
+        self.assertEqual(list(klass.methods.keys()), ['method'])
+
+
+class ParallelGenerationTests(unittest.TestCase):
+
+    def _generate(self, jobs):
+        mod = module.Module('foo')
+        for section, item_type in [('a', 'int'), ('b', 'double'), ('c', 'std::string')]:
+            mod.begin_section(section)
+            base = mod.add_class('Base' + section)
+            base.add_constructor([])
+            base.add_method('get', typehandlers.ReturnValue.new('int'), [])
+            mod.add_class('Derived' + section, parent=base)
+            mod.add_function('func_' + section, None,
+                             [typehandlers.Parameter.new('std::string', 'x')])
+            mod.add_container('std::list<%s>' % item_type, item_type, 'list')
+            mod.end_section(section)
+        mod.add_function('func_main', typehandlers.ReturnValue.new('int'), [])
+        factory = _MemorySectionFactory()
+        mod.generate(factory, jobs=jobs)
+        return dict([(name, sink.flush()) for name, sink in factory.sinks.items()])
+
+    def testSameOutput(self):
+        if not hasattr(os, 'fork'):
+            return
+        ## keep the sink manager, to check that the wrappers were
+        ## really generated by the workers rather than sequentially
+        sink_managers = []
+        original_init = module._ParallelMultiSectionSinkManager.__init__
+        def init(sink_manager, *args):
+            original_init(sink_manager, *args)
+            sink_managers.append(sink_manager)
+        module._ParallelMultiSectionSinkManager.__init__ = init
+        try:
+            parallel_output = self._generate(jobs=3)
+        finally:
+            module._ParallelMultiSectionSinkManager.__init__ = original_init
+        self.assertEqual(parallel_output, self._generate(jobs=1))
+
+        self.assertEqual(len(sink_managers), 1)
+        sink_manager = sink_managers[0]
+        ## every wrapper but func_main, of the main section, comes from a worker
+        self.assertEqual(len(sink_manager.records), sink_manager.wrapper_index - 1)
+        self.assertEqual(sink_manager.sequential_sections, set())
+
+    def testSameOutputFooModule(self):
+        fork_context = module._get_fork_context()
+        if fork_context is None:
+            return
+        from pybindgen import settings
+        import foomodulegen
+        global _foo_module
+        ## the foo module types can only be registered once, so the
+        ## sequential output is generated by a forked copy
+        old_settings = dict(vars(settings))
+        sink_managers = []
+        original_init = module._ParallelMultiSectionSinkManager.__init__
+        def init(sink_manager, *args):
+            original_init(sink_manager, *args)
+            sink_managers.append(sink_manager)
+        try:
+            _foo_module = foomodulegen.build_module()
+            _foo_module.assign_balanced_sections(4)
+            pool = fork_context.Pool(1)
+            try:
+                sequential_output = pool.map(_generate_foo_sections, [1])[0]
+            finally:
+                pool.terminate()
+                pool.join()
+            module._ParallelMultiSectionSinkManager.__init__ = init
+            parallel_output = _generate_foo_sections(4)
+        finally:
+            module._ParallelMultiSectionSinkManager.__init__ = original_init
+            _foo_module = None
+            for name, value in old_settings.items():
+                setattr(settings, name, value)
+        self.assertEqual(sorted(parallel_output.keys()),
+                         ['__main__', 'foo_section1', 'foo_section2', 'foo_section3',
+                          'foo_section4', 'header'])
+        self.assertEqual(parallel_output, sequential_output)
+        self.assertEqual(len(sink_managers), 1)
+        self.assertEqual(sink_managers[0].sequential_sections, set())
+
+
+_foo_module = None
+
+def _generate_foo_sections(jobs):
+    factory = _MemorySectionFactory()
+    _foo_module.generate(factory, jobs=jobs)
+    return dict([(name, sink.flush()) for name, sink in factory.sinks.items()])
+
+
+class IncrementalGenerationTests(unittest.TestCase):
+
+    def _generate(self, directory, method_name):
+        mod = module.Module('foo')
+        for section in ['a', 'b']:
+            mod.begin_section(section)
+            klass = mod.add_class('Klass' + section)
+            klass.add_method(method_name if section == 'b' else 'get',
+                             typehandlers.ReturnValue.new('int'), [])
+            mod.end_section(section)
+        out = module.IncrementalMultiSectionFactory(directory, 'foomodule.cc', 'foomodule.h')
+        mod.generate(out)
+        out.close()
+        return out
+
+    def testUnchangedSectionsNotRewritten(self):
+        import tempfile, shutil
+        directory = tempfile.mkdtemp()
+        try:
+            out = self._generate(directory, 'get')
+            self.assertEqual(sorted(out.written_files),
+                             ['a.cc', 'b.cc', 'foomodule.cc', 'foomodule.h'])
+            out = self._generate(directory, 'get')
+            self.assertEqual(out.written_files, [])
+            out = self._generate(directory, 'get_other')
+            self.assertEqual(out.written_files, ['b.cc'])
+            self.assertEqual(sorted(out.unchanged_files), ['a.cc', 'foomodule.cc', 'foomodule.h'])
+            self.assertTrue('get_other' in open(os.path.join(directory, 'b.cc')).read())
+        finally:
+            shutil.rmtree(directory)
+
+
+class GccXmlParseCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        try:
+            from pygccxml import parser
+            from pygccxml.parser import declarations_cache
+            from pybindgen import gccxmlparser
+        except ImportError:
+            self.cache = None
+            return
+        self.declarations_cache = declarations_cache
+        self.parser = parser
+        self.directory = tempfile.mkdtemp()
+        self.cache = gccxmlparser.GccXmlParseCache(os.path.join(self.directory, 'cache'))
+        self.configuration = parser.gccxml_configuration_t()
+
+    def tearDown(self):
+        import shutil
+        if self.cache is not None:
+            shutil.rmtree(self.directory)
+
+    def _write_header(self, name, contents):
+        file_name = os.path.join(self.directory, name)
+        header = open(file_name, 'w')
+        try:
+            header.write(contents)
+        finally:
+            header.close()
+        return file_name
+
+    def _get_entries(self):
+        return sorted([file_name for file_name in os.listdir(self.cache.directory)
+                       if file_name.endswith('.cache')])
+
+    def testIncludedFileChanged(self):
+        if self.cache is None:
+            return
+        header = self._write_header('a.h', '#include "b.h"\n')
+        included = self._write_header('b.h', 'int f();\n')
+        self.cache.update(header, self.configuration, ['f'], [included])
+        self.assertEqual(self.cache.cached_value(header, self.configuration), ['f'])
+        signature = self.declarations_cache.file_signature(included)
+        self._write_header('b.h', 'int g();\n')
+        self.assertNotEqual(self.declarations_cache.file_signature(included), signature)
+        self.assertEqual(self.cache.cached_value(header, self.configuration), None)
+        self.assertEqual(self._get_entries(), [])
+
+    def testConfigurationChanged(self):
+        if self.cache is None:
+            return
+        header = self._write_header('a.h', 'int f();\n')
+        self.cache.update(header, self.configuration, ['f'], [])
+        configuration = self.parser.gccxml_configuration_t(define_symbols=['FOO'])
+        self.assertNotEqual(self.declarations_cache.configuration_signature(configuration),
+                            self.declarations_cache.configuration_signature(self.configuration))
+        self.assertEqual(self.cache.cached_value(header, configuration), None)
+        self.assertEqual(self.cache.cached_value(header, self.configuration), ['f'])
+
+    def testLeastRecentlyUsedEvicted(self):
+        if self.cache is None:
+            return
+        import time
+        headers = [self._write_header('%s.h' % name, 'int %s();\n' % name) for name in 'abc']
+        paths = [self.cache._get_entry_path(header, self.configuration) for header in headers]
+        start = time.time() - 100
+        for index, header in enumerate(headers[:2]):
+            self.cache.update(header, self.configuration, [header], [])
+            os.utime(paths[index], (start + index, start + index))
+        entry_size = os.path.getsize(paths[0])
+        self.cache.max_size = 2*entry_size + entry_size//2
+        ## a.h becomes the most recently used entry, so b.h is evicted
+        self.assertEqual(self.cache.cached_value(headers[0], self.configuration), [headers[0]])
+        self.cache.update(headers[2], self.configuration, [headers[2]], [])
+        self.assertEqual(self._get_entries(),
+                         sorted([os.path.basename(path) for path in [paths[0], paths[2]]]))
+        self.assertEqual(self.cache.cached_value(headers[1], self.configuration), None)
+
+    def testCorruptedEntryRemoved(self):
+        if self.cache is None:
+            return
+        header = self._write_header('a.h', 'int f();\n')
+        self.cache.update(header, self.configuration, ['f'], [])
+        entry = open(self.cache._get_entry_path(header, self.configuration), 'wb')
+        try:
+            entry.write(b'garbage')
+        finally:
+            entry.close()
+        self.assertEqual(self.cache.cached_value(header, self.configuration), None)
+        self.assertEqual(self._get_entries(), [])
+
+    def testClear(self):
+        if self.cache is None:
+            return
+        for name in 'ab':
+            header = self._write_header('%s.h' % name, 'int %s();\n' % name)
+            self.cache.update(header, self.configuration, [name], [])
+        self._write_header(os.path.join('cache', 'README'), 'not a cache entry\n')
+        self.assertEqual(len(self._get_entries()), 2)
+        self.cache.clear()
+        self.assertEqual(self._get_entries(), [])
+        self.assertEqual(os.listdir(self.cache.directory), ['README'])
+        self.assertEqual(self.cache.cached_value(header, self.configuration), None)
+
+
+class BalancedSectionsTests(unittest.TestCase):
+
+    def testHierarchiesKeptTogether(self):
+        mod = module.Module('foo')
+        for name, num_methods in [('A', 10), ('B', 6), ('C', 3), ('D', 1)]:
+            base = mod.add_class(name)
+            for index in range(num_methods):
+                base.add_method('get%i' % index, typehandlers.ReturnValue.new('int'), [])
+            mod.add_class(name + 'Derived', parent=base)
+        mod.add_function('func', None, [])
+        sections = mod.assign_balanced_sections(2)
+        self.assertEqual(sections, ['foo_section1', 'foo_section2'])
+        self.assertEqual(mod['A'].section, 'foo_section1')
+        self.assertEqual(mod['B'].section, 'foo_section2')
+        self.assertEqual(mod['C'].section, 'foo_section2')
+        for name in ['A', 'B', 'C', 'D']:
+            self.assertEqual(mod[name + 'Derived'].section, mod[name].section)
+        self.assertEqual(mod['D'].section, 'foo_section1')
+        self.assertEqual(mod.functions['func'].section, 'foo_section2')
+
+    def testClassifierHierarchiesKeptTogether(self):
+        try:
+            from pygccxml import declarations
+            from pybindgen import gccxmlparser
+        except ImportError:
+            return
+        global_ns = declarations.namespace_t('::')
+        for name, num_methods in [('A', 10), ('B', 6), ('C', 3), ('D', 1)]:
+            base = declarations.class_t(name)
+            global_ns.adopt_declaration(base)
+            for index in range(num_methods):
+                base.adopt_declaration(declarations.member_function_t(name='get%i' % index),
+                                       declarations.ACCESS_TYPES.PUBLIC)
+            derived = declarations.class_t(name + 'Derived')
+            derived.bases.append(declarations.hierarchy_info_t(base, declarations.ACCESS_TYPES.PUBLIC))
+            global_ns.adopt_declaration(derived)
+        inner = declarations.class_t('Inner')
+        global_ns.decl('A').adopt_declaration(inner, declarations.ACCESS_TYPES.PUBLIC)
+        func = declarations.free_function_t(name='func')
+        global_ns.adopt_declaration(func)
+
+        classifier = gccxmlparser.SizeBalancedPygenClassifier(['section1', 'section2'])
+        self.assertEqual(classifier.classify(global_ns.decl('A')), 'section1')
+        self.assertEqual(classifier.classify(global_ns.decl('B')), 'section2')
+        self.assertEqual(classifier.classify(global_ns.decl('C')), 'section2')
+        self.assertEqual(classifier.classify(global_ns.decl('D')), 'section1')
+        for name in ['A', 'B', 'C', 'D']:
+            self.assertEqual(classifier.classify(global_ns.decl(name + 'Derived')),
+                             classifier.classify(global_ns.decl(name)))
+        self.assertEqual(classifier.classify(inner), 'section1')
+        self.assertEqual(classifier.classify(func), 'section2')
 
 
 if __name__ == '__main__':
@@ -83,6 +508,15 @@ if __name__ == '__main__':
             suite.addTest(doctest.DocTestSuite(mod))
 
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ParamLookupTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TypeParserCacheTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(CodeSinkTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TypeMatcherCacheTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(MethodDefFlagsTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(VectorizeErrorHandlingTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ParallelGenerationTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(IncrementalGenerationTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(GccXmlParseCacheTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(BalancedSectionsTests))
     runner = unittest.TextTestRunner()
     runner.run(suite)
 